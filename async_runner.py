@@ -0,0 +1,79 @@
+# Módulo del bucle asyncio compartido (operaciones de red en segundo plano)
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import ASYNC_MAX_CONCURRENCY
+
+
+class AsyncRunner:
+    """Un único event loop de larga duración en un hilo dedicado.
+
+    La GUI envía corrutinas con `submit` y recibe los resultados en el hilo
+    de Tk mediante `root.after`. Las llamadas bloqueantes de los SDK se
+    ejecutan en el executor por defecto del loop, limitado a
+    ASYNC_MAX_CONCURRENCY hilos, así que la concurrencia queda acotada y los
+    clientes HTTP (y sus conexiones) se comparten entre todas las peticiones.
+    """
+    def __init__(self, max_workers=ASYNC_MAX_CONCURRENCY):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='ia-worker')
+        self.loop.set_default_executor(self.executor)
+        self._thread = threading.Thread(target=self._run, name='asyncio-loop', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro, on_done=None, on_error=None, tk_root=None):
+        """Programa una corrutina en el loop y devuelve su Future.
+
+        Si se indica `tk_root`, los callbacks se ejecutan en el hilo de Tk.
+        `future.cancel()` cancela la corrutina; el resultado de una llamada
+        bloqueante ya en curso se descarta.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+        def deliver(fut):
+            if fut.cancelled():
+                return
+            error = fut.exception()
+            if error is not None:
+                if on_error:
+                    self._dispatch(tk_root, on_error, error)
+                else:
+                    print(f"Error en tarea de fondo: {error}")
+            elif on_done:
+                self._dispatch(tk_root, on_done, fut.result())
+
+        future.add_done_callback(deliver)
+        return future
+
+    def _dispatch(self, tk_root, callback, value):
+        if tk_root is not None:
+            tk_root.after(0, callback, value)
+        else:
+            callback(value)
+
+    async def to_thread(self, func, *args, **kwargs):
+        """Ejecuta una función bloqueante en el pool acotado del loop"""
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def shutdown(self):
+        """Detiene el loop y el pool de hilos"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """Devuelve el AsyncRunner compartido por toda la aplicación"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = AsyncRunner()
+        return _runner
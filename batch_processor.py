@@ -0,0 +1,133 @@
+# Reprocesado por lotes de transcripciones guardadas (tras cambiar la puntuación o el vocabulario)
+#
+# Uso: python batch_processor.py ENTRADA --output resultados.jsonl [--workers 4] [--vocabulary vocabulario.json]
+#      ENTRADA es un .jsonl (un objeto por línea con "text" y opcionalmente "id"),
+#      un .txt o una carpeta con .txt; la salida es JSONL {"id", "text"} en el mismo orden
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from itertools import islice
+from config import BATCH_WORKERS, BATCH_CHUNKSIZE, VOCABULARY_FILE
+from text_processor import TextProcessor
+from vocab_matcher import VocabularyMatcher
+
+# Estado de cada proceso del pool (con fork se hereda del padre sin copiarlo)
+_processor = None
+_matcher = None
+
+
+def _init_worker(vocabulary, engine):
+    """Prepara el procesador del proceso; compila el vocabulario si no se heredó ya compilado"""
+    global _processor, _matcher
+    _processor = TextProcessor(engine)
+    if vocabulary is not None:
+        _matcher = VocabularyMatcher(vocabulary) if vocabulary else None
+
+
+def _process_one(item):
+    doc_id, text = item
+    return doc_id, _processor.process_text(text, _matcher)
+
+
+def iter_transcripts(path, field='text'):
+    """Transcripciones de un .jsonl, un .txt o una carpeta de .txt, sin cargarlas todas.
+    Yields: (id, texto)
+    """
+    if os.path.isdir(path):
+        names = sorted(os.path.relpath(os.path.join(root, name), path)
+                       for root, _, files in os.walk(path) for name in files if name.endswith('.txt'))
+        for name in names:
+            with open(os.path.join(path, name), encoding='utf-8') as f:
+                yield name, f.read()
+    elif path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    yield record.get('id', line_number), record[field]
+                except (ValueError, KeyError) as e:
+                    print(f"Línea {line_number} ignorada ({e})")
+    else:
+        with open(path, encoding='utf-8') as f:
+            yield os.path.basename(path), f.read()
+
+
+def process_many(transcripts, vocabulary=None, workers=BATCH_WORKERS, chunksize=BATCH_CHUNKSIZE, engine=None):
+    """Procesa muchas transcripciones con un pool de procesos, en el orden de entrada.
+
+    El vocabulario se compila una sola vez: con fork (Linux) en el padre
+    antes de crear el pool, y los procesos lo comparten copia-en-escritura;
+    con spawn (Windows, macOS) una vez por proceso al arrancar. La entrada
+    se consume por ventanas, así que un archivo enorme no se carga entero.
+    transcripts: iterable de (id, texto)
+    Yields: (id, texto procesado)
+    """
+    global _processor, _matcher
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(vocabulary or {}, engine)
+        for item in transcripts:
+            yield _process_one(item)
+        return
+
+    if multiprocessing.get_start_method() == 'fork':
+        _init_worker(vocabulary or {}, engine)
+        initargs = (None, engine)
+    else:
+        initargs = (vocabulary or {}, engine)
+    window = workers * chunksize * 4
+    transcripts = iter(transcripts)
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        while True:
+            batch = list(islice(transcripts, window))
+            if not batch:
+                break
+            yield from pool.imap(_process_one, batch, chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reprocesa transcripciones guardadas con el TextProcessor")
+    parser.add_argument('input', help=".jsonl, .txt o carpeta con .txt")
+    parser.add_argument('--output', required=True, help="archivo JSONL de salida")
+    parser.add_argument('--field', default='text', help="campo del texto en la entrada JSONL")
+    parser.add_argument('--vocabulary', default=VOCABULARY_FILE, help="vocabulario JSON ('' = sin vocabulario)")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help="procesos (0 = uno por CPU)")
+    parser.add_argument('--chunksize', type=int, default=BATCH_CHUNKSIZE)
+    parser.add_argument('--engine', choices=('fused', 'legacy'), default=None)
+    args = parser.parse_args(argv)
+
+    vocabulary = {}
+    if args.vocabulary:
+        try:
+            with open(args.vocabulary, encoding='utf-8') as f:
+                vocabulary = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Sin vocabulario ({e})")
+
+    documents = 0
+    input_bytes = 0
+
+    def counted(items):
+        nonlocal documents, input_bytes
+        for doc_id, text in items:
+            documents += 1
+            input_bytes += len(text.encode('utf-8'))
+            yield doc_id, text
+
+    start = time.perf_counter()
+    with open(args.output, 'w', encoding='utf-8') as out:
+        for doc_id, text in process_many(counted(iter_transcripts(args.input, args.field)), vocabulary,
+                                         args.workers, args.chunksize, args.engine):
+            out.write(json.dumps({'id': doc_id, 'text': text}, ensure_ascii=False) + '\n')
+    seconds = time.perf_counter() - start
+    megabytes = input_bytes / (1024 * 1024)
+    print(f"{documents} documentos ({megabytes:.1f} MB) en {seconds:.2f} s: "
+          f"{documents / seconds:.0f} documentos/s, {megabytes / seconds:.2f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# Benchmark y regresión del TextProcessor: corpus de referencia + dictados sintéticos
+#
+# Uso: python bench_text_processor.py [--text-kb 1 100 10240] [--rules 100 100000] [--output resultados.jsonl]
+#      comprueba ambos motores con el corpus de referencia (código de salida 1 si hay diferencias),
+#      mide cada etapa con dictados y vocabularios sintéticos y emite JSON (una línea por
+#      ejecución si se da --output, para seguir la tendencia)
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from bench_vocabulary import WORDS, synthetic_vocabulary
+from config import PUNCTUATION_COMMANDS, TEXT_GOLDEN_CORPUS
+from text_processor import TextProcessor, load_golden_corpus
+from vocab_matcher import VocabularyMatcher
+
+# Medidas dictadas que se mezclan en los dictados sintéticos
+DICTATED_MEASUREMENTS = ['tres coma cinco centímetros', 'doce por ocho milímetros', 'ciento veinte mililitros',
+                         'cuarenta unidades hounsfield', 'quince por ciento', 'dos']
+
+# Etapas de la cadena clásica, en orden (el motor fusionado solo se mide entero)
+LEGACY_STAGES = [
+    ('cleanup_artifacts', lambda p, text, matcher: p.cleanup_artifacts(text)),
+    ('measurements', lambda p, text, matcher: p.normalize_measurements(text)),
+    ('punctuation_commands', lambda p, text, matcher: p.apply_punctuation_rules(text)),
+    ('double_punctuation', lambda p, text, matcher: p.cleanup_double_punctuation(text)),
+    ('erroneous_caps', lambda p, text, matcher: p.fix_erroneous_caps(text)),
+    ('capitalize_sentences', lambda p, text, matcher: p.capitalize_sentences(text)),
+    ('vocabulary', lambda p, text, matcher: p.apply_vocabulary_corrections(text, matcher)),
+    ('parentheses', lambda p, text, matcher: p.normalize_parentheses_spacing(text).strip()),
+]
+
+
+def synthetic_dictation(kilobytes, vocabulary, seed=3):
+    """Dictado en bruto como el que devuelve la transcripción: ~1 comando de
+    puntuación cada 10 palabras, ~5% de palabras con regla de vocabulario,
+    ~1% de medidas dictadas, alguna mayúscula por pausa a mitad de frase, paréntesis y espacios dobles"""
+    rng = random.Random(seed)
+    commands = list(PUNCTUATION_COMMANDS)
+    keys = list(vocabulary)
+    parts = []
+    size = 0
+    while size < kilobytes * 1024:
+        roll = rng.random()
+        if roll < 0.1:
+            part = rng.choice(commands)
+        elif roll < 0.15 and keys:
+            part = rng.choice(keys)
+        elif roll < 0.16:
+            part = f"( {rng.choice(WORDS)} )"
+        elif roll < 0.17:
+            part = rng.choice(DICTATED_MEASUREMENTS)
+        else:
+            part = rng.choice(WORDS)
+            if rng.random() < 0.05:
+                part = part.capitalize()
+        if rng.random() < 0.02:
+            part += ' '
+        parts.append(part)
+        size += len(part) + 1
+    return ' '.join(parts)
+
+
+def _best_of(function, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def check_golden_corpus(path):
+    """Casos del corpus que cada motor no reproduce. Returns: {motor: {'passed', 'total', 'failures'}}"""
+    corpus = load_golden_corpus(path)
+    results = {}
+    for engine in ('legacy', 'fused'):
+        processor = TextProcessor(engine)
+        failures = [case['input'] for case in corpus
+                    if processor.process_text(case['input'], case.get('vocabulary')) != case['expected']]
+        results[engine] = {'passed': len(corpus) - len(failures), 'total': len(corpus), 'failures': failures}
+    return results
+
+
+def bench_case(kilobytes, rules, repeat):
+    """Tiempos de un dictado sintético con un vocabulario sintético"""
+    vocabulary = synthetic_vocabulary(rules)
+    text = synthetic_dictation(kilobytes, vocabulary)
+    text_bytes = len(text.encode('utf-8'))
+    build_seconds, matcher = _best_of(lambda: VocabularyMatcher(vocabulary), 1)
+    repeat = repeat if kilobytes < 1024 else 1
+
+    processor = TextProcessor('legacy')
+    stages = {}
+    staged = text
+    for name, stage in LEGACY_STAGES:
+        seconds, staged = _best_of(lambda: stage(processor, staged, matcher), repeat)
+        stages[name] = round(seconds * 1000, 3)
+    legacy_ms = sum(stages.values())
+
+    fused_processor = TextProcessor('fused')
+    fused_seconds, fused = _best_of(lambda: fused_processor.process_text(text, matcher), repeat)
+    return {
+        'text_bytes': text_bytes,
+        'rules': rules,
+        'vocabulary_build_ms': round(build_seconds * 1000, 2),
+        'legacy': {'stages_ms': stages, 'total_ms': round(legacy_ms, 3),
+                   'mb_per_s': round(text_bytes / 1048576 / (legacy_ms / 1000), 2)},
+        'fused': {'total_ms': round(fused_seconds * 1000, 3),
+                  'mb_per_s': round(text_bytes / 1048576 / fused_seconds, 2)},
+        'identical': staged == fused,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark y regresión del TextProcessor")
+    parser.add_argument('--corpus', default=TEXT_GOLDEN_CORPUS)
+    parser.add_argument('--text-kb', type=float, nargs='+', default=[1, 10, 100, 1024, 10240])
+    parser.add_argument('--rules', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3, help="repeticiones (se toma la mejor) hasta 1 MB")
+    parser.add_argument('--output', help="añade el resultado como una línea JSON a este archivo")
+    args = parser.parse_args(argv)
+
+    golden = check_golden_corpus(args.corpus)
+    runs = []
+    for rules in args.rules:
+        for kilobytes in args.text_kb:
+            runs.append(bench_case(kilobytes, rules, args.repeat))
+            print(f"{kilobytes:g} KB, {rules} reglas: clásico {runs[-1]['legacy']['total_ms']:.1f} ms, "
+                  f"fusionado {runs[-1]['fused']['total_ms']:.1f} ms", file=sys.stderr)
+
+    result = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+              'golden': golden, 'runs': runs}
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    regressions = any(g['failures'] for g in golden.values()) or not all(run['identical'] for run in runs)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# Benchmark de las correcciones de vocabulario: regex por regla vs autómata
+#
+# Uso: python bench_vocabulary.py [--sizes 100 10000 100000] [--text-kb 4]
+#      compara ambas implementaciones y comprueba que dan el mismo texto
+import argparse
+import json
+import random
+import re
+import time
+from config import VOCABULARY_FILE
+from vocab_matcher import VocabularyMatcher
+
+WORDS = ("hígado bazo páncreas riñones vesícula biliar adenopatías parénquima homogéneo bordes lisos "
+         "lesiones focales líquido libre aorta calibre normal quiste cortical simple derecho izquierdo "
+         "sin alteraciones significativas tamaño morfología densidad contraste fase portal").split()
+
+
+def legacy_corrections(text, vocabulary):
+    """Implementación anterior: una regex \\b…\\b IGNORECASE por regla, de la más larga a la más corta"""
+    processed = text
+    for error_key in sorted(vocabulary.keys(), key=len, reverse=True):
+        regex = re.compile(r'\b' + re.escape(error_key) + r'\b', re.IGNORECASE)
+        processed = regex.sub(vocabulary[error_key], processed)
+    return processed
+
+
+def synthetic_vocabulary(size, seed=1):
+    """Reglas sintéticas de 1 a 3 palabras con claves inventadas (sin cadenas entre reglas)"""
+    rng = random.Random(seed)
+    vocabulary = {}
+    while len(vocabulary) < size:
+        key = ' '.join(''.join(rng.choice('abcdefghijlmnopqrstuvzáéíóñ') for _ in range(rng.randint(4, 10)))
+                       for _ in range(rng.randint(1, 3)))
+        vocabulary[key] = key.upper()
+    return vocabulary
+
+
+def synthetic_text(vocabulary, kilobytes, seed=2):
+    """Texto de dictado con ~1 de cada 20 palabras sustituida por una clave del vocabulario"""
+    rng = random.Random(seed)
+    keys = list(vocabulary)
+    words = []
+    size = 0
+    while size < kilobytes * 1024:
+        word = rng.choice(keys) if keys and rng.random() < 0.05 else rng.choice(WORDS)
+        words.append(word.capitalize() if rng.random() < 0.1 else word)
+        size += len(word) + 1
+    return ' '.join(words)
+
+
+def _time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench(vocabulary, text, repeat, legacy=True):
+    # Modo exacto (sin plegar tildes) para comparar byte a byte con la regex por regla
+    build_seconds, matcher = _time(lambda: VocabularyMatcher(vocabulary, strip_accents=False), 1)
+    new_seconds, new_result = _time(lambda: matcher.apply(text), repeat)
+    row = {'rules': len(vocabulary), 'text_bytes': len(text.encode('utf-8')),
+           'build_ms': round(build_seconds * 1000, 2), 'automaton_ms': round(new_seconds * 1000, 3)}
+    if legacy:
+        old_seconds, old_result = _time(lambda: legacy_corrections(text, vocabulary), 1 if len(vocabulary) > 1000 else repeat)
+        row.update({'regex_ms': round(old_seconds * 1000, 3), 'speedup': round(old_seconds / new_seconds, 1),
+                    'identical': old_result == new_result})
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de correcciones de vocabulario")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000])
+    parser.add_argument('--text-kb', type=float, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip-legacy-above', type=int, default=10000,
+                        help="no medir la implementación con regex por encima de estas reglas (muy lenta)")
+    args = parser.parse_args(argv)
+
+    results = []
+    try:
+        with open(VOCABULARY_FILE, encoding='utf-8') as f:
+            real_vocabulary = json.load(f)
+        results.append(dict(bench(real_vocabulary, synthetic_text(real_vocabulary, args.text_kb), args.repeat),
+                            vocabulary=VOCABULARY_FILE))
+    except (OSError, ValueError) as e:
+        print(f"Sin vocabulario real ({e}), solo sintético")
+
+    for size in args.sizes:
+        vocabulary = synthetic_vocabulary(size)
+        results.append(dict(bench(vocabulary, synthetic_text(vocabulary, args.text_kb), args.repeat,
+                                  legacy=size <= args.skip_legacy_above), vocabulary='sintético'))
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
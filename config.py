@@ -15,6 +15,24 @@ GEMINI_API_KEYS = [k for k in [GEMINI_API_KEY_1, GEMINI_API_KEY_2, GEMINI_API_KE
 
 GROQ_API_KEY = os.getenv('GROQ_API_KEY', '')
 
+# Servidor simulado de proveedores (fake_provider_server.py) para pruebas de
+# carga y de fallos: si se define, Gemini y Groq apuntan a esa URL y se usan
+# claves ficticias cuando no hay reales
+FAKE_PROVIDER_URL = os.getenv('FAKE_PROVIDER_URL', '').rstrip('/')
+if FAKE_PROVIDER_URL:
+    GEMINI_API_KEYS = GEMINI_API_KEYS or ['fake-gemini-key']
+    GROQ_API_KEY = GROQ_API_KEY or 'fake-groq-key'
+
+# Máximo de llamadas a proveedores de IA en vuelo a la vez (loop asyncio compartido)
+ASYNC_MAX_CONCURRENCY = 4
+
+# Pool HTTP compartido por los clientes de Gemini y Groq
+HTTP_MAX_KEEPALIVE = 10  # conexiones keep-alive por cliente
+HTTP_KEEPALIVE_EXPIRY = 120  # segundos que una conexión ociosa sigue abierta
+# Precalentamiento de conexiones durante el dictado
+WARMUP_MAX_IDLE = 45  # no precalentar si hubo tráfico hace menos de esto (s)
+WARMUP_INTERVAL = 50  # refresco de la conexión mientras se sigue grabando (s)
+
 # Configuración de audio
 AUDIO_SAMPLE_RATE = 16000
 AUDIO_CHANNELS = 1
@@ -30,6 +48,34 @@ GEMINI_MODELS = [
     'gemini-2.0-flash-lite'
 ]
 
+# Límite de audio enviado inline a Gemini; por encima se usa la Files API
+# (la petición completa de generate_content no puede superar 20MB)
+GEMINI_INLINE_MAX_BYTES = 18 * 1024 * 1024
+
+# A partir de este tamaño el audio se sube una vez por la Files API y se
+# reutiliza en reintentos, rotación de claves y fallback de modelos
+GEMINI_UPLOAD_THRESHOLD_BYTES = 512 * 1024
+# Margen de seguridad (segundos) antes de la caducidad de un archivo subido
+GEMINI_FILE_TTL_MARGIN = 10 * 60
+
+# Context caching de Gemini para los prompts estáticos (transcripción, Juanizador)
+PROMPT_CACHE_ENABLED = True
+PROMPT_CACHE_TTL = 60 * 60  # segundos de vida de cada caché (se renueva con el uso)
+PROMPT_CACHE_REFRESH_MARGIN = 5 * 60  # renovar el TTL si quedan menos de estos segundos
+PROMPT_CACHE_RETRY_AFTER = 60 * 60  # tras un fallo al crearla, enviar el prompt en línea este tiempo
+# Gemini solo crea cachés explícitas a partir de un mínimo de tokens por modelo;
+# por debajo ni se intenta (sería una ida y vuelta fallida en cada petición).
+# Con los prompts actuales (transcripción ~1,3k caracteres, corrección ~0,8k,
+# categorías e informes del Juanizador ~1-1,5k, unos 200-400 tokens) ninguno
+# llega al mínimo: la caché queda inactiva y se envían en línea. Se activa sola
+# si algún prompt crece por encima del umbral.
+PROMPT_CACHE_MIN_TOKENS = {
+    'gemini-2.5-flash': 1024,
+    'gemini-2.5-pro': 2048,
+}
+PROMPT_CACHE_MIN_TOKENS_DEFAULT = 4096  # modelos 2.0 y no listados
+PROMPT_CACHE_CHARS_PER_TOKEN = 4  # estimación del tamaño sin llamar a count_tokens
+
 # Modelos Groq (Whisper)
 GROQ_MODELS = [
     'whisper-large-v3',
@@ -38,9 +84,123 @@ GROQ_MODELS = [
     'whisper-small'
 ]
 
+# Transcripción local en CPU (faster-whisper / CTranslate2, opcional).
+# Desactivada por defecto: al activarla, el arranque descarga (la primera vez,
+# cientos de MB) y carga el modelo aunque solo se usen los proveedores en la nube
+LOCAL_WHISPER_ENABLED = os.getenv('LOCAL_WHISPER_ENABLED', '0') == '1'
+LOCAL_WHISPER_MODEL = os.getenv('LOCAL_WHISPER_MODEL', 'small')  # tiny, base, small, medium, large-v3...
+LOCAL_WHISPER_COMPUTE_TYPE = 'int8'
+LOCAL_WHISPER_THREADS = int(os.getenv('LOCAL_WHISPER_THREADS', '0'))  # 0 = automático
+# En modo 'Auto', los audios de hasta esta duración (s) se transcriben
+# localmente; los más largos van a la nube (0 = desactivado). Con Gemini o
+# Groq elegidos a mano, el Whisper local solo es el último recurso
+LOCAL_ROUTING_MAX_SECONDS = 20
+
+# Enrutado adaptativo ('Auto'): EWMA de latencia, éxito y coste por proveedor
+ROUTING_EWMA_ALPHA = 0.3
+ROUTING_MIN_SAMPLES = 2  # por debajo se usa la latencia a priori
+ROUTING_STALE_AFTER = 30 * 60  # estadísticas más antiguas (s) vuelven a la latencia a priori
+ROUTING_FAILURE_PENALTY = 30  # segundos equivalentes de un fallo (reintento con otro proveedor)
+ROUTING_COST_WEIGHT = 1000  # segundos de espera equivalentes a 1 USD
+# Latencia a priori (s) por tramo de duración del audio (corto <=30s, medio <=120s, largo)
+ROUTING_LATENCY_PRIORS = {
+    'Groq': {'corto': 2.5, 'medio': 4.0, 'largo': 8.0},
+    'Gemini': {'corto': 4.0, 'medio': 7.0, 'largo': 15.0},
+    'Local': {'corto': 2.5, 'medio': 15.0, 'largo': 60.0},
+}
+# Coste aproximado en USD por segundo de audio (por modelo, o por proveedor)
+ROUTING_COST_PER_AUDIO_SECOND = {
+    'Groq': 0.111 / 3600,  # whisper-large-v3
+    'Gemini': 32 * 1.00 / 1e6,  # gemini-2.5-flash: 32 tokens de audio por segundo
+    'gemini-2.0-flash': 32 * 0.70 / 1e6,
+    'gemini-2.0-flash-lite': 32 * 0.075 / 1e6,
+    'Local': 0.0,
+}
+
+# Plazos de las llamadas a la IA (segundos): plazo total por dictado y
+# timeout de cada intento, ambos crecen con la duración del audio
+TRANSCRIPTION_DEADLINE_BASE = 60
+TRANSCRIPTION_DEADLINE_PER_AUDIO_SECOND = 1.0
+TRANSCRIPTION_DEADLINE_MAX = 15 * 60
+ATTEMPT_TIMEOUT_BASE = 20
+ATTEMPT_TIMEOUT_PER_AUDIO_SECOND = 0.5
+ATTEMPT_TIMEOUT_MIN = 5  # nunca por encima de lo que le queda al plazo
+ATTEMPT_MIN_REMAINING = 2  # con menos plazo restante no se lanza otro intento
+TEXT_REQUEST_DEADLINE = 90  # pulido de texto y Juanizador
+
+# Pasarela de LLM de texto (Juanizador, corrección con IA)
+LLM_TEXT_MODELS = GEMINI_MODELS  # fallback de modelos en cada clave
+LLM_GROQ_TEXT_MODEL = 'llama-3.3-70b-versatile'  # último recurso si Gemini falla
+LLM_MAX_CONCURRENCY = 2  # peticiones de texto simultáneas
+LLM_KEY_COOLDOWN = 60  # segundos que se evita una clave tras un 429
+LLM_RESPONSE_CACHE_MAX_ENTRIES = 100
+LLM_RESPONSE_CACHE_TTL = 60 * 60  # segundos
+
+# Trazas por etapa del dictado (resumen: python tracing.py)
+TRACE_ENABLED = True
+TRACE_FILE = 'trazas_dictado.jsonl'
+TRACE_MAX_BYTES = 5 * 1024 * 1024
+TRACE_BACKUP_COUNT = 3
+
+# Mostrar la transcripción en el informe a medida que llega (streaming)
+TRANSCRIPTION_STREAMING = True
+
+# Comandos de puntuación dictados -> texto que los sustituye. Se pueden
+# añadir otros, p. ej. 'punto y coma': ';', 'abrir paréntesis': '(',
+# 'cerrar paréntesis': ')'. Se compilan en una sola regex al cambiar
+PUNCTUATION_COMMANDS = {
+    'punto y aparte': '.\n',
+    'punto y seguido': '.',
+    'coma': ',',
+    'punto': '.',
+    'nuevalinea': '\n',
+    'nueva linea': '\n',
+    'dos puntos': ':',
+    'dospuntos': ':',
+}
+
+# Motor de procesado de texto: 'fused' (pocas pasadas) o 'legacy' (una regex por etapa)
+TEXT_ENGINE = 'fused'
+# Convertir medidas dictadas con palabras a cifras ("tres coma cinco centímetros" -> "3,5 cm")
+TEXT_NORMALIZE_MEASUREMENTS = True
+# Casos de referencia (entrada y salida esperada) para comprobar los motores
+TEXT_GOLDEN_CORPUS = 'corpus_referencia_texto.jsonl'
+
+# Reprocesado por lotes de transcripciones guardadas (python batch_processor.py)
+BATCH_WORKERS = 0  # procesos; 0 = uno por CPU
+BATCH_CHUNKSIZE = 32  # documentos por envío a cada proceso
+
+# Vocabulario: una regla sin tildes ("higado") cubre también "hígado", "HÍGADO"...
+VOCABULARY_ACCENT_INSENSITIVE = True
+
+# Corrector ortográfico local, antes de (o en lugar de) la corrección con IA
+SPELLCHECK_LEXICON_FILE = 'lexico_radiologia.txt'
+SPELLCHECK_MAX_DISTANCE = 2  # ediciones como máximo, sin contar tildes
+SPELLCHECK_LONG_WORD_LENGTH = 10  # hasta esta longitud solo se admite 1 edición
+SPELLCHECK_PREFIX_LENGTH = 7  # caracteres de cada palabra que entran en el índice
+SPELLCHECK_MIN_WORD_LENGTH = 4  # las palabras desconocidas más cortas no se corrigen
+
+# Sugerencia de reglas de vocabulario tras cada dictado (palabras cercanas a una corrección conocida)
+RULE_SUGGEST_MIN_LENGTH = 5  # letras mínimas de una palabra para proponer una regla
+RULE_SUGGEST_MAX_DISTANCE = 2  # ediciones como máximo, sin contar tildes
+RULE_SUGGEST_LONG_WORD_LENGTH = 8  # hasta esta longitud solo se admite 1 edición
+
 # Archivos de datos
 VOCABULARY_FILE = 'vocabulario.json'
 
+# Caché persistente de transcripciones (hash del audio + proveedor + modelo + prompt)
+TRANSCRIPTION_CACHE_FILE = 'transcripciones_cache.sqlite3'
+TRANSCRIPTION_CACHE_MAX_ENTRIES = 500
+TRANSCRIPTION_CACHE_TTL = 7 * 24 * 3600  # segundos
+
+# Cola persistente de dictados pendientes (cuando falla la conexión)
+TRANSCRIPTION_SPOOL_DIR = 'cola_dictados'
+TRANSCRIPTION_QUEUE_WORKERS = 1
+TRANSCRIPTION_QUEUE_MAX_ATTEMPTS = 10
+TRANSCRIPTION_QUEUE_BACKOFF_BASE = 15  # segundos tras el primer fallo
+TRANSCRIPTION_QUEUE_BACKOFF_MAX = 15 * 60
+TRANSCRIPTION_QUEUE_FAILED_RETENTION = 7 * 24 * 3600  # los trabajos fallidos se purgan al arrancar pasado este tiempo
+
 # Técnicas predefinidas
 TECNICAS = {
     'Abd Art+Portal': 'Se realiza exploración abdominal tras la administración endovenosa de contraste con adquisición de imágenes en fase arterial y portal.',
@@ -0,0 +1,71 @@
+# Módulo de plazos y cancelación cooperativa de las llamadas a la IA
+import threading
+import time
+from config import (TRANSCRIPTION_DEADLINE_BASE, TRANSCRIPTION_DEADLINE_PER_AUDIO_SECOND,
+                    TRANSCRIPTION_DEADLINE_MAX, ATTEMPT_TIMEOUT_BASE, ATTEMPT_TIMEOUT_PER_AUDIO_SECOND,
+                    ATTEMPT_TIMEOUT_MIN, ATTEMPT_MIN_REMAINING)
+
+
+class OperationCancelled(Exception):
+    """Se lanza en los puntos de control cuando el plazo vence o se cancela"""
+
+
+class Deadline:
+    """Plazo máximo de una operación y token de cancelación.
+
+    Se pasa hacia abajo por toda la cadena de llamadas: cada intento contra
+    un proveedor recibe un timeout que no supera el tiempo restante, y
+    entre intentos (claves, modelos, proveedores, trozos de streaming) se
+    comprueba si el usuario ha pulsado "Cancelar". Una petición HTTP ya en
+    curso no se puede interrumpir desde otro hilo, pero su timeout la acota.
+    """
+    def __init__(self, seconds=None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def for_audio(cls, duration):
+        """Plazo total proporcional a la duración del audio (segundos)"""
+        return cls(min(TRANSCRIPTION_DEADLINE_MAX,
+                       TRANSCRIPTION_DEADLINE_BASE + TRANSCRIPTION_DEADLINE_PER_AUDIO_SECOND * (duration or 0)))
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def remaining(self):
+        """Segundos restantes, o None si no hay plazo"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        """True si se canceló o se agotó el plazo"""
+        return self.cancelled or self.remaining() == 0.0
+
+    def reason(self):
+        return "Cancelado por el usuario" if self.cancelled else "Tiempo de espera agotado"
+
+    def check(self):
+        """Punto de control: lanza OperationCancelled si hay que parar"""
+        if self.expired():
+            raise OperationCancelled(self.reason())
+
+    def attempt_timeout(self, duration=0, base=ATTEMPT_TIMEOUT_BASE):
+        """Timeout (s) de un intento: proporcional al audio y acotado por el plazo.
+
+        Nunca supera el tiempo restante; si queda menos de
+        ATTEMPT_MIN_REMAINING no merece la pena otro intento y lanza
+        OperationCancelled.
+        """
+        self.check()
+        timeout = max(ATTEMPT_TIMEOUT_MIN, base + ATTEMPT_TIMEOUT_PER_AUDIO_SECOND * (duration or 0))
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining < ATTEMPT_MIN_REMAINING:
+            raise OperationCancelled(self.reason())
+        return min(timeout, remaining)
@@ -0,0 +1,377 @@
+# Servidor local que imita las APIs de Groq y Gemini (pruebas de carga y fallos)
+#
+# Uso:
+#   python fake_provider_server.py serve --port 8900 --error-429 0.1
+#       y arrancar la app con FAKE_PROVIDER_URL=http://127.0.0.1:8900
+#   python fake_provider_server.py bench --requests 200 --concurrency 8
+#       levanta el servidor y mide el pipeline completo de transcripción
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TRANSCRIPTS = [
+    "hígado de tamaño normal y bordes lisos coma sin lesiones focales punto y aparte",
+    "vesícula biliar normodistendida de paredes finas punto y seguido vía biliar no dilatada punto y aparte",
+    "bazo glándulas suprarrenales y riñones sin alteraciones punto y aparte",
+    "no se observa líquido libre ni adenopatías intraabdominales punto y aparte",
+]
+
+
+class FakeProviderConfig:
+    """Comportamiento del servidor simulado.
+
+    La latencia sigue una distribución log-normal (mediana y sigma en
+    segundos) para reproducir colas largas; las tasas de error inyectan
+    respuestas 429 y 5xx con la probabilidad indicada.
+    """
+    def __init__(self, latency_median=0.8, latency_sigma=0.5, latency_per_mb=0.3,
+                 error_429=0.0, error_5xx=0.0, transcripts=None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.latency_per_mb = latency_per_mb
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.transcripts = transcripts or DEFAULT_TRANSCRIPTS
+        self.counters = {}
+        self.cached_contents = set()  # nombres de cachés de contexto vigentes
+        self._lock = threading.Lock()
+
+    def sample_latency(self, body_bytes=0):
+        base = self.latency_median * math.exp(random.gauss(0, self.latency_sigma)) if self.latency_median else 0
+        return base + self.latency_per_mb * body_bytes / (1024 * 1024)
+
+    def pick_fault(self):
+        """Devuelve 429, un 5xx o None según las tasas configuradas"""
+        r = random.random()
+        if r < self.error_429:
+            return 429
+        if r < self.error_429 + self.error_5xx:
+            return random.choice([500, 502, 503])
+        return None
+
+    def count(self, key):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como los proveedores reales
+    config = None  # FakeProviderConfig, asignado por make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---------- utilidades ----------
+    def _read_body(self):
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip() or b'0', 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return body
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_sse(self, text, words_per_chunk=4):
+        """Respuesta en streaming (alt=sse) troceada como la de Gemini"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        words = text.split(' ')
+        for i in range(0, len(words), words_per_chunk):
+            piece = ' '.join(words[i:i + words_per_chunk]) + (' ' if i + words_per_chunk < len(words) else '')
+            event = f"data: {json.dumps(self._gemini_response(piece), ensure_ascii=False)}\r\n\r\n"
+            data = event.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.config.latency_median / 10)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_error(self, status):
+        statuses = {429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 502: 'UNAVAILABLE', 503: 'UNAVAILABLE'}
+        self.config.count(f'error_{status}')
+        self._send_json(status, {'error': {'code': status, 'message': f'Fake error {status} (quota/rate limit)'
+                                           if status == 429 else f'Fake error {status}',
+                                           'status': statuses.get(status, 'UNKNOWN')}},
+                        headers={'Retry-After': '1'} if status == 429 else None)
+
+    def _simulate(self, body):
+        """Aplica latencia y fallos. Returns: True si ya se respondió con error"""
+        time.sleep(self.config.sample_latency(len(body)))
+        fault = self.config.pick_fault()
+        if fault:
+            self._send_error(fault)
+            return True
+        return False
+
+    def _transcript(self):
+        return random.choice(self.config.transcripts)
+
+    # ---------- rutas ----------
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        self.config.count(f'GET {re.sub(r"/[^/]+$", "/*", path)}')
+        if path.endswith('/openai/v1/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'whisper-large-v3', 'object': 'model'}]})
+        elif re.match(r'^/v1beta/models/[^/:]+$', path):
+            self._send_json(200, {'name': path.split('/v1beta/')[1], 'displayName': 'Fake Gemini'})
+        elif re.match(r'^/v1beta/files/[^/]+$', path):
+            self._send_json(200, self._file_resource(path.split('/v1beta/')[1]))
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'not found', 'status': 'NOT_FOUND'}})
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        body = self._read_body()
+        if path.endswith('/openai/v1/audio/transcriptions'):
+            self.config.count('groq_transcription')
+            if not self._simulate(body):
+                self._send_json(200, {'text': self._transcript()})
+        elif path.endswith('/openai/v1/chat/completions'):
+            self.config.count('groq_chat')
+            if not self._simulate(body):
+                self._send_json(200, {'id': 'fake', 'object': 'chat.completion', 'choices': [
+                    {'index': 0, 'finish_reason': 'stop',
+                     'message': {'role': 'assistant', 'content': self._echo_prompt(body)}}]})
+        elif re.match(r'^/v1beta/models/[^/]+:generateContent$', path):
+            self.config.count('gemini_generate')
+            if not self._unknown_cache(body) and not self._simulate(body):
+                self._send_json(200, self._gemini_response(self._gemini_text(body)))
+        elif re.match(r'^/v1beta/models/[^/]+:streamGenerateContent$', path):
+            self.config.count('gemini_stream')
+            if not self._unknown_cache(body) and not self._simulate(body):
+                self._send_sse(self._gemini_text(body))
+        elif path == '/upload/v1beta/files':
+            self._handle_upload('upload_id=' in self.path)
+        elif path == '/v1beta/cachedContents':
+            self.config.count('gemini_cache_create')
+            request = json.loads(body or b'{}')
+            name = f'cachedContents/{uuid.uuid4().hex[:12]}'
+            self.config.cached_contents.add(name)
+            self._send_json(200, self._cache_resource(name, request.get('model'), request.get('ttl')))
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'not found', 'status': 'NOT_FOUND'}})
+
+    def do_PATCH(self):
+        path = self.path.split('?')[0]
+        body = self._read_body()
+        if re.match(r'^/v1beta/cachedContents/[^/]+$', path) and path[len('/v1beta/'):] in self.config.cached_contents:
+            self.config.count('gemini_cache_update')
+            request = json.loads(body or b'{}')
+            self._send_json(200, self._cache_resource(path.split('/v1beta/')[1], None, request.get('ttl')))
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'not found', 'status': 'NOT_FOUND'}})
+
+    def _gemini_text(self, body):
+        """Transcripción simulada si la petición lleva audio; si no, eco del texto"""
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            return self._transcript()
+        parts = [p for c in request.get('contents', []) for p in c.get('parts', [])]
+        if any('inlineData' in p or 'fileData' in p for p in parts):
+            return self._transcript()
+        return ' '.join(p.get('text', '') for p in parts)[-2000:]
+
+    def _echo_prompt(self, body):
+        try:
+            request = json.loads(body or b'{}')
+            return request['messages'][-1]['content'][-2000:]
+        except (ValueError, KeyError, IndexError):
+            return self._transcript()
+
+    def _gemini_response(self, text):
+        return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]},
+                                'finishReason': 'STOP', 'index': 0}],
+                'usageMetadata': {'promptTokenCount': 100, 'candidatesTokenCount': len(text.split())}}
+
+    def _file_resource(self, name):
+        return {'name': name, 'uri': f'http://{self.headers.get("Host")}/v1beta/{name}',
+                'mimeType': 'audio/webm', 'state': 'ACTIVE',
+                'expirationTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + 48 * 3600))}
+
+    def _unknown_cache(self, body):
+        """Responde 404 si la petición referencia una caché de contexto inexistente"""
+        try:
+            name = json.loads(body or b'{}').get('cachedContent')
+        except ValueError:
+            return False
+        if name and name not in self.config.cached_contents:
+            self.config.count('gemini_cache_miss')
+            self._send_json(404, {'error': {'code': 404, 'message': f'CachedContent not found: {name}',
+                                            'status': 'NOT_FOUND'}})
+            return True
+        return False
+
+    def _cache_resource(self, name, model, ttl):
+        seconds = float((ttl or '3600s').rstrip('s'))
+        return {'name': name, 'model': model,
+                'expireTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + seconds))}
+
+    def _handle_upload(self, has_upload_id):
+        """Protocolo de subida reanudable de la Files API (start / upload, finalize)"""
+        command = self.headers.get('X-Goog-Upload-Command', '')
+        if not has_upload_id:
+            self.config.count('gemini_upload_start')
+            upload_id = uuid.uuid4().hex
+            self._send_json(200, {}, headers={
+                'X-Goog-Upload-URL': f'http://{self.headers.get("Host")}/upload/v1beta/files?upload_id={upload_id}',
+                'X-Goog-Upload-Status': 'active'})
+        elif 'finalize' in command:
+            self.config.count('gemini_upload_finalize')
+            self._send_json(200, {'file': self._file_resource(f'files/{uuid.uuid4().hex[:12]}')},
+                            headers={'X-Goog-Upload-Status': 'final'})
+        else:
+            self.config.count('gemini_upload_chunk')
+            self._send_json(200, {}, headers={'X-Goog-Upload-Status': 'active'})
+
+
+def make_server(config, host='127.0.0.1', port=0):
+    """Crea el servidor (port=0 elige un puerto libre). Returns: (server, base_url)"""
+    handler = type('ConfiguredFakeProviderHandler', (FakeProviderHandler,), {'config': config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+_test_config = None
+
+
+def start_test_server():
+    """Servidor simulado compartido por todas las pruebas del proceso.
+
+    Se arranca una sola vez (sin latencia ni errores) y exporta
+    FAKE_PROVIDER_URL, así que hay que llamarlo antes de importar config o
+    transcription. Returns: FakeProviderConfig (las pruebas pueden ajustarla)
+    """
+    global _test_config
+    if _test_config is None:
+        config = FakeProviderConfig(latency_median=0, latency_sigma=0, latency_per_mb=0)
+        server, base_url = make_server(config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ['FAKE_PROVIDER_URL'] = base_url
+        _test_config = config
+    return _test_config
+
+
+def make_test_wav(seconds):
+    """WAV de silencio con la duración indicada (16 kHz, mono); el llamador lo borra"""
+    path = tempfile.NamedTemporaryFile(delete=False, suffix='.wav').name
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(b'\x00\x00' * int(16000 * seconds))
+    return path
+
+
+def run_benchmark(args, config):
+    """Lanza N transcripciones concurrentes contra el servidor simulado"""
+    server, base_url = make_server(config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # El cambio de URL debe hacerse antes de importar los clientes
+    os.environ['FAKE_PROVIDER_URL'] = base_url
+    from concurrent.futures import ThreadPoolExecutor
+    from transcription import TranscriptionService
+    from tracing import new_trace, percentile
+
+    service = TranscriptionService(cache=False)
+    audio_file = make_test_wav(args.audio_seconds)
+    latencies, errors = [], 0
+
+    def one_request(_):
+        trace = new_trace(source='bench')
+        start = time.perf_counter()
+        text, _, error = service.transcribe_audio(audio_file, provider=args.provider,
+                                                  on_partial=(lambda partial: None) if args.stream else None)
+        trace.finish('total')
+        return time.perf_counter() - start, error
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for elapsed, error in pool.map(one_request, range(args.requests)):
+            latencies.append(elapsed)
+            errors += 1 if error else 0
+    wall = time.perf_counter() - wall_start
+    server.shutdown()
+    os.remove(audio_file)
+
+    result = {
+        'requests': args.requests, 'concurrency': args.concurrency, 'provider': args.provider,
+        'errors': errors, 'wall_seconds': round(wall, 3),
+        'throughput_rps': round(args.requests / wall, 2) if wall else None,
+        'latency_p50': round(percentile(latencies, 50), 3),
+        'latency_p95': round(percentile(latencies, 95), 3),
+        'latency_p99': round(percentile(latencies, 99), 3),
+        'server_counters': config.counters,
+        'connections': service.registry.stats.summary(),
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor simulado de Groq/Gemini")
+    parser.add_argument('mode', choices=['serve', 'bench'])
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-median', type=float, default=0.8, help="segundos")
+    parser.add_argument('--latency-sigma', type=float, default=0.5)
+    parser.add_argument('--latency-per-mb', type=float, default=0.3, help="segundos extra por MB recibido")
+    parser.add_argument('--error-429', type=float, default=0.0, help="probabilidad de responder 429")
+    parser.add_argument('--error-5xx', type=float, default=0.0, help="probabilidad de responder 5xx")
+    parser.add_argument('--transcripts', help="archivo de texto con una transcripción por línea")
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--audio-seconds', type=float, default=20)
+    parser.add_argument('--provider', default='Gemini')
+    parser.add_argument('--stream', action='store_true', help="pedir la transcripción en streaming")
+    args = parser.parse_args(argv)
+
+    transcripts = None
+    if args.transcripts:
+        with open(args.transcripts, encoding='utf-8') as f:
+            transcripts = [line.strip() for line in f if line.strip()]
+    config = FakeProviderConfig(args.latency_median, args.latency_sigma, args.latency_per_mb,
+                                args.error_429, args.error_5xx, transcripts)
+
+    if args.mode == 'bench':
+        run_benchmark(args, config)
+        return
+
+    server, base_url = make_server(config, port=args.port)
+    print(f"Servidor simulado escuchando en {base_url} (Ctrl+C para salir)")
+    print(f"Arranca la app con FAKE_PROVIDER_URL={base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(config.counters, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
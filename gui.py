@@ -13,13 +13,22 @@ from tkinter import ttk, scrolledtext, messagebox, filedialog
 import threading
 import os
 import platform
+import uuid
 
+from async_runner import get_runner
 from audio_recorder import AudioRecorder
 from transcription import TranscriptionService
-from text_processor import TextProcessor
+from provider_router import estimate_duration
+from deadline import Deadline
+from tracing import Trace, new_trace, span
+from transcription_queue import TranscriptionQueue, is_retryable_error
+from text_processor import TextProcessor, StreamingTextProcessor
 from vocabulary import VocabularyManager
+from spell_checker import get_spell_checker
+from rule_suggester import suggest_rules
 from juanizador import JuanizadorService
-from config import TECNICAS, MAX_RECORDING_TIME, RECORDING_WARNING_TIME
+from config import (TECNICAS, MAX_RECORDING_TIME, RECORDING_WARNING_TIME, WARMUP_INTERVAL,
+                    TRANSCRIPTION_STREAMING)
 
 # Colores del tema oscuro de la web
 COLORS = {
@@ -87,17 +96,25 @@ class DictadoRadiologicoApp:
         self.setup_theme()
         
         # Servicios
+        self.runner = get_runner()
         self.recorder = AudioRecorder()
         self.transcription = TranscriptionService()
+        self.transcription.local.preload()  # Solo con LOCAL_WHISPER_ENABLED: listo antes del primer dictado
         self.text_processor = TextProcessor()
         self.vocabulary = VocabularyManager()
-        self.juanizador = JuanizadorService()
+        self.juanizador = JuanizadorService(self.transcription)
+        self.transcription_queue = TranscriptionQueue(self.transcription)
         
         # Estado
         self.current_audio_file = None
         self.compressed_audio_file = None  # Archivo comprimido (OGG)
         self.is_processing = False
-        self.provider_var = tk.StringVar(value='Gemini')
+        self.processing_task = None  # Future de la transcripción en curso
+        self.processing_deadline = None  # Deadline (plazo y cancelación) de esa transcripción
+        self.processing_trace = None  # Traza de tiempos por etapa del dictado en curso
+        self.report_id = uuid.uuid4().hex  # Identifica el informe para la cola diferida
+        self.rule_suggestions = {}  # incorrecto -> regla de vocabulario sugerida tras los dictados
+        self.provider_var = tk.StringVar(value='Auto')  # 'Auto' = enrutado adaptativo
         self.last_toggle_time = 0 # Para evitar dobles pulsaciones rápidas
         
         # Configurar callbacks del recorder
@@ -135,6 +152,12 @@ class DictadoRadiologicoApp:
         self.setup_ui()
         self.check_services()
         
+        # Cola de dictados pendientes (sobrevive a reinicios)
+        self.transcription_queue.on_complete = lambda job, text: self.root.after(0, self._deliver_queued, job, text)
+        self.transcription_queue.on_failed = lambda job, error: self.root.after(
+            0, lambda: self.set_status(f"✗ Dictado en cola descartado: {error}", COLORS['error']))
+        self.transcription_queue.start()
+        
         # Conectar callback de volumen DESPUÉS de crear la UI
         if hasattr(self.recorder, 'on_audio_level'):
             self.recorder.on_audio_level = self._on_audio_level
@@ -305,6 +328,13 @@ class DictadoRadiologicoApp:
                                      font_size=13, width=16)
         self.retry_btn.pack(side=tk.LEFT, padx=5)
         
+        self.cancel_btn = StyledButton(buttons_frame, "✖ Cancelar",
+                                      self.cancel_processing,
+                                      COLORS['btn_stop'],
+                                      hover_color=COLORS['btn_stop_hover'],
+                                      font_size=13, width=11, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+        
         separator1 = tk.Frame(buttons_frame, bg=COLORS['border'], width=2)
         separator1.pack(side=tk.LEFT, fill=tk.Y, padx=10)
         
@@ -379,7 +409,7 @@ class DictadoRadiologicoApp:
         
         self.provider_combo = ttk.Combobox(ai_sel_frame, 
                                           textvariable=self.provider_var,
-                                          values=['Gemini', 'Groq'],
+                                          values=['Auto', 'Gemini', 'Groq', 'Local'],
                                           state='readonly', width=10, 
                                           font=('Segoe UI', 10, 'bold'),
                                           style='TCombobox')
@@ -641,6 +671,8 @@ class DictadoRadiologicoApp:
                 services.append("Groq")
             if self.transcription.is_gemini_available():
                 services.append("Gemini")
+            if self.transcription.is_local_available():
+                services.append("Whisper local")
             
             if services:
                 self.set_status(f"✓ Listo (usará: {', '.join(services)})", COLORS['success'])
@@ -683,9 +715,18 @@ class DictadoRadiologicoApp:
             # LED amarillo indicando que está activo pero sin audio aún
             if hasattr(self, 'mic_led'):
                 self._draw_led('#ffff00')
+            # Precalentar conexiones mientras se dicta
+            self._warm_up_connections()
         else:
             messagebox.showerror("Error", msg)
     
+    def _warm_up_connections(self):
+        """Precalienta las conexiones a la IA y las mantiene vivas mientras se graba"""
+        if not self.recorder.is_recording:
+            return
+        self.runner.submit(self.runner.to_thread(self.transcription.registry.warm_up))
+        self.root.after(WARMUP_INTERVAL * 1000, self._warm_up_connections)
+    
     def stop_recording(self):
         """Detiene la grabación"""
         self.record_btn.config(text="▶ Empezar Dictado", state=tk.DISABLED)
@@ -695,27 +736,31 @@ class DictadoRadiologicoApp:
         if hasattr(self, 'mic_led'):
             self._draw_led('gray')
         
-        thread = threading.Thread(target=self._stop_recording_thread)
-        thread.start()
+        self.runner.submit(self._stop_recording_async())
     
-    def _stop_recording_thread(self):
-        """Thread para detener grabación y procesar"""
-        audio_file, msg = self.recorder.stop_recording()
+    async def _stop_recording_async(self):
+        """Detiene la grabación en el loop de fondo y procesa el resultado"""
+        trace = new_trace(source='dictado')
+        with span('wav_finalize') as finalize:
+            audio_file, msg = await self.runner.to_thread(self.recorder.stop_recording)
+            finalize.ok = bool(audio_file)
+            if audio_file:
+                finalize.tag(bytes=os.path.getsize(audio_file))
         
         if audio_file:
             self.current_audio_file = audio_file
-            self.root.after(0, self._on_recording_stopped, audio_file)
+            self.root.after(0, self._on_recording_stopped, audio_file, trace)
         else:
             self.root.after(0, self._on_recording_error, msg)
     
-    def _on_recording_stopped(self, audio_file):
+    def _on_recording_stopped(self, audio_file, trace=None):
         """Callback cuando la grabación se detuvo correctamente"""
         self.audio_info_label.config(text=f"Audio: {os.path.basename(audio_file)}",
                                     fg=COLORS['text_primary'])
         self.download_audio_btn.config(state=tk.NORMAL)
         self.retry_btn.config(state=tk.NORMAL)
         self.record_btn.config(state=tk.NORMAL, bg=COLORS['btn_record'])
-        self.process_audio(audio_file)
+        self.process_audio(audio_file, trace)
     
     def _on_recording_error(self, msg):
         """Callback cuando hay error en grabación"""
@@ -923,7 +968,7 @@ class DictadoRadiologicoApp:
 
     
     # ==================== PROCESAMIENTO DE AUDIO ====================
-    def process_audio(self, audio_file):
+    def process_audio(self, audio_file, trace=None):
         """Procesa el archivo de audio"""
         if not self.transcription.is_available():
             messagebox.showerror("Error", "Servicio de transcripción no disponible.")
@@ -933,26 +978,75 @@ class DictadoRadiologicoApp:
         
         self.is_processing = True
         self.set_status("Transcribiendo audio...", COLORS['processing'])
-        
-        thread = threading.Thread(target=self._process_audio_thread, args=(audio_file,))
-        thread.start()
+        self.cancel_btn.config(state=tk.NORMAL)
+        
+        duration = estimate_duration(audio_file)
+        deadline = Deadline.for_audio(duration)
+        self.processing_deadline = deadline
+        self.processing_trace = trace or Trace(source='archivo')
+        self.processing_trace.tags.update(audio_s=round(duration, 1), provider_choice=self.provider_var.get())
+        self.processing_task = self.runner.submit(
+            self._process_audio_async(audio_file, deadline, self.processing_trace))
+    
+    def cancel_processing(self):
+        """Cancela la transcripción en curso y deja la interfaz lista para dictar"""
+        if not self.is_processing:
+            return
+        if self.processing_deadline:
+            self.processing_deadline.cancel()
+        if self.processing_task:
+            self.processing_task.cancel()
+        self._discard_partial_text()
+        self.set_status("Transcripción cancelada", COLORS['idle'])
+        self.record_btn.config(state=tk.NORMAL)
+        self.retry_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.is_processing = False
     
-    def _process_audio_thread(self, audio_file):
-        """Thread de procesamiento"""
+    async def _process_audio_async(self, audio_file, deadline, trace):
+        """Transcripción y pulido del texto en el loop de fondo"""
+        trace.activate()  # Las etapas de transcripción se asocian a este dictado
         try:
             print(f"Procesando archivo: {audio_file}")
             
-            text, compressed_file, error = self.transcription.transcribe_audio(
-                audio_file,
-                provider=self.provider_var.get(),
-                on_status=lambda s: self.root.after(0, lambda: self.set_status(s, COLORS['processing']))
-            )
+            # En streaming el texto provisional se va mostrando en el informe
+            on_partial = None
+            if TRANSCRIPTION_STREAMING:
+                stream = StreamingTextProcessor(self.text_processor, self.vocabulary.get_vocabulary())
+                
+                def on_partial(raw):
+                    trace.mark('first_text')
+                    self.root.after(0, self._show_partial_text, stream.update(raw), deadline)
+            
+            with span('transcription') as transcription_span:
+                text, compressed_file, error = await self.transcription.transcribe_audio_async(
+                    audio_file,
+                    provider=self.provider_var.get(),
+                    on_status=lambda s: self.root.after(0, lambda: self.set_status(s, COLORS['processing'])),
+                    on_partial=on_partial,
+                    deadline=deadline
+                )
+                transcription_span.ok = not error
             
             print(f"Transcripción completada. Error: {error}")
             print(f"Archivo comprimido: {compressed_file}")
             
+            if deadline.cancelled:
+                return
+            
+            if error and not is_retryable_error(error):
+                self.root.after(0, self._on_processing_error, error, deadline)
+                return
             if error:
-                self.root.after(0, self._on_processing_error, error)
+                # Error de red o del proveedor: el dictado se guarda en la cola persistente
+                # para reintentarlo en segundo plano
+                try:
+                    self.transcription_queue.enqueue(audio_file, self.provider_var.get(),
+                                                     {'report_id': self.report_id})
+                    self.root.after(0, self._on_processing_queued, error)
+                except Exception as e:
+                    print(f"No se pudo encolar el dictado: {e}")
+                    self.root.after(0, self._on_processing_error, error, deadline)
                 return
             
             # Guardar referencia del archivo comprimido
@@ -971,26 +1065,118 @@ class DictadoRadiologicoApp:
                 ))
             
             self.root.after(0, lambda: self.set_status("Puliendo texto...", COLORS['processing']))
-            processed_text = self.text_processor.process_text(text, self.vocabulary.get_vocabulary())
+            with span('process_text', chars=len(text)):
+                processed_text = await self.runner.to_thread(
+                    self.text_processor.process_text, text, self.vocabulary.get_vocabulary())
+            
+            suggestions = []
+            try:
+                with span('suggest_rules', chars=len(processed_text)):
+                    suggestions = await self.runner.to_thread(
+                        suggest_rules, processed_text, self.vocabulary.get_vocabulary())
+            except Exception as e:
+                print(f"No se pudieron sugerir reglas de vocabulario: {e}")
             
-            self.root.after(0, self._on_processing_complete, processed_text)
+            self.root.after(0, self._on_processing_complete, processed_text, suggestions, deadline)
             
         except Exception as e:
-            self.root.after(0, self._on_processing_error, str(e))
+            self.root.after(0, self._on_processing_error, str(e), deadline)
     
-    def _on_processing_complete(self, text):
+    def _show_partial_text(self, text, deadline=None):
+        """Muestra el texto provisional del streaming entre las marcas stream_start/stream_end"""
+        if self._is_stale(deadline):
+            return  # Trozo rezagado de una transcripción cancelada
+        if 'stream_start' not in self.informe_text.mark_names():
+            try:
+                # Con selección, lo provisional se muestra tras ella (se reemplaza al final)
+                position = self.informe_text.index(tk.SEL_LAST)
+            except tk.TclError:
+                position = self.informe_text.index(tk.INSERT)
+            self.informe_text.mark_set('stream_start', position)
+            self.informe_text.mark_gravity('stream_start', tk.LEFT)
+            self.informe_text.mark_set('stream_end', position)
+            self.informe_text.mark_gravity('stream_end', tk.RIGHT)
+            self.informe_text.tag_configure('streaming', foreground=COLORS['text_secondary'])
+        
+        self.informe_text.delete('stream_start', 'stream_end')
+        self.informe_text.insert('stream_start', text, ('streaming',))
+        self.informe_text.see('stream_end')
+    
+    def _discard_partial_text(self):
+        """Quita el texto provisional. Returns: True si había streaming en curso"""
+        if 'stream_start' not in self.informe_text.mark_names():
+            return False
+        self.informe_text.delete('stream_start', 'stream_end')
+        self.informe_text.mark_set(tk.INSERT, 'stream_start')
+        self.informe_text.mark_unset('stream_start', 'stream_end')
+        return True
+    
+    def _is_stale(self, deadline):
+        """True si el resultado es de una transcripción cancelada o ya sustituida por otra"""
+        return deadline is not None and (deadline.cancelled or deadline is not self.processing_deadline)
+    
+    def _on_processing_complete(self, text, suggestions=None, deadline=None):
         """Callback cuando el procesamiento completa"""
-        self.insert_text_at_cursor(text)
-        self.set_status("✓ Texto insertado con éxito", COLORS['success'])
+        if self._is_stale(deadline):
+            return  # Ya encolado con after() cuando el usuario canceló: no tocar el informe
+        # El texto definitivo sustituye al provisional con las reglas de inserción de siempre
+        with span('insert_text', trace=self.processing_trace, chars=len(text)):
+            self._discard_partial_text()
+            self.insert_text_at_cursor(text)
+        if self.processing_trace:
+            self.processing_trace.finish('total')
+        for suggestion in suggestions or []:
+            previous = self.rule_suggestions.get(suggestion['incorrect'])
+            if previous:
+                previous['count'] += suggestion['count']
+            else:
+                self.rule_suggestions[suggestion['incorrect']] = suggestion
+        if self.rule_suggestions:
+            self.set_status(f"✓ Texto insertado con éxito · {len(self.rule_suggestions)} reglas sugeridas "
+                            f"en Vocabulario", COLORS['success'])
+        else:
+            self.set_status("✓ Texto insertado con éxito", COLORS['success'])
+        self.record_btn.config(state=tk.NORMAL)
+        self.retry_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.is_processing = False
+    
+    def _on_processing_queued(self, error):
+        """Callback cuando la transcripción falla y el dictado queda en cola"""
+        self._discard_partial_text()
+        pending = self.transcription_queue.pending_count()
+        self.set_status(f"⏳ Sin respuesta de la IA: dictado en cola ({pending} pendientes)", COLORS['error'])
+        print(f"Dictado encolado tras error: {error}")
         self.record_btn.config(state=tk.NORMAL)
         self.retry_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
         self.is_processing = False
     
-    def _on_processing_error(self, error):
+    def _deliver_queued(self, job, text):
+        """Entrega una transcripción diferida a su informe"""
+        processed_text = self.text_processor.process_text(text, self.vocabulary.get_vocabulary())
+        if job['metadata'].get('report_id') == self.report_id:
+            # Al final del informe, sin tocar la selección ni el cursor del usuario
+            cursor = self.informe_text.index(tk.INSERT)
+            end = self.informe_text.index('end - 1 chars')
+            left = self.informe_text.get(f"{end} - 2 chars", end)
+            self.informe_text.insert(end, self.text_processor.join_segment(left, processed_text))
+            self.informe_text.mark_set(tk.INSERT, cursor)
+            self.set_status("✓ Dictado en cola transcrito e insertado", COLORS['success'])
+        else:
+            # El informe original ya no está abierto: mostrar el texto para copiarlo
+            messagebox.showinfo("Dictado pendiente de un informe anterior", processed_text)
+        self.transcription_queue.mark_delivered(job['id'])
+    
+    def _on_processing_error(self, error, deadline=None):
         """Callback cuando hay error en procesamiento"""
+        if self._is_stale(deadline):
+            return
+        self._discard_partial_text()
         self.set_status(f"✗ Error: {error}", COLORS['error'])
         self.record_btn.config(state=tk.NORMAL)
         self.retry_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
         self.is_processing = False
         messagebox.showerror("Error de procesamiento", str(error))
     
@@ -1002,107 +1188,23 @@ class DictadoRadiologicoApp:
             messagebox.showwarning("Advertencia", "No hay audio previo para reenviar")
     
     def insert_text_at_cursor(self, text):
-        """Inserta texto en la posición del cursor"""
-        if text:
-            try:
-                # Text is selected, replace it
-                sel_start = self.informe_text.index(tk.SEL_FIRST)
-                sel_end = self.informe_text.index(tk.SEL_LAST)
-                
-                # Check characters around selection for context
-                try:
-                    prev_char_idx = self.informe_text.index(f"{sel_start} - 1 chars")
-                    prev_char = self.informe_text.get(prev_char_idx, sel_start)
-                except tk.TclError:
-                    prev_char = ""
-                    
-                next_char = self.informe_text.get(sel_end, f"{sel_end} + 1 chars")
-
-                # Delete selected text
-                self.informe_text.delete(sel_start, sel_end)
-                
-                # Apply rules based on selection context
-                if sel_start != '1.0':
-                    # 1. Capitalization
-                    if prev_char in ['.', '!', '?', '\n']:
-                        text = text[0].upper() + text[1:] if text else text
-                    elif prev_char.isspace():
-                        try:
-                            prev_prev_char_idx = self.informe_text.index(f"{prev_char_idx} - 1 chars")
-                            prev_prev_char = self.informe_text.get(prev_prev_char_idx, prev_char_idx)
-                            if prev_prev_char in ['.', '!', '?', '\n']:
-                                text = text[0].upper() + text[1:] if text else text
-                            else:
-                                text = text[0].lower() + text[1:] if text else text
-                        except tk.TclError:
-                            text = text[0].upper() + text[1:] if text else text
-                    else:
-                        text = text[0].lower() + text[1:] if text else text
-
-                    # 2. Space before
-                    if prev_char and not prev_char.isspace() and prev_char not in ['\n', '(']:
-                        if text[0] not in [',', '.', ':', ';', '!', '?']:
-                            text = ' ' + text
-                    
-                    # 3. Space after
-                    if next_char and not next_char.isspace() and next_char not in [',', '.', ':', ';', '!', '?', ')', '\n']:
-                        text = text + ' '
-                else:
-                    text = text[0].upper() + text[1:] if text else text
-                    if next_char and not next_char.isspace() and next_char not in [',', '.', ':', ';', '!', '?', ')', '\n']:
-                        text = text + ' '
-
-                self.informe_text.insert(sel_start, text)
-                
-            except tk.TclError:
-                cursor_pos = self.informe_text.index(tk.INSERT)
-                current_text = self.informe_text.get('1.0', tk.END)
-                
-                if current_text.strip() and cursor_pos != '1.0':
-                    prev_char_idx = self.informe_text.index(f"{cursor_pos} - 1 chars")
-                    prev_char = self.informe_text.get(prev_char_idx, cursor_pos)
-                    
-                    next_char = self.informe_text.get(cursor_pos, f"{cursor_pos} + 1 chars")
-                    
-                    # 1. Capitalization based on previous context
-                    if prev_char in ['.', '!', '?', '\n']:
-                        text = text[0].upper() + text[1:] if text else text
-                    elif prev_char.isspace():
-                        # If the character before the space is punctuation, capitalize
-                        try:
-                            prev_prev_char_idx = self.informe_text.index(f"{prev_char_idx} - 1 chars")
-                            prev_prev_char = self.informe_text.get(prev_prev_char_idx, prev_char_idx)
-                            if prev_prev_char in ['.', '!', '?', '\n']:
-                                text = text[0].upper() + text[1:] if text else text
-                            else:
-                                text = text[0].lower() + text[1:] if text else text
-                        except tk.TclError:
-                            # Start of text
-                            text = text[0].upper() + text[1:] if text else text
-                    else:
-                        text = text[0].lower() + text[1:] if text else text
-
-                    # 2. Add space before if needed
-                    # No space if previous char is already a space, a newline, or opening punctuation (like '(')
-                    if prev_char and not prev_char.isspace() and prev_char not in ['\n', '(']:
-                        # Especial handling for punctuation dictation
-                        if text[0] in [',', '.', ':', ';', '!', '?']:
-                            pass # Don't add space before punctuation
-                        else:
-                            text = ' ' + text
-                    
-                    # 3. Add space after if needed
-                    # Add space if the next char is a letter or number (not a space, not punctuation)
-                    if next_char and not next_char.isspace() and next_char not in [',', '.', ':', ';', '!', '?', ')', '\n']:
-                        text = text + ' '
-                elif cursor_pos == '1.0':
-                     text = text[0].upper() + text[1:] if text else text
-                     
-                     next_char = self.informe_text.get(cursor_pos, f"{cursor_pos} + 1 chars")
-                     if next_char and not next_char.isspace() and next_char not in [',', '.', ':', ';', '!', '?', ')', '\n']:
-                        text = text + ' '
-
-                self.informe_text.insert(cursor_pos, text)
+        """Inserta texto en la posición del cursor (o en lugar de la selección),
+        con mayúscula y espacios ajustados a lo que lo rodea"""
+        if not text:
+            return
+        try:
+            # Hay texto seleccionado: se reemplaza
+            start = self.informe_text.index(tk.SEL_FIRST)
+            end = self.informe_text.index(tk.SEL_LAST)
+        except tk.TclError:
+            start = end = self.informe_text.index(tk.INSERT)
+        
+        # Basta una ventana mínima de contexto a cada lado (ver join_segment)
+        left = self.informe_text.get(f"{start} - 2 chars", start)
+        right = self.informe_text.get(end, f"{end} + 1 chars")
+        if start != end:
+            self.informe_text.delete(start, end)
+        self.informe_text.insert(start, self.text_processor.join_segment(left, text, right))
     
     # ==================== FRASES CÉLEBRES ====================
     def _start_quotes_rotation(self):
@@ -1258,6 +1360,7 @@ class DictadoRadiologicoApp:
         if messagebox.askyesno("Confirmar", "¿Seguro que quieres borrar TODO el informe y la técnica?"):
             self.tecnica_text.delete('1.0', tk.END)
             self.informe_text.delete('1.0', tk.END)
+            self.report_id = uuid.uuid4().hex
             self.set_status("Informe reseteado", COLORS['idle'])
     
     def upload_audio(self):
@@ -1369,7 +1472,8 @@ class DictadoRadiologicoApp:
         
         # Abrir ventana con texto seleccionado (si lo hay)
         VocabularyWindow(self.root, self.vocabulary, self.text_processor, 
-                        selected_text, self._apply_vocabulary_to_text)
+                        selected_text, self._apply_vocabulary_to_text,
+                        suggestions=self.rule_suggestions)
     
     def _apply_vocabulary_to_text(self, incorrect, correct):
         """Aplica una corrección de vocabulario a todo el texto actual"""
@@ -1668,9 +1772,9 @@ class JuanizadorWindow:
             self.rm_type_combo.get().lower().replace(' ', '-') if self.tech_combo.get() == 'RM' else None
         )
         
-        def do_categorize():
-            result, error = self.juanizador.categorize_findings(
-                transcript, available_cats
+        async def do_categorize():
+            result, error = await self.main_app.runner.to_thread(
+                self.juanizador.categorize_findings, transcript, available_cats
             )
             
             if error:
@@ -1679,8 +1783,7 @@ class JuanizadorWindow:
                 self.categorized_findings = result
                 self.window.after(0, self.display_categories)
         
-        thread = threading.Thread(target=do_categorize)
-        thread.start()
+        self.main_app.runner.submit(do_categorize())
     
     def display_categories(self):
         """Muestra las categorías"""
@@ -1710,8 +1813,9 @@ class JuanizadorWindow:
         if self.var_tardia.get():
             phases.append('tardia')
         
-        def do_generate():
-            result, error = self.juanizador.generate_report(
+        async def do_generate():
+            result, error = await self.main_app.runner.to_thread(
+                self.juanizador.generate_report,
                 self.tech_combo.get().lower(),
                 self.tac_scope_combo.get().lower().replace(' ', '') if self.tech_combo.get() == 'TAC' else None,
                 self.rm_type_combo.get().lower().replace(' ', '-') if self.tech_combo.get() == 'RM' else None,
@@ -1729,8 +1833,7 @@ class JuanizadorWindow:
             else:
                 self.window.after(0, lambda: self.display_report(result))
         
-        thread = threading.Thread(target=do_generate)
-        thread.start()
+        self.main_app.runner.submit(do_generate())
     
     def display_report(self, report):
         """Muestra el informe generado"""
@@ -1777,7 +1880,7 @@ class JuanizadorWindow:
 class VocabularyWindow:
     """Ventana de gestión de vocabulario estilizada"""
     def __init__(self, parent, vocabulary_manager, text_processor, 
-                 prefill_text="", apply_callback=None):
+                 prefill_text="", apply_callback=None, suggestions=None):
         self.window = tk.Toplevel(parent)
         self.window.title("Gestionar Vocabulario Personalizado")
         self.window.geometry("800x600")
@@ -1787,6 +1890,7 @@ class VocabularyWindow:
         self.processor = text_processor
         self.prefill_text = prefill_text  # Texto pre-seleccionado
         self.apply_callback = apply_callback  # Callback para aplicar corrección
+        self.suggestions = suggestions if suggestions is not None else {}  # Reglas sugeridas tras los dictados
         
         self.setup_ui()
         self.load_vocabulary()
@@ -1859,6 +1963,11 @@ class VocabularyWindow:
                     self.delete_rule, COLORS['btn_stop'],
                     font_size=11, width=18).pack(side=tk.LEFT, padx=5)
         
+        if self.suggestions:
+            StyledButton(btn_frame, f"Sugerencias ({len(self.suggestions)})",
+                        self.show_suggestions, COLORS['btn_success'],
+                        font_size=11, width=16).pack(side=tk.LEFT, padx=5)
+        
         StyledButton(btn_frame, "Importar",
                     self.import_vocab, COLORS['btn_reset'],
                     font_size=11, width=12).pack(side=tk.LEFT, padx=5)
@@ -1966,6 +2075,76 @@ class VocabularyWindow:
         else:
             incorrect_entry.focus()
     
+    def show_suggestions(self):
+        """Reglas sugeridas tras los dictados: añadir en bloque o descartar"""
+        dialog = tk.Toplevel(self.window)
+        dialog.title("Reglas sugeridas")
+        dialog.geometry("700x450")
+        dialog.configure(bg=COLORS['bg_primary'])
+        dialog.transient(self.window)
+        dialog.grab_set()
+        
+        frame = tk.Frame(dialog, bg=COLORS['bg_primary'], padx=20, pady=15)
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        tk.Label(frame, text="Palabras dictadas muy parecidas a una corrección del vocabulario:",
+                bg=COLORS['bg_primary'], fg=COLORS['text_secondary'],
+                font=('Segoe UI', 10, 'italic')).pack(anchor='w', pady=(0, 10))
+        
+        tree = ttk.Treeview(frame, columns=('incorrecto', 'correcto', 'veces'), show='headings',
+                           style="Custom.Treeview", selectmode='extended')
+        tree.heading('incorrecto', text='Texto Incorrecto')
+        tree.heading('correcto', text='Texto Correcto')
+        tree.heading('veces', text='Veces')
+        tree.column('incorrecto', width=280)
+        tree.column('correcto', width=280)
+        tree.column('veces', width=60, anchor='center')
+        tree.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        
+        keys = {}  # fila del treeview -> clave de la sugerencia
+        
+        def refresh():
+            for item in tree.get_children():
+                tree.delete(item)
+            keys.clear()
+            for key, suggestion in self.suggestions.items():
+                item = tree.insert('', tk.END, values=(suggestion['incorrect'], suggestion['correct'],
+                                                       suggestion['count']))
+                keys[item] = key
+        
+        def accept(keys):
+            rules = [(self.suggestions[key]['incorrect'], self.suggestions[key]['correct']) for key in keys]
+            added = self.vocab.add_rules(rules)
+            for key, (incorrect, correct) in zip(keys, rules):
+                del self.suggestions[key]
+                if self.apply_callback:
+                    self.apply_callback(incorrect, correct)
+            self.load_vocabulary()
+            refresh()
+            messagebox.showinfo("Guardado", f"{added} reglas añadidas", parent=dialog)
+        
+        def discard():
+            for item in tree.selection():
+                del self.suggestions[keys[item]]
+            refresh()
+        
+        btn_frame = tk.Frame(frame, bg=COLORS['bg_primary'])
+        btn_frame.pack(fill=tk.X)
+        
+        StyledButton(btn_frame, "Añadir seleccionadas", lambda: accept([keys[item] for item in tree.selection()]),
+                    COLORS['btn_success'], font_size=11, width=18).pack(side=tk.LEFT, padx=5)
+        
+        StyledButton(btn_frame, "Añadir todas", lambda: accept(list(self.suggestions)),
+                    COLORS['btn_success'], font_size=11, width=12).pack(side=tk.LEFT, padx=5)
+        
+        StyledButton(btn_frame, "Descartar", discard, COLORS['btn_stop'],
+                    font_size=11, width=12).pack(side=tk.LEFT, padx=5)
+        
+        StyledButton(btn_frame, "Cerrar", lambda: dialog.destroy(), '#444c56',
+                    hover_color='#5d6774', font_size=11, width=12).pack(side=tk.RIGHT, padx=5)
+        
+        refresh()
+    
     def delete_rule(self):
         """Elimina la regla seleccionada"""
         selected = self.tree.selection()
@@ -2002,7 +2181,33 @@ class VocabularyWindow:
 
 
 class AICorrectionWindow:
-    """Modal de corrección IA - clonado de la web"""
+    """Modal de corrección IA - clonado de la web.
+    
+    Primero propone correcciones locales (ortografía y siglas, corrector
+    SymSpell) sin aceptarlas: el léxico es pequeño y una palabra correcta
+    puede quedar a una edición de otra ("polo" -> "poco"), así que el
+    usuario elige cuáles aplicar. La IA solo se llama si el usuario pide
+    la revisión de gramática."""
+    AI_INSTRUCTION = """Corrige SOLO errores de ortografía, gramática y capitalización en el texto médico que te envíe el usuario.
+
+REGLAS CRÍTICAS:
+1. MANTÉN EXACTAMENTE todos los saltos de línea (\\n) del texto original
+2. NO añadas ni elimines líneas
+3. NO cambies el formato ni la estructura
+4. Solo corrige:
+   - Palabras mal escritas
+   - Errores gramaticales
+   - CAPITALIZACIÓN incorrecta (nombres propios, inicio de oraciones, siglas médicas como TAC, RM, BI-RADS, etc.)
+
+REGLAS DE CAPITALIZACIÓN:
+- Primera letra de cada oración en mayúscula
+- Nombres propios y apellidos
+- Siglas médicas en mayúsculas (TAC, RM, TC, RMN, BI-RADS, TI-RADS, etc.)
+- Nombres de enfermedades eponímicas (Enfermedad de Crohn, Alzheimer, Parkinson)
+- NO cambiar capitalización de abreviaturas médicas comunes
+
+Devuelve solo el texto corregido (manteniendo saltos de línea exactos)."""
+    
     def __init__(self, parent, text, transcription_service, main_app):
         self.window = tk.Toplevel(parent)
         self.window.title("Revisar Cambios")
@@ -2066,6 +2271,13 @@ class AICorrectionWindow:
                                   padx=30, pady=10)
         self.apply_btn.pack(side=tk.RIGHT, padx=(10, 0))
         
+        self.ai_btn = tk.Button(footer, text="Revisar gramática con IA", 
+                               command=self._process_ai, bg='#7c3aed', 
+                               fg='white', font=('Segoe UI', 12, 'bold'), 
+                               relief=tk.RAISED, cursor='hand2', 
+                               padx=20, pady=10, state=tk.DISABLED)
+        self.ai_btn.pack(side=tk.RIGHT, padx=(10, 0))
+        
         # Body - ENTRE header y footer
         body = tk.Frame(self.window, bg='#0d1117', padx=20, pady=15)
         body.pack(fill=tk.BOTH, expand=True)
@@ -2122,73 +2334,59 @@ class AICorrectionWindow:
         self.preview.config(state=tk.DISABLED)
     
     def _process(self):
-        """Procesa con IA"""
-        self.diff.insert(tk.END, "Procesando con IA...", 'processing')
-        self.window.update()
-        
-        prompt = f"""Corrige SOLO errores de ortografía, gramática y capitalización en el siguiente texto médico.
-
-REGLAS CRÍTICAS:
-1. MANTÉN EXACTAMENTE todos los saltos de línea (\\n) del texto original
-2. NO añadas ni elimines líneas
-3. NO cambies el formato ni la estructura
-4. Solo corrige:
-   - Palabras mal escritas
-   - Errores gramaticales
-   - CAPITALIZACIÓN incorrecta (nombres propios, inicio de oraciones, siglas médicas como TAC, RM, BI-RADS, etc.)
-
-REGLAS DE CAPITALIZACIÓN:
-- Primera letra de cada oración en mayúscula
-- Nombres propios y apellidos
-- Siglas médicas en mayúsculas (TAC, RM, TC, RMN, BI-RADS, TI-RADS, etc.)
-- Nombres de enfermedades eponímicas (Enfermedad de Crohn, Alzheimer, Parkinson)
-- NO cambiar capitalización de abreviaturas médicas comunes
-
-Texto original:
-{self.original_text}
-
-Texto corregido (manteniendo saltos de línea exactos):"""
-        
-        try:
-            corrected = self._call_ai(prompt)
-            self._compute_diff(self.original_text, corrected)
-            self._render()
-        except Exception as e:
-            self.diff.config(state=tk.NORMAL)
-            self.diff.delete('1.0', tk.END)
-            self.diff.insert(tk.END, f"Error: {str(e)}", 'error')
-            self.diff.config(state=tk.DISABLED)
-    
-    def _call_ai(self, prompt):
-        """Llama a la IA"""
-        if self.transcription.is_groq_available():
+        """Corrección local: ortografía y siglas, sin llamar a la IA"""
+        start = time.perf_counter()
+        checker = get_spell_checker(self.main_app.vocabulary.get_vocabulary())
+        corrected, changes = checker.correct_text(self.original_text)
+        print(f"Corrector local: {len(changes)} sugerencias en {(time.perf_counter() - start) * 1000:.1f} ms")
+        self._compute_diff(self.original_text, corrected, accepted=False)
+        self._render()
+        self.ai_btn.config(state=tk.NORMAL)
+    
+    def _process_ai(self):
+        """Revisión de gramática con IA sobre el texto con los cambios aceptados.
+        La llamada va por el AsyncRunner; el resultado vuelve al hilo de Tk con after()"""
+        self.ai_btn.config(state=tk.DISABLED)
+        self.status_label.config(text="Procesando con IA...")
+        text = self._current_text()
+        
+        async def do_correct():
             try:
-                response = self.transcription.groq_client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=4000, temperature=0.1)
-                return response.choices[0].message.content.strip()
+                corrected = await self.main_app.runner.to_thread(self._call_ai, text, self.AI_INSTRUCTION)
             except Exception as e:
-                print(f"Groq error: {e}")
-        
-        if self.transcription.is_gemini_available():
-            try:
-                from config import GEMINI_MODELS
-                for m in GEMINI_MODELS:
-                    try:
-                        model = self.transcription.gemini_client.GenerativeModel(m)
-                        r = model.generate_content(prompt, generation_config={'temperature': 0.1})
-                        if r.text: 
-                            return r.text.strip()
-                    except:
-                        continue
-            except Exception as e:
-                print(f"Gemini error: {e}")
+                self.main_app.root.after(0, self._on_ai_error, e)
+            else:
+                self.main_app.root.after(0, self._on_ai_result, corrected)
         
-        raise Exception("No hay servicios de IA disponibles")
+        self.main_app.runner.submit(do_correct())
     
-    def _compute_diff(self, orig, corr):
-        """Diff palabra por palabra preservando saltos de línea"""
+    def _on_ai_result(self, corrected):
+        if not self.window.winfo_exists():
+            return  # la ventana se cerró mientras tanto
+        self._compute_diff(self.original_text, corrected)
+        self._render()
+    
+    def _on_ai_error(self, error):
+        if not self.window.winfo_exists():
+            return
+        self.diff.config(state=tk.NORMAL)
+        self.diff.delete('1.0', tk.END)
+        self.diff.insert(tk.END, f"Error: {str(error)}", 'error')
+        self.diff.config(state=tk.DISABLED)
+        self.status_label.config(text="Error en la revisión con IA")
+        self.ai_btn.config(state=tk.NORMAL)
+    
+    def _call_ai(self, text, instruction=None):
+        """Llama a la IA a través de la pasarela de texto compartida"""
+        corrected, error = self.transcription.text_gateway.generate(text, instruction, label='correccion',
+                                                                    temperature=0.1)
+        if error:
+            raise Exception(error)
+        return corrected.strip()
+    
+    def _compute_diff(self, orig, corr, accepted=True):
+        """Diff palabra por palabra preservando saltos de línea.
+        accepted: estado inicial de los cambios (False = sugerencias que el usuario acepta con un clic)"""
         import difflib
         
         # Dividir en líneas
@@ -2229,18 +2427,18 @@ Texto corregido (manteniendo saltos de línea exactos):"""
                             cid += 1
                     elif wtag == 'replace':
                         for w in ow[wi1:wi2]:
-                            self.chunks.append([cid, w, False, True, True])
+                            self.chunks.append([cid, w, False, True, accepted])
                             cid += 1
                         for w in cw[wj1:wj2]:
-                            self.chunks.append([cid, w, True, False, True])
+                            self.chunks.append([cid, w, True, False, accepted])
                             cid += 1
                     elif wtag == 'delete':
                         for w in ow[wi1:wi2]:
-                            self.chunks.append([cid, w, False, True, True])
+                            self.chunks.append([cid, w, False, True, accepted])
                             cid += 1
                     elif wtag == 'insert':
                         for w in cw[wj1:wj2]:
-                            self.chunks.append([cid, w, True, False, True])
+                            self.chunks.append([cid, w, True, False, accepted])
                             cid += 1
                 
                 # Añadir salto de línea
@@ -2251,7 +2449,7 @@ Texto corregido (manteniendo saltos de línea exactos):"""
                 for line in orig_lines[i1:i2]:
                     words = line.split()
                     for w in words:
-                        self.chunks.append([cid, w, False, True, True])
+                        self.chunks.append([cid, w, False, True, accepted])
                         cid += 1
                     self.chunks.append([cid, '\n', False, False, True])
                     cid += 1
@@ -2260,7 +2458,7 @@ Texto corregido (manteniendo saltos de línea exactos):"""
                 for line in corr_lines[j1:j2]:
                     words = line.split()
                     for w in words:
-                        self.chunks.append([cid, w, True, False, True])
+                        self.chunks.append([cid, w, True, False, accepted])
                         cid += 1
                     self.chunks.append([cid, '\n', False, False, True])
                     cid += 1
@@ -2328,8 +2526,8 @@ Texto corregido (manteniendo saltos de línea exactos):"""
         """Fallback para clicks"""
         pass
     
-    def _update_preview(self):
-        """Actualiza la vista previa"""
+    def _current_text(self):
+        """Texto resultante con los cambios aceptados"""
         result = []
         for c in self.chunks:
             cid, w, add, rem, acc = c
@@ -2356,7 +2554,11 @@ Texto corregido (manteniendo saltos de línea exactos):"""
         if current_line:
             text_parts.append(' '.join(current_line))
         
-        text = '\n'.join(text_parts)
+        return '\n'.join(text_parts)
+    
+    def _update_preview(self):
+        """Actualiza la vista previa"""
+        text = self._current_text()
         
         self.preview.config(state=tk.NORMAL)
         self.preview.delete('1.0', tk.END)
@@ -2366,37 +2568,11 @@ Texto corregido (manteniendo saltos de línea exactos):"""
         # Actualizar contador
         accepted = sum(1 for c in self.chunks if c[4] and (c[2] or c[3]))
         rejected = sum(1 for c in self.chunks if not c[4] and (c[2] or c[3]))
-        self.status_label.config(text=f"✓ {accepted} aceptados | ✗ {rejected} rechazados")
+        self.status_label.config(text=f"✓ {accepted} aceptados | ✗ {rejected} sin aplicar")
     
     def _apply(self):
         """Aplica los cambios"""
-        result = []
-        for c in self.chunks:
-            cid, w, add, rem, acc = c
-            if w == '\n':
-                result.append('\n')
-            elif add and acc:
-                result.append(w)
-            elif rem and not acc:
-                result.append(w)
-            elif not add and not rem:
-                result.append(w)
-        
-        # Unir preservando saltos de línea
-        text_parts = []
-        current_line = []
-        
-        for item in result:
-            if item == '\n':
-                text_parts.append(' '.join(current_line))
-                current_line = []
-            else:
-                current_line.append(item)
-        
-        if current_line:
-            text_parts.append(' '.join(current_line))
-        
-        text = '\n'.join(text_parts)
+        text = self._current_text()
         
         parts = text.split('\n\n', 1)
         if len(parts) == 2:
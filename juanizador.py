@@ -5,9 +5,10 @@ from config import ANATOMICAL_CATEGORIES
 from transcription import TranscriptionService
 
 class JuanizadorService:
-    def __init__(self):
+    def __init__(self, transcription_service=None):
         self.categories = ANATOMICAL_CATEGORIES
-        self.transcription_service = TranscriptionService()
+        # Reutiliza el servicio (y los clientes compartidos) de la aplicación
+        self.transcription_service = transcription_service or TranscriptionService()
         self.categorized_findings = {}
     
     def generate_technique_text(self, tech, tac_scope=None, rm_type=None, contrast=False, phases=None):
@@ -67,14 +68,13 @@ class JuanizadorService:
             filtered_categories = [cat for cat in self.categories if cat['id'] in available_categories]
             category_names = '\n'.join([f"{cat['id']}. {cat['name']}" for cat in filtered_categories])
             
-            prompt = f"""Eres un radiólogo experto. Categoriza los siguientes hallazgos en las categorías disponibles.
+            # Parte estática (categorías y formato): se cachea en Gemini y solo
+            # viajan los hallazgos en cada petición
+            instruction = f"""Eres un radiólogo experto. Categoriza los hallazgos que te envíe el usuario en las categorías disponibles.
 
 Categorías Disponibles:
 {category_names}
 
-Hallazgos a Categorizar:
-"{transcript}"
-
 Devuelve un objeto JSON con claves de ID de categoría (como strings) y valores como array de hallazgos. 
 Incluye solo categorías con hallazgos. Devuelve SOLO el objeto JSON, sin markdown ni explicaciones.
 
@@ -84,7 +84,8 @@ Ejemplo de formato de salida:
   "8": ["Hallazgo de riñones"]
 }}"""
             
-            result, error = self.transcription_service.transcribe_text(prompt)
+            result, error = self.transcription_service.transcribe_text(
+                f'Hallazgos a Categorizar:\n"{transcript}"', system_instruction=instruction, label='categorias')
             
             if error:
                 return None, error
@@ -134,15 +135,15 @@ Ejemplo de formato de salida:
                 'eco': 'Ecografía'
             }.get(tech, 'genérica')
             
-            prompt = f"""Eres un radiólogo experto. Tu tarea es generar el texto para un informe.
+            # Instrucciones fijas por modalidad (cacheables); la lista de hallazgos va aparte
+            instruction = f"""Eres un radiólogo experto. Tu tarea es generar el texto para un informe.
 Usa vocabulario de {modality_instruction}.
 
 **Tarea 1: Hallazgos Anormales**
-Para cada categoría en esta lista, redacta un párrafo profesional describiendo los hallazgos:
-{json.dumps(findings_list, ensure_ascii=False)}
+Para cada categoría de la lista de hallazgos que te envíe el usuario, redacta un párrafo profesional describiendo los hallazgos.
 
 **Tarea 2: Conclusión**
-Basado SOLAMENTE en los hallazgos anormales de la lista anterior, genera una conclusión concisa de 2-3 líneas resumiendo lo más importante. Si la lista de hallazgos está vacía, la conclusión debe ser "No se observan alteraciones radiológicas significativas."
+Basado SOLAMENTE en los hallazgos anormales de la lista, genera una conclusión concisa de 2-3 líneas resumiendo lo más importante. Si la lista de hallazgos está vacía, la conclusión debe ser "No se observan alteraciones radiológicas significativas."
 
 **Formato de Salida Obligatorio:**
 Devuelve un único objeto JSON con dos claves: "report_paragraphs" y "conclusion".
@@ -157,7 +158,9 @@ Ejemplo:
   "conclusion": "Texto de la conclusión..."
 }}"""
             
-            result, error = self.transcription_service.transcribe_text(prompt)
+            result, error = self.transcription_service.transcribe_text(
+                f"Lista de hallazgos:\n{json.dumps(findings_list, ensure_ascii=False)}",
+                system_instruction=instruction, label=f'informe-{tech}')
             
             if error:
                 return None, error
@@ -0,0 +1,191 @@
+# Módulo de acceso unificado a los LLM de texto (Juanizador, corrección con IA)
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from deadline import Deadline, OperationCancelled
+from tracing import span
+from config import (LLM_TEXT_MODELS, LLM_GROQ_TEXT_MODEL, LLM_MAX_CONCURRENCY, LLM_KEY_COOLDOWN,
+                    LLM_RESPONSE_CACHE_MAX_ENTRIES, LLM_RESPONSE_CACHE_TTL, TEXT_REQUEST_DEADLINE)
+
+
+def _is_quota_error(error):
+    error_msg = str(error).lower()
+    return "429" in error_msg or "quota" in error_msg or "rate limit" in error_msg
+
+
+class LLMGateway:
+    """Punto único de generación de texto para todos los consumidores.
+
+    - Fallback de modelos (LLM_TEXT_MODELS) en cada clave Gemini y, si todas
+      fallan, Groq (llama) como último recurso.
+    - Selección de clave según cuota: una clave que devuelve 429 queda en
+      reposo LLM_KEY_COOLDOWN segundos y se prueba la última.
+    - Caché en memoria de respuestas (misma instrucción + texto + temperatura).
+    - Límite de peticiones simultáneas para no agotar la cuota en ráfagas.
+    - Métricas por consumidor (`label`) y una etapa de traza por llamada.
+
+    Usa los clientes, la clave activa y la caché de prompts del
+    TranscriptionService que lo crea.
+    """
+    def __init__(self, service, max_concurrency=LLM_MAX_CONCURRENCY):
+        self.service = service
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._responses = OrderedDict()  # hash de la petición -> (texto, proveedor, modelo, caduca_en)
+        self._key_cooldown = {}  # índice de clave Gemini -> instante hasta el que se evita
+        self._lock = threading.Lock()
+        self.metrics = {}  # label -> contadores
+
+    def generate(self, prompt, system_instruction=None, label='texto', temperature=None, on_status=None,
+                 deadline=None, use_cache=True):
+        """Genera texto con el primer proveedor/modelo que responda.
+        Returns: (text, error)
+        """
+        deadline = deadline or Deadline(TEXT_REQUEST_DEADLINE)
+        start = time.perf_counter()
+        cache_key = self._cache_key(prompt, system_instruction, temperature)
+        if use_cache:
+            cached = self._cached_response(cache_key)
+            if cached:
+                text, provider, model = cached
+                self._record(label, start, provider, model, cache_hit=True)
+                return text, None
+
+        with span('llm_call', consumer=label, chars=len(prompt)) as call_span:
+            if not self._semaphore.acquire(timeout=deadline.remaining()):
+                call_span.ok = False
+                self._record(label, start, error=True)
+                return None, deadline.reason()
+            try:
+                text, provider, model, error = self._generate_gemini(
+                    prompt, system_instruction, label, temperature, on_status, deadline)
+                if not text and not deadline.expired() and self.service.is_groq_available():
+                    text, provider, model, error = self._generate_groq(
+                        prompt, system_instruction, temperature, on_status, deadline, error)
+            finally:
+                self._semaphore.release()
+            call_span.tag(provider=provider, model=model)
+            call_span.ok = bool(text)
+
+        if not text:
+            self._record(label, start, error=True)
+            return None, error
+        if use_cache:
+            self._store_response(cache_key, text, provider, model)
+        self._record(label, start, provider, model)
+        return text, None
+
+    def _key_order(self):
+        """Claves Gemini desde la activa, con las que están en reposo por cuota al final"""
+        num_keys = len(self.service.gemini_clients)
+        start_index = self.service.current_key_index
+        order = [(start_index + i) % num_keys for i in range(num_keys)]
+        now = time.time()
+        with self._lock:
+            return sorted(order, key=lambda idx: self._key_cooldown.get(idx, 0) > now)
+
+    def _generate_gemini(self, prompt, system_instruction, label, temperature, on_status, deadline):
+        """Returns: (text, provider, model, error)"""
+        if not self.service.is_gemini_available():
+            return None, None, None, "Servicio Gemini no disponible"
+        error = "Todas las claves de Gemini fallaron al procesar texto"
+        for i, idx in enumerate(self._key_order()):
+            client = self.service.gemini_clients[idx]
+            if on_status:
+                on_status(f"Procesando con IA (Clave {idx+1})...")
+            for model_name in LLM_TEXT_MODELS:
+                try:
+                    deadline.check()
+                    timeout = deadline.attempt_timeout(base=TEXT_REQUEST_DEADLINE)
+                    with span('text_request', model=model_name, key_index=idx, chars=len(prompt)):
+                        if system_instruction:
+                            text = self.service._generate_with_prompt(
+                                client, idx, model_name, system_instruction, prompt, timeout, label,
+                                deadline=deadline, temperature=temperature)
+                        else:
+                            text = self.service._generate_gemini(
+                                client, model_name, prompt,
+                                self.service._gemini_request_config(timeout, temperature=temperature))
+                    if text:
+                        self.service.current_key_index = idx
+                        return text, 'Gemini', model_name, None
+                except OperationCancelled as e:
+                    return None, None, None, str(e)
+                except Exception as e:
+                    if _is_quota_error(e):
+                        print(f"Clave {idx+1} sin cuota para texto ({model_name}). Rotando...")
+                        with self._lock:
+                            self._key_cooldown[idx] = time.time() + LLM_KEY_COOLDOWN
+                        break
+                    print(f"Error de texto con {model_name} en clave {idx+1}: {e}")
+                    error = f"Error en clave {idx+1}: {e}"
+        return None, None, None, error
+
+    def _generate_groq(self, prompt, system_instruction, temperature, on_status, deadline, previous_error):
+        """Último recurso: modelo de texto de Groq. Returns: (text, provider, model, error)"""
+        if on_status:
+            on_status("Procesando con IA (Groq)...")
+        messages = [{"role": "user", "content": prompt}]
+        if system_instruction:
+            messages.insert(0, {"role": "system", "content": system_instruction})
+        try:
+            with span('text_request', model=LLM_GROQ_TEXT_MODEL, chars=len(prompt)):
+                response = self.service.groq_client.chat.completions.create(
+                    model=LLM_GROQ_TEXT_MODEL, messages=messages, max_tokens=4000,
+                    temperature=0.1 if temperature is None else temperature,
+                    timeout=deadline.attempt_timeout(base=TEXT_REQUEST_DEADLINE))
+            text = (response.choices[0].message.content or '').strip()
+            if text:
+                return text, 'Groq', LLM_GROQ_TEXT_MODEL, None
+        except Exception as e:
+            print(f"Error de texto con Groq: {e}")
+            return None, None, None, f"{previous_error}; Groq: {e}"
+        return None, None, None, previous_error
+
+    # ---------- caché de respuestas ----------
+    def _cache_key(self, prompt, system_instruction, temperature):
+        raw = f"{system_instruction or ''}\x00{prompt}\x00{temperature}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _cached_response(self, cache_key):
+        with self._lock:
+            entry = self._responses.get(cache_key)
+            if entry is None:
+                return None
+            if entry[3] < time.time():
+                del self._responses[cache_key]
+                return None
+            self._responses.move_to_end(cache_key)
+            return entry[:3]
+
+    def _store_response(self, cache_key, text, provider, model):
+        with self._lock:
+            self._responses[cache_key] = (text, provider, model, time.time() + LLM_RESPONSE_CACHE_TTL)
+            self._responses.move_to_end(cache_key)
+            while len(self._responses) > LLM_RESPONSE_CACHE_MAX_ENTRIES:
+                self._responses.popitem(last=False)
+
+    # ---------- métricas ----------
+    def _record(self, label, start, provider=None, model=None, cache_hit=False, error=False):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            stats = self.metrics.setdefault(label, {'calls': 0, 'cache_hits': 0, 'errors': 0, 'total_ms': 0.0,
+                                                    'models': {}})
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            if cache_hit:
+                stats['cache_hits'] += 1
+            if error:
+                stats['errors'] += 1
+            elif model:
+                stats['models'][model] = stats['models'].get(model, 0) + 1
+        source = 'caché' if cache_hit else f"{provider}/{model}" if model else 'error'
+        print(f"LLM [{label}]: {source} en {elapsed_ms:.0f} ms")
+
+    def summary(self):
+        """Métricas por consumidor (para los logs)"""
+        with self._lock:
+            parts = [f"{label}: {s['calls']} llamadas, {s['cache_hits']} en caché, {s['errors']} errores, "
+                     f"media {s['total_ms'] / s['calls']:.0f} ms"
+                     for label, s in sorted(self.metrics.items())]
+        return '; '.join(parts) if parts else "Sin llamadas a LLM todavía"
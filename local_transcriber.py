@@ -0,0 +1,119 @@
+# Módulo de transcripción local en CPU (faster-whisper, sin red)
+import os
+import threading
+import time
+import wave
+from config import (LOCAL_WHISPER_ENABLED, LOCAL_WHISPER_MODEL, LOCAL_WHISPER_COMPUTE_TYPE,
+                    LOCAL_WHISPER_THREADS)
+
+try:
+    from faster_whisper import WhisperModel
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
+
+def audio_duration(audio_file_path):
+    """Duración en segundos de un WAV. Returns: float o None si no se puede saber"""
+    if not audio_file_path.lower().endswith('.wav'):
+        return None
+    try:
+        with wave.open(audio_file_path, 'rb') as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except (wave.Error, OSError, ZeroDivisionError):
+        return None
+
+
+class LocalTranscriber:
+    """Whisper en CPU con CTranslate2 (int8).
+
+    Si LOCAL_WHISPER_ENABLED está activo, el modelo se carga una sola vez
+    en segundo plano al arrancar (`preload`) para que el primer dictado no
+    pague los segundos de carga. CTranslate2 no comparte bien un mismo
+    modelo entre varias transcripciones a la vez en CPU, así que se
+    serializan con un lock y cada una usa todos los hilos configurados.
+    """
+    def __init__(self, model_size=LOCAL_WHISPER_MODEL, compute_type=LOCAL_WHISPER_COMPUTE_TYPE,
+                 cpu_threads=LOCAL_WHISPER_THREADS):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads or max(1, (os.cpu_count() or 2) // 2)
+        self.model = None
+        self.load_error = None
+        self._loaded = threading.Event()
+        self._load_lock = threading.Lock()
+        self._transcribe_lock = threading.Lock()
+
+    def is_available(self):
+        """Disponible si la librería está instalada y el modelo no falló al cargar"""
+        return LOCAL_WHISPER_ENABLED and FASTER_WHISPER_AVAILABLE and self.load_error is None
+
+    def preload(self):
+        """Carga el modelo en un hilo de fondo (no bloquea el arranque de la GUI)"""
+        if not self.is_available() or self._loaded.is_set():
+            return
+        threading.Thread(target=self._load, name='whisper-preload', daemon=True).start()
+
+    def _load(self):
+        with self._load_lock:
+            if self._loaded.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                self.model = WhisperModel(self.model_size, device='cpu', compute_type=self.compute_type,
+                                          cpu_threads=self.cpu_threads)
+                print(f"Whisper local '{self.model_size}' cargado en {time.perf_counter() - start:.1f}s "
+                      f"({self.cpu_threads} hilos, {self.compute_type})")
+            except Exception as e:
+                self.load_error = str(e)
+                print(f"No se pudo cargar Whisper local: {e}")
+            finally:
+                self._loaded.set()
+
+    def transcribe(self, audio_file_path, prompt=None, on_partial=None, deadline=None):
+        """Transcribe en local (espera a que termine la precarga si está en curso).
+        
+        Los segmentos se decodifican de forma perezosa; con `on_partial` se
+        entrega el texto acumulado tras cada segmento, y entre segmentos se
+        comprueba el `deadline` (cancelación o plazo agotado).
+        Returns: (text, error)
+        """
+        if not self.is_available():
+            return None, "Whisper local no disponible"
+        if not self._loaded.is_set():
+            self._load()
+        if self.model is None:
+            return None, self.load_error or "Whisper local no disponible"
+
+        try:
+            start = time.perf_counter()
+            with self._transcribe_lock:
+                segments, info = self.model.transcribe(audio_file_path, language='es',
+                                                       initial_prompt=prompt, beam_size=5,
+                                                       vad_filter=True)
+                text = ''
+                for segment in segments:
+                    if deadline and deadline.expired():
+                        return None, deadline.reason()
+                    text += segment.text
+                    if on_partial:
+                        on_partial(text.strip())
+                text = text.strip()
+            elapsed = time.perf_counter() - start
+            print(f"Whisper local: {info.duration:.1f}s de audio en {elapsed:.1f}s")
+            return (text, None) if text else (None, "Whisper local no devolvió texto")
+        except Exception as e:
+            return None, str(e)
+
+
+_transcriber = None
+_transcriber_lock = threading.Lock()
+
+
+def get_local_transcriber():
+    """Devuelve el transcriptor local compartido (el modelo se carga una vez)"""
+    global _transcriber
+    with _transcriber_lock:
+        if _transcriber is None:
+            _transcriber = LocalTranscriber()
+        return _transcriber
@@ -0,0 +1,259 @@
+# Módulo de normalización de medidas dictadas ("tres coma cinco centímetros" -> "3,5 cm")
+import re
+from functools import lru_cache
+from vocab_matcher import normalize_key
+
+_UNITS = ['cero', 'uno', 'dos', 'tres', 'cuatro', 'cinco', 'seis', 'siete', 'ocho', 'nueve']
+_TEENS = ['diez', 'once', 'doce', 'trece', 'catorce', 'quince', 'dieciséis', 'diecisiete', 'dieciocho',
+          'diecinueve', 'veinte', 'veintiuno', 'veintidós', 'veintitrés', 'veinticuatro', 'veinticinco',
+          'veintiséis', 'veintisiete', 'veintiocho', 'veintinueve']
+_TENS = {'treinta': 30, 'cuarenta': 40, 'cincuenta': 50, 'sesenta': 60, 'setenta': 70, 'ochenta': 80,
+         'noventa': 90}
+_HUNDREDS = {'ciento': 100, 'doscientos': 200, 'trescientos': 300, 'cuatrocientos': 400, 'quinientos': 500,
+             'seiscientos': 600, 'setecientos': 700, 'ochocientos': 800, 'novecientos': 900}
+
+# Unidades dictadas (en minúsculas) -> abreviatura
+MEASUREMENT_UNITS = {
+    'milímetro': 'mm', 'milímetros': 'mm', 'mm': 'mm',
+    'centímetro': 'cm', 'centímetros': 'cm', 'cm': 'cm',
+    'metro': 'm', 'metros': 'm',
+    'mililitro': 'ml', 'mililitros': 'ml', 'ml': 'ml',
+    'centímetro cúbico': 'cc', 'centímetros cúbicos': 'cc', 'cc': 'cc',
+    'unidades hounsfield': 'UH', 'uh': 'UH',
+    'por ciento': '%',
+}
+
+# Autómata de un número cardinal (sin "mil"): estado -> {clase de palabra: estado}.
+# Los estados completos son 'small', 'tens' y 'hund'
+_CARDINAL = {
+    'start': {'unit': 'small', 'teen': 'small', 'tens': 'tens', 'hundred': 'hund', 'cien': 'hund'},
+    'tens': {'y': 'tens_y'},
+    'tens_y': {'unit': 'small'},
+    'hund': {'unit': 'small', 'teen': 'small', 'tens': 'tens'},
+    'small': {},
+}
+_COMPLETE = ('small', 'tens', 'hund')
+# Clases de palabra que forman parte de un número
+_NUMBER_CLASSES = {'unit', 'teen', 'tens', 'hundred', 'cien', 'mil', 'zero', 'digits', 'decimal'}
+
+
+@lru_cache(maxsize=1)
+def compile_measurement_grammar():
+    """Léxico y tabla de transiciones del transductor, compilados una vez.
+
+    La tabla se genera instanciando el autómata del cardinal tres veces:
+    parte entera antes de "mil" ('int:'), después ('mil:') y parte decimal
+    ('frac:', admite ceros delante: "coma cero cinco"). Una medida es
+    número, separador decimal opcional y unidad; varias medidas se unen
+    con "por" (dimensiones). Solo acepta en el estado 'unit', así que un
+    número sin unidad detrás no se toca.
+    El patrón encuentra en una pasada de regex, sobre el texto en
+    minúsculas, las palabras del léxico y los números escritos con
+    cifras ("12", "3,5", "1.200"), así que el resto del texto no llega al
+    transductor; el de unidades descarta antes los textos sin ninguna.
+    Returns: (patrón, patrón de unidades, léxico {palabra en minúsculas: (clase, valor)},
+              transiciones {estado: {clase: estado}})
+    """
+    lexicon = {}
+    for value, word in enumerate(_UNITS):
+        lexicon[word] = ('unit', value)
+    lexicon.update({'un': ('unit', 1), 'una': ('unit', 1), 'veintiún': ('teen', 21), 'veintiuna': ('teen', 21)})
+    for value, word in enumerate(_TEENS, 10):
+        lexicon[word] = ('teen', value)
+    lexicon.update({word: ('tens', value) for word, value in _TENS.items()})
+    lexicon.update({word: ('hundred', value) for word, value in _HUNDREDS.items()})
+    lexicon.update({word[:-2] + 'as': ('hundred', value) for word, value in _HUNDREDS.items() if value > 100})
+    lexicon.update({'cien': ('cien', 100), 'mil': ('mil', 1000), 'y': ('y', None),
+                    'coma': ('sep', None), 'punto': ('sep', None), 'por': ('by', None), 'x': ('by', None)})
+    lexicon['cero'] = ('zero', 0)
+    lexicon.update({unit: ('measure_unit', symbol) for unit, symbol in MEASUREMENT_UNITS.items()})
+    # La transcripción a veces pierde las tildes ("centimetros")
+    lexicon.update({normalize_key(word, strip_accents=True): entry for word, entry in list(lexicon.items())})
+
+    transitions = {}
+    for prefix in ('int', 'mil', 'frac'):
+        for state, edges in _CARDINAL.items():
+            transitions[f'{prefix}:{state}'] = {cls: f'{prefix}:{target}' for cls, target in edges.items()}
+    transitions['int:start'].update({'zero': 'int:small', 'digits': 'int:digits', 'decimal': 'int:decimal',
+                                     'mil': 'mil:start'})
+    for state in _COMPLETE:
+        transitions[f'int:{state}']['mil'] = 'mil:start'
+    transitions['frac:start'].update({'zero': 'frac:zero', 'digits': 'frac:digits'})
+    transitions['frac:zero'] = dict(transitions['frac:start'])
+    transitions['int:digits'], transitions['int:decimal'], transitions['frac:digits'] = {}, {}, {}
+
+    complete = ([f'{prefix}:{state}' for prefix in ('int', 'mil', 'frac') for state in _COMPLETE]
+                + ['int:digits', 'int:decimal', 'frac:digits', 'frac:zero', 'mil:start'])
+    for state in complete:
+        transitions[state].update({'measure_unit': 'unit', 'by': 'int:start'})
+        if state.startswith(('int:', 'mil:')) and state != 'int:decimal':
+            transitions[state]['sep'] = 'frac:start'
+    transitions['unit'] = {'by': 'int:start'}
+
+    pattern = re.compile(r'\d+(?:[.,]\d+)?|\b' + _trie_regex(lexicon) + r'\b')
+    unit_pattern = re.compile(r'\b' + _trie_regex(word for word, (cls, _) in lexicon.items()
+                                                  if cls == 'measure_unit') + r'\b')
+    return pattern, unit_pattern, lexicon, transitions
+
+
+def _trie_regex(words):
+    """Regex de un conjunto de palabras con los prefijos comunes factorizados
+    ("cien(?:to|...)"): re prueba una alternativa por letra en lugar de
+    una por palabra. Los espacios de las palabras compuestas aceptan \\s+.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [(r'\s+' if char == ' ' else re.escape(char)) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class _Dimension:
+    """Valor de una medida mientras se recorre"""
+    def __init__(self):
+        self.total = 0  # miles ya cerrados
+        self.group = 0  # cardinal en curso
+        self.digits = None  # número escrito con cifras
+        self.fraction = None  # ceros y cifras ya fijados de la parte decimal, o None sin decimales
+        self.fraction_group = None  # cardinal en curso de la parte decimal
+        self.unit = None
+
+    def add(self, cls, value, in_fraction):
+        """Aplica una palabra del número (la transición ya se ha validado)"""
+        if cls == 'sep':
+            self.fraction = ''
+        elif cls == 'mil':
+            self.total, self.group = max(self.group, 1) * 1000, 0
+        elif in_fraction:
+            if cls in ('zero', 'digits'):
+                self.fraction += str(value)
+            elif value is not None:
+                self.fraction_group = (self.fraction_group or 0) + value
+        elif cls in ('digits', 'decimal'):
+            self.digits = value
+        elif value is not None:
+            self.group += value
+
+    def text(self):
+        number = self.digits if self.digits is not None else str(self.total + self.group)
+        if self.fraction is None:
+            return number
+        return f"{number},{self.fraction}{'' if self.fraction_group is None else self.fraction_group}"
+
+
+def _tokens(lowered, pattern, lexicon):
+    """Palabras del léxico y números con cifras del texto (en minúsculas), clasificados.
+    Returns: lista de (inicio, fin, clase, valor)
+    """
+    tokens = []
+    for match in pattern.finditer(lowered):
+        token = match.group()
+        if token[0].isdigit():
+            # "3,5" o "1.200" se dejan como se escribieron
+            tokens.append((match.start(), match.end(), 'digits' if token.isdigit() else 'decimal', token))
+        else:
+            key = ' '.join(token.split())
+            tokens.append((match.start(), match.end(), *lexicon[key]))
+    return tokens
+
+
+def _inside_number(text, tokens, i):
+    """¿El token i sigue a un número ("cinco" en "tres coma cinco coma dos")?
+    Una medida que empieza ahí solo recogería el final de la frase numérica."""
+    def joined(k):
+        return k >= 0 and text[tokens[k][1]:tokens[k + 1][0]].isspace()
+
+    if not joined(i - 1):
+        return False
+    if text[tokens[i - 1][0]:tokens[i - 1][1]].lower() in ('un', 'una'):
+        # Artículo: "un quince por ciento"
+        return False
+    if tokens[i - 1][2] in _NUMBER_CLASSES:
+        return True
+    return tokens[i - 1][2] in ('sep', 'y') and joined(i - 2) and tokens[i - 2][2] in _NUMBER_CLASSES
+
+
+def _format(dimensions):
+    """'12 x 8 mm': cada medida sin unidad toma la de la siguiente y la unidad solo se repite si cambia"""
+    units = []
+    unit = None
+    for dimension in reversed(dimensions):
+        unit = dimension.unit or unit
+        units.append(unit)
+    units.reverse()
+    parts = []
+    for i, dimension in enumerate(dimensions):
+        parts.append(dimension.text())
+        if i + 1 == len(dimensions) or units[i + 1] != units[i]:
+            parts[-1] += ' ' + units[i]
+    return ' x '.join(parts)
+
+
+def normalize_measurements(text):
+    """Sustituye las medidas dictadas con palabras por cifras y abreviaturas.
+
+    "tres coma cinco centímetros" -> "3,5 cm", "doce por ocho milímetros" ->
+    "12 x 8 mm". Recorre las palabras una vez con el transductor de
+    compile_measurement_grammar; en cada posición se queda con la medida
+    más larga que acaba en una unidad y sigue tras ella, así que cada
+    palabra se visita unas pocas veces (las medidas son cortas) y el coste
+    es lineal. Las palabras de una medida solo pueden estar separadas por
+    espacios, y una frase numérica que no se puede leer entera ("tres coma
+    cinco coma dos centímetros") se deja como está.
+    """
+    pattern, unit_pattern, lexicon, transitions = compile_measurement_grammar()
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # Alguna letra cambia de longitud al pasar a minúsculas ('İ'): esa se deja tal cual
+        lowered = ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+    if not unit_pattern.search(lowered):
+        return text
+    tokens = _tokens(lowered, pattern, lexicon)
+    parts = []
+    last = 0
+    i = 0
+    while i < len(tokens):
+        state = 'int:start'
+        dimensions = [_Dimension()]
+        best = None
+        j = i if not _inside_number(text, tokens, i) else len(tokens)
+        while j < len(tokens):
+            start, end, cls, value = tokens[j]
+            if j > i and not text[tokens[j - 1][1]:start].isspace():
+                break
+            target = transitions.get(state, {}).get(cls)
+            if target is None:
+                break
+            if cls == 'by':
+                dimensions.append(_Dimension())
+            elif cls == 'measure_unit':
+                dimensions[-1].unit = value
+            else:
+                dimensions[-1].add(cls, value, state.startswith('frac:'))
+            state = target
+            j += 1
+            if state == 'unit':
+                best = (j, _format(dimensions))
+        if best is None:
+            i += 1
+            continue
+        end, replacement = best
+        parts.append(text[last:tokens[i][0]])
+        parts.append(replacement)
+        last = tokens[end - 1][1]
+        i = end
+    if not parts:
+        return text
+    parts.append(text[last:])
+    return ''.join(parts)
@@ -0,0 +1,497 @@
+# Registro compartido de clientes de proveedores de IA (Gemini + Groq)
+import hashlib
+import threading
+import time
+from tracing import span
+from config import (GEMINI_API_KEYS, GROQ_API_KEY, GEMINI_MODELS, HTTP_MAX_KEEPALIVE,
+                    HTTP_KEEPALIVE_EXPIRY, GEMINI_FILE_TTL_MARGIN, WARMUP_MAX_IDLE, FAKE_PROVIDER_URL,
+                    PROMPT_CACHE_ENABLED, PROMPT_CACHE_TTL, PROMPT_CACHE_REFRESH_MARGIN,
+                    PROMPT_CACHE_RETRY_AFTER, PROMPT_CACHE_MIN_TOKENS, PROMPT_CACHE_MIN_TOKENS_DEFAULT,
+                    PROMPT_CACHE_CHARS_PER_TOKEN)
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    from google import genai
+    from google.genai import types as genai_types
+    from google.genai import errors as genai_errors
+    GENAI_AVAILABLE = True
+except ImportError:
+    GENAI_AVAILABLE = False
+
+try:
+    import groq
+    GROQ_AVAILABLE = True
+except ImportError:
+    GROQ_AVAILABLE = False
+
+
+# Códigos HTTP de fallos temporales del proveedor (además de cualquier 5xx)
+RETRYABLE_STATUS_CODES = (408, 429)
+
+
+def is_retryable_exception(exc):
+    """¿La excepción es de red o un fallo temporal del proveedor?
+
+    Se decide por el tipo de la excepción y el código HTTP que traen los
+    SDK (httpx, groq, google-genai), nunca por el texto del mensaje.
+    """
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    if HTTPX_AVAILABLE and isinstance(exc, httpx.TransportError):
+        return True
+    if GROQ_AVAILABLE and isinstance(exc, groq.APIConnectionError):  # incluye APITimeoutError
+        return True
+    status = None
+    if GROQ_AVAILABLE and isinstance(exc, groq.APIStatusError):
+        status = exc.status_code
+    elif GENAI_AVAILABLE and isinstance(exc, genai_errors.APIError):
+        status = exc.code
+    elif HTTPX_AVAILABLE and isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    # Los SDK a veces envuelven el error de transporte original
+    cause = exc.__cause__ or exc.__context__
+    return cause is not None and cause is not exc and is_retryable_exception(cause)
+
+
+class ProviderError(str):
+    """Mensaje de error de un proveedor que recuerda si merece reintentarse.
+
+    Sigue siendo un str (la interfaz y los logs lo muestran igual), pero la
+    clasificación viaja aparte: la cola persistente solo guarda los dictados
+    cuyo error es `retryable`.
+    """
+    def __new__(cls, message, retryable=False):
+        error = super().__new__(cls, message)
+        error.retryable = retryable
+        return error
+
+    @classmethod
+    def from_exception(cls, exc, message=None):
+        return cls(message or str(exc), is_retryable_exception(exc))
+
+
+class ConnectionStats:
+    """Cuenta peticiones HTTP y conexiones nuevas por proveedor.
+
+    Se engancha a httpcore mediante la extensión `trace` de cada petición:
+    una petición que no emite `connection.connect_tcp` ha reutilizado una
+    conexión keep-alive del pool. También mide cuánto tarda el
+    establecimiento (TCP + TLS) de cada conexión nueva, lo que permite
+    estimar la latencia ahorrada por el precalentamiento.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.new_connections = {}
+        self.last_activity = {}
+        self.handshake_ms = {}
+        self._warm_pending = {}
+        self._local = threading.local()
+
+    def request_hook(self, provider):
+        """Hook de httpx que instala el trace en cada petición saliente"""
+        def hook(request):
+            state = {'connected': False, 'started': None,
+                     'warmup': getattr(self._local, 'warmup', False)}
+
+            def trace(event_name, info):
+                if event_name == 'connection.connect_tcp.started':
+                    state['connected'] = True
+                    state['started'] = time.perf_counter()
+                    with self._lock:
+                        self.new_connections[provider] = self.new_connections.get(provider, 0) + 1
+                elif event_name in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+                    if state['started'] is not None:
+                        state['handshake_ms'] = (time.perf_counter() - state['started']) * 1000
+
+            with self._lock:
+                self.requests[provider] = self.requests.get(provider, 0) + 1
+                self.last_activity[provider] = time.time()
+            request.extensions['trace'] = trace
+            request.extensions['dictado_conn_state'] = state
+
+        return hook
+
+    def response_hook(self, provider):
+        """Hook de httpx que registra el coste del handshake de cada conexión"""
+        def hook(response):
+            state = response.request.extensions.get('dictado_conn_state')
+            if not state:
+                return
+            with self._lock:
+                if state['connected']:
+                    if 'handshake_ms' in state:
+                        self.handshake_ms[provider] = state['handshake_ms']
+                    if provider in self._warm_pending and not state.get('warmup'):
+                        self._warm_pending.pop(provider)
+                        print(f"Precalentamiento {provider} no aprovechado: conexión nueva en la petición")
+                elif provider in self._warm_pending and not state.get('warmup'):
+                    saved = self._warm_pending.pop(provider)
+                    print(f"Conexión {provider} precalentada reutilizada: ahorro estimado {saved:.0f} ms")
+
+        return hook
+
+    def is_warm(self, provider, max_idle):
+        """Indica si hubo actividad reciente (la conexión sigue abierta)"""
+        with self._lock:
+            last = self.last_activity.get(provider)
+        return last is not None and time.time() - last < max_idle
+
+    def set_warming(self, active):
+        """Marca las peticiones de este hilo como precalentamiento"""
+        self._local.warmup = active
+
+    def mark_warmed(self, provider):
+        """Anota el handshake pagado por el precalentamiento para la próxima petición"""
+        with self._lock:
+            if provider in self.handshake_ms:
+                self._warm_pending[provider] = self.handshake_ms[provider]
+
+    def reuse_rate(self, provider=None):
+        """Fracción de peticiones servidas sobre una conexión ya abierta"""
+        with self._lock:
+            if provider:
+                total = self.requests.get(provider, 0)
+                new = self.new_connections.get(provider, 0)
+            else:
+                total = sum(self.requests.values())
+                new = sum(self.new_connections.values())
+        if not total:
+            return None
+        return max(0.0, 1 - new / total)
+
+    def summary(self):
+        parts = []
+        for provider in sorted(self.requests):
+            rate = self.reuse_rate(provider)
+            parts.append(f"{provider}: {self.requests[provider]} peticiones, "
+                         f"{self.new_connections.get(provider, 0)} conexiones nuevas, "
+                         f"reutilización {rate:.0%}")
+        return '; '.join(parts) if parts else "Sin peticiones HTTP todavía"
+
+
+class KeyedLocks:
+    """Un candado por clave para que cada subida o creación ocurra una sola vez.
+
+    Las peticiones concurrentes (o los reintentos) del mismo recurso esperan
+    a la primera y después reutilizan su resultado en lugar de repetirla.
+    """
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+
+class GeminiFileCache:
+    """Referencias de la Files API reutilizables hasta que caducan.
+
+    Los archivos subidos pertenecen al proyecto de cada clave, así que la
+    caché se indexa por (clave, archivo): una subida sirve para todos los
+    modelos de esa clave y para los reintentos posteriores del mismo audio.
+    La subida del SDK es reanudable y por trozos, con reintento por trozo.
+    """
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+        self._uploading = KeyedLocks()
+        self.uploaded_bytes = 0
+        self.reused = 0
+
+    def get_or_upload(self, client, key_index, payload, timeout=None):
+        cache_key = (key_index, payload.fingerprint())
+        cached = self._lookup(cache_key)
+        if cached:
+            return cached
+        with self._uploading.get(cache_key):
+            # Otra petición pudo subir el mismo audio mientras esperábamos
+            cached = self._lookup(cache_key)
+            if cached:
+                return cached
+            return self._upload(client, cache_key, payload, timeout)
+
+    def _lookup(self, cache_key):
+        with self._lock:
+            entry = self._files.get(cache_key)
+            if entry and entry[1] > time.time():
+                self.reused += 1
+                print(f"Reutilizando audio subido en clave Gemini {cache_key[0]+1}: {entry[0].name}")
+                return entry[0]
+        return None
+
+    def _upload(self, client, cache_key, payload, timeout):
+        key_index = cache_key[0]
+        print(f"Subiendo audio a la Files API (clave {key_index+1}, {payload.size/1024/1024:.2f}MB)...")
+        upload_config = {'mime_type': payload.mime_type}
+        if timeout:
+            # Timeout por petición (cada trozo de la subida), en milisegundos
+            upload_config['http_options'] = {'timeout': int(timeout * 1000)}
+        with span('gemini_upload', key_index=key_index, bytes=payload.size):
+            uploaded = client.files.upload(file=payload.path, config=upload_config)
+            uploaded = self._wait_until_active(client, uploaded, timeout or 30)
+
+        expires_at = time.time() + 47 * 3600
+        if getattr(uploaded, 'expiration_time', None):
+            expires_at = uploaded.expiration_time.timestamp()
+
+        with self._lock:
+            self._files[cache_key] = (uploaded, expires_at - GEMINI_FILE_TTL_MARGIN)
+            self.uploaded_bytes += payload.size
+        return uploaded
+
+    def invalidate(self, key_index, payload):
+        """Descarta una referencia que el servidor ya no reconoce"""
+        with self._lock:
+            self._files.pop((key_index, payload.fingerprint()), None)
+
+    def _wait_until_active(self, client, uploaded, timeout=30):
+        """Espera a que Gemini termine de procesar el archivo subido.
+
+        Si no llega a ACTIVE (sigue procesando al agotar el tiempo o ha
+        fallado) lanza un error: esa referencia no sirve y no se guarda.
+        """
+        deadline = time.time() + timeout
+        while getattr(uploaded, 'state', None) and uploaded.state.name == 'PROCESSING':
+            if time.time() > deadline:
+                break
+            time.sleep(0.5)
+            uploaded = client.files.get(name=uploaded.name)
+        state = getattr(uploaded, 'state', None)
+        if state and state.name != 'ACTIVE':
+            raise RuntimeError(f"El audio subido a Gemini no está disponible ({state.name}): {uploaded.name}")
+        return uploaded
+
+
+class GeminiPromptCache:
+    """Prompts estáticos registrados en el context caching de Gemini.
+
+    Las instrucciones largas (transcripción literal, categorías del
+    Juanizador) se suben una vez como `system_instruction` de un
+    CachedContent y las peticiones lo referencian por nombre, así que esos
+    tokens no se reenvían ni se vuelven a procesar en cada llamada. Cada
+    caché pertenece a una clave y a un modelo. Se renueva el TTL cuando está
+    a punto de caducar. Los prompts que no llegan al mínimo de tokens del
+    modelo no se intentan cachear; si la creación falla por otro motivo se
+    recuerda el fallo durante un tiempo. En ambos casos la petición lleva el
+    prompt en línea como instrucción de sistema.
+    """
+    def __init__(self):
+        self._caches = {}  # (clave, modelo, hash del prompt) -> (nombre, caduca_en)
+        self._failed = {}  # misma clave -> instante del último fallo
+        self._lock = threading.Lock()
+        self._creating = KeyedLocks()
+        self.hits = 0
+
+    @staticmethod
+    def prompt_key(prompt):
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def large_enough(model, prompt):
+        """Si el prompt alcanza (estimado) el mínimo de tokens de caché del modelo"""
+        min_tokens = PROMPT_CACHE_MIN_TOKENS.get(model, PROMPT_CACHE_MIN_TOKENS_DEFAULT)
+        return len(prompt) / PROMPT_CACHE_CHARS_PER_TOKEN >= min_tokens
+
+    def get(self, client, key_index, model, prompt, label='prompt'):
+        """Nombre del CachedContent para este prompt, o None si hay que enviarlo en línea"""
+        if not PROMPT_CACHE_ENABLED or not self.large_enough(model, prompt):
+            return None
+        cache_key = (key_index, model, self.prompt_key(prompt))
+        name, pending = self._lookup(cache_key)
+        if not pending:
+            return name
+        with self._creating.get(cache_key):
+            # Otra petición pudo crear o renovar la caché mientras esperábamos
+            name, pending = self._lookup(cache_key)
+            if not pending:
+                return name
+            with self._lock:
+                entry = self._caches.get(cache_key)
+            if entry and entry[1] > time.time() and self._extend(client, cache_key, entry[0]):
+                self.hits += 1
+                return entry[0]
+            return self._create(client, cache_key, model, prompt, label)
+
+    def _lookup(self, cache_key):
+        """(nombre, False) si se puede usar ya, (None, False) si hay que ir en línea,
+        (None, True) si hay que renovarla o crearla"""
+        now = time.time()
+        with self._lock:
+            entry = self._caches.get(cache_key)
+            failed_at = self._failed.get(cache_key)
+            if entry and entry[1] - now > PROMPT_CACHE_REFRESH_MARGIN:
+                self.hits += 1
+                return entry[0], False
+        if entry is None and failed_at and now - failed_at < PROMPT_CACHE_RETRY_AFTER:
+            return None, False
+        return None, True
+
+    def _create(self, client, cache_key, model, prompt, label):
+        try:
+            with span('prompt_cache_create', model=model, key_index=cache_key[0], label=label):
+                cached = client.caches.create(model=model, config=genai_types.CreateCachedContentConfig(
+                    system_instruction=prompt, display_name=f'dictado-{label}', ttl=f'{PROMPT_CACHE_TTL}s'))
+        except Exception as e:
+            print(f"Context caching no disponible para {label} en {model} (clave {cache_key[0]+1}): {e}")
+            with self._lock:
+                self._failed[cache_key] = time.time()
+                self._caches.pop(cache_key, None)
+            return None
+        with self._lock:
+            self._caches[cache_key] = (cached.name, self._expiry(cached))
+            self._failed.pop(cache_key, None)
+        print(f"Prompt '{label}' registrado en caché de Gemini ({model}, clave {cache_key[0]+1}): {cached.name}")
+        return cached.name
+
+    def _extend(self, client, cache_key, name):
+        """Renueva el TTL de una caché que está a punto de caducar"""
+        try:
+            updated = client.caches.update(name=name, config=genai_types.UpdateCachedContentConfig(
+                ttl=f'{PROMPT_CACHE_TTL}s'))
+        except Exception as e:
+            print(f"No se pudo renovar la caché {name}: {e}")
+            return False
+        with self._lock:
+            self._caches[cache_key] = (name, self._expiry(updated))
+        return True
+
+    def _expiry(self, cached):
+        if getattr(cached, 'expire_time', None):
+            return cached.expire_time.timestamp()
+        return time.time() + PROMPT_CACHE_TTL
+
+    def invalidate(self, key_index, model, prompt):
+        """Olvida una caché que el servidor ya no reconoce (caducada o borrada)"""
+        with self._lock:
+            self._caches.pop((key_index, model, self.prompt_key(prompt)), None)
+
+
+class ProviderRegistry:
+    """Clientes de Gemini y Groq compartidos por toda la aplicación.
+
+    Transcripción, Juanizador y corrección con IA usan los mismos clientes,
+    de modo que comparten el pool de conexiones keep-alive (y las sesiones
+    TLS), la clave Gemini activa, las subidas a la Files API y los prompts
+    registrados en el context caching.
+    """
+    def __init__(self):
+        self.gemini_clients = []
+        self.groq_client = None
+        self.stats = ConnectionStats()
+        self.gemini_files = GeminiFileCache()
+        self.prompt_cache = GeminiPromptCache()
+        self._key_lock = threading.Lock()
+        self._current_key_index = 0
+        if FAKE_PROVIDER_URL:
+            print(f"Usando servidor simulado de proveedores: {FAKE_PROVIDER_URL}")
+
+        # Configurar Gemini (múltiples claves para rotación)
+        if GENAI_AVAILABLE:
+            for i, key in enumerate(GEMINI_API_KEYS):
+                try:
+                    client = self._create_gemini_client(key)
+                    self.gemini_clients.append(client)
+                    print(f"Gemini (Key {i+1}) configurado correctamente")
+                except Exception as e:
+                    print(f"Error configurando Gemini (Key {i+1}): {e}")
+
+        # Configurar Groq
+        if GROQ_AVAILABLE and GROQ_API_KEY:
+            try:
+                self.groq_client = self._create_groq_client(GROQ_API_KEY)
+                print("Groq (Whisper) configurado correctamente")
+            except Exception as e:
+                print(f"Error configurando Groq: {e}")
+
+    @property
+    def current_key_index(self):
+        with self._key_lock:
+            return self._current_key_index
+
+    @current_key_index.setter
+    def current_key_index(self, value):
+        with self._key_lock:
+            self._current_key_index = value
+
+    def warm_up(self):
+        """Abre (o refresca) las conexiones con una petición autenticada ligera.
+
+        Se lanza en segundo plano al empezar a dictar, de modo que DNS, TCP y
+        TLS se resuelven mientras el radiólogo habla y no al enviar el audio.
+        """
+        self._warm_provider('groq', lambda: self.groq_client.with_options(max_retries=0).models.list()
+                           if self.groq_client else None)
+        if self.gemini_clients:
+            client = self.gemini_clients[self.current_key_index % len(self.gemini_clients)]
+            self._warm_provider('gemini', lambda: client.models.get(model=GEMINI_MODELS[0]))
+
+    def _warm_provider(self, provider, request):
+        if self.stats.is_warm(provider, WARMUP_MAX_IDLE):
+            return
+        start = time.perf_counter()
+        self.stats.set_warming(True)
+        try:
+            if request() is None:
+                return
+            self.stats.mark_warmed(provider)
+            print(f"Conexión {provider} precalentada en {(time.perf_counter() - start) * 1000:.0f} ms")
+        except Exception as e:
+            print(f"No se pudo precalentar {provider}: {e}")
+        finally:
+            self.stats.set_warming(False)
+
+    def _http_client_args(self, provider):
+        """Argumentos de httpx: pool keep-alive y medición de reutilización"""
+        if not HTTPX_AVAILABLE:
+            return {}
+        return {
+            'limits': httpx.Limits(max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                                   keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+            'event_hooks': {'request': [self.stats.request_hook(provider)],
+                            'response': [self.stats.response_hook(provider)]},
+        }
+
+    def _create_gemini_client(self, api_key):
+        client_args = self._http_client_args('gemini')
+        base_url = {'base_url': FAKE_PROVIDER_URL} if FAKE_PROVIDER_URL else {}
+        if client_args:
+            try:
+                return genai.Client(api_key=api_key,
+                                    http_options=genai_types.HttpOptions(client_args=client_args, **base_url))
+            except Exception as e:
+                # Versiones antiguas del SDK no aceptan client_args
+                print(f"Gemini sin pool personalizado: {e}")
+        if base_url:
+            return genai.Client(api_key=api_key, http_options=genai_types.HttpOptions(**base_url))
+        return genai.Client(api_key=api_key)
+
+    def _create_groq_client(self, api_key):
+        client_args = self._http_client_args('groq')
+        # Sin base_url el SDK usa GROQ_BASE_URL o la URL oficial
+        base_url = {'base_url': FAKE_PROVIDER_URL} if FAKE_PROVIDER_URL else {}
+        if client_args:
+            http_client_cls = getattr(groq, 'DefaultHttpxClient', httpx.Client)
+            return groq.Groq(api_key=api_key, http_client=http_client_cls(**client_args), **base_url)
+        return groq.Groq(api_key=api_key, **base_url)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_provider_registry():
+    """Devuelve el registro de clientes compartido (se crea la primera vez)"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ProviderRegistry()
+        return _registry
@@ -0,0 +1,135 @@
+# Módulo de enrutado adaptativo entre proveedores de transcripción
+import os
+import threading
+import time
+from local_transcriber import audio_duration
+from config import (ROUTING_EWMA_ALPHA, ROUTING_LATENCY_PRIORS, ROUTING_COST_PER_AUDIO_SECOND,
+                    ROUTING_COST_WEIGHT, ROUTING_FAILURE_PENALTY, ROUTING_STALE_AFTER,
+                    ROUTING_MIN_SAMPLES)
+
+# Tramos de duración: la latencia de cada proveedor escala distinto con el audio
+DURATION_BUCKETS = [('corto', 30), ('medio', 120), ('largo', None)]
+
+
+def duration_bucket(seconds):
+    for name, limit in DURATION_BUCKETS:
+        if limit is None or seconds <= limit:
+            return name
+    return DURATION_BUCKETS[-1][0]
+
+
+def estimate_duration(audio_file_path):
+    """Duración del audio: exacta para WAV, estimada por tamaño para el resto
+    (WebM/Opus a 32 kbps ~ 4 KB por segundo)"""
+    duration = audio_duration(audio_file_path)
+    if duration is not None:
+        return duration
+    try:
+        return os.path.getsize(audio_file_path) / 4000.0
+    except OSError:
+        return 0.0
+
+
+class ProviderEstimate:
+    """Medias móviles exponenciales (EWMA) de un proveedor en un tramo"""
+    def __init__(self, latency, cost_per_second=0.0):
+        self.latency = latency
+        self.success_rate = 1.0
+        self.cost_per_second = cost_per_second
+        self.samples = 0
+        self.updated_at = 0.0
+
+    def update(self, alpha, latency, success, cost_per_second):
+        self.samples += 1
+        self.updated_at = time.time()
+        self.success_rate += alpha * ((1.0 if success else 0.0) - self.success_rate)
+        if success:
+            # La latencia de un fallo no representa la de una transcripción
+            self.latency += alpha * (latency - self.latency)
+            self.cost_per_second += alpha * (cost_per_second - self.cost_per_second)
+
+
+class ProviderRouter:
+    """Elige el orden de proveedores para cada dictado según lo observado.
+
+    Para cada proveedor y tramo de duración guarda la EWMA de latencia, la
+    tasa de éxito y el coste por segundo de audio (por modelo, ya que Gemini
+    puede acabar respondiendo con un modelo de reserva). La puntuación de
+    cada proveedor es la latencia esperada más una penalización por la
+    probabilidad de fallo y por el coste; gana la menor. Con pocas muestras
+    o estadísticas antiguas se usa la latencia a priori de config.py, lo que
+    hace que un proveedor lento a una hora vuelva a probarse más tarde.
+    """
+    def __init__(self, alpha=ROUTING_EWMA_ALPHA):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._estimates = {}  # (proveedor, tramo) -> ProviderEstimate
+        self._models = {}  # (proveedor, modelo) -> ProviderEstimate
+        self.last_route = None
+
+    def _estimate(self, table, key, prior, cost):
+        if key not in table:
+            table[key] = ProviderEstimate(prior, cost)
+        return table[key]
+
+    def _prior(self, provider, bucket):
+        return ROUTING_LATENCY_PRIORS.get(provider, {}).get(bucket, 10.0)
+
+    def _cost(self, provider, model=None):
+        """Coste por segundo de audio del modelo (o del modelo principal del proveedor)"""
+        return ROUTING_COST_PER_AUDIO_SECOND.get(model, ROUTING_COST_PER_AUDIO_SECOND.get(provider, 0.0))
+
+    def expected_latency(self, provider, duration):
+        """Latencia esperada (s) y si procede de datos observados"""
+        bucket = duration_bucket(duration)
+        with self._lock:
+            estimate = self._estimates.get((provider, bucket))
+            if (estimate is None or estimate.samples < ROUTING_MIN_SAMPLES
+                    or time.time() - estimate.updated_at > ROUTING_STALE_AFTER):
+                return self._prior(provider, bucket), False
+            return estimate.latency, True
+
+    def score(self, provider, duration):
+        """Puntuación en segundos equivalentes (menor es mejor)"""
+        latency, observed = self.expected_latency(provider, duration)
+        with self._lock:
+            estimate = self._estimates.get((provider, duration_bucket(duration)))
+            if estimate and observed:
+                success_rate, cost_per_second = estimate.success_rate, estimate.cost_per_second
+            else:
+                success_rate, cost_per_second = 1.0, self._cost(provider)
+        return (latency + (1.0 - success_rate) * ROUTING_FAILURE_PENALTY
+                + cost_per_second * duration * ROUTING_COST_WEIGHT)
+
+    def order(self, providers, audio_file_path):
+        """Ordena los proveedores disponibles para este audio.
+        Returns: (orden, duración, descripción para la barra de estado)
+        """
+        duration = estimate_duration(audio_file_path)
+        scored = sorted(providers, key=lambda name: self.score(name, duration))
+        latency, observed = self.expected_latency(scored[0], duration) if scored else (0, False)
+        description = (f"Auto: {' → '.join(scored)} (audio {duration:.0f}s, "
+                       f"~{latency:.1f}s {'medido' if observed else 'estimado'})")
+        self.last_route = description
+        print(f"Enrutado de transcripción: {description}")
+        return scored, duration, description
+
+    def record(self, provider, model, duration, latency, success):
+        """Registra el resultado de un intento de transcripción"""
+        cost = self._cost(provider, model)
+        bucket = duration_bucket(duration)
+        with self._lock:
+            self._estimate(self._estimates, (provider, bucket), self._prior(provider, bucket),
+                           cost).update(self.alpha, latency, success, cost)
+            if model and success:
+                self._estimate(self._models, (provider, model), latency, cost).update(
+                    self.alpha, latency, success, cost)
+
+    def summary(self):
+        """Estado de las estimaciones por proveedor/modelo (para los logs)"""
+        with self._lock:
+            parts = [f"{provider}[{bucket}]: {e.latency:.1f}s, éxito {e.success_rate:.0%}, n={e.samples}"
+                     for (provider, bucket), e in sorted(self._estimates.items())]
+            parts += [f"{provider}/{model}: {e.latency:.1f}s, n={e.samples}"
+                      for (provider, model), e in sorted(self._models.items())]
+        return '; '.join(parts) if parts else "Sin datos de enrutado todavía"
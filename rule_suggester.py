@@ -0,0 +1,100 @@
+# Módulo de sugerencia de reglas de vocabulario (palabras cercanas a una corrección conocida)
+import re
+import threading
+from collections import OrderedDict
+from config import RULE_SUGGEST_MAX_DISTANCE, RULE_SUGGEST_MIN_LENGTH, RULE_SUGGEST_LONG_WORD_LENGTH
+from spell_checker import SpellChecker, get_spell_checker
+from vocab_matcher import normalize_key, vocabulary_cache_key
+
+_WORD = re.compile(r'[^\W\d_]+(?:-[^\W\d_]+)*')
+
+
+def correct_forms(vocabulary):
+    """Formas correctas del vocabulario que se indexan: cada palabra y cada
+    corrección de dos palabras. Las siglas conservan las mayúsculas; el
+    resto va en minúsculas porque la mayúscula suele ser de principio de
+    frase."""
+    forms = []
+    for value in vocabulary.values():
+        words = _WORD.findall(value)
+        for word in words:
+            if len(word) >= RULE_SUGGEST_MIN_LENGTH:
+                forms.append(word if word.isupper() else word.lower())
+        if len(words) == 2:
+            forms.append(' '.join(words) if value.isupper() else ' '.join(words).lower())
+    return forms
+
+
+class RuleSuggester:
+    """Propone reglas de vocabulario a partir de un dictado.
+
+    Indexa las formas correctas del vocabulario en el mismo índice de
+    borrados que el corrector ortográfico (ver SpellChecker; un árbol BK en
+    Python puro recorre casi todos sus nodos con cada consulta) y busca cada
+    palabra desconocida del texto (ni del léxico ni ya cubierta por una
+    regla) y cada pareja de palabras vecinas, para los errores que parten o
+    juntan una palabra ("esplenomesen terico"). Sugiere una regla cuando hay
+    una única forma correcta a la menor distancia: 1 edición, o
+    RULE_SUGGEST_MAX_DISTANCE en textos de más de
+    RULE_SUGGEST_LONG_WORD_LENGTH letras, sin contar tildes.
+    """
+    def __init__(self, vocabulary):
+        self.index = SpellChecker(correct_forms(vocabulary), max_distance=RULE_SUGGEST_MAX_DISTANCE,
+                                  long_word_length=RULE_SUGGEST_LONG_WORD_LENGTH)
+        self._rule_keys = {normalize_key(key) for key in vocabulary}
+        self._checker = get_spell_checker(vocabulary)
+
+    def suggest(self, text):
+        """Reglas propuestas para un texto, sin repetir.
+        Returns: lista de {'incorrect', 'correct', 'count'}
+        """
+        words = _WORD.findall(text)
+        unknown = [not self._checker.is_known(word) for word in words]
+        suggestions = OrderedDict()
+
+        def consider(candidate):
+            key = candidate.lower()
+            if key in suggestions:
+                suggestions[key]['count'] += 1
+                return True
+            if normalize_key(key) in self._rule_keys:
+                return False
+            correct = self.index.suggest(key)
+            if correct is None:
+                return False
+            suggestions[key] = {'incorrect': key, 'correct': correct, 'count': 1}
+            return True
+
+        skip_next = False
+        for i, word in enumerate(words):
+            if skip_next:
+                skip_next = False
+                continue
+            # Pareja con alguna palabra desconocida (palabra partida o corrección de dos palabras)
+            if i + 1 < len(words) and (unknown[i] or unknown[i + 1]) and consider(f"{word} {words[i + 1]}"):
+                skip_next = True
+                continue
+            if unknown[i] and len(word) >= RULE_SUGGEST_MIN_LENGTH:
+                consider(word)
+        return list(suggestions.values())
+
+
+_suggesters = OrderedDict()  # versión del vocabulario -> RuleSuggester
+_suggesters_lock = threading.Lock()
+_MAX_CACHED_SUGGESTERS = 2
+
+
+def suggest_rules(text, vocabulary):
+    """Reglas propuestas para un dictado con el vocabulario actual (índice construido una vez por versión)"""
+    fingerprint = vocabulary_cache_key(vocabulary)
+    with _suggesters_lock:
+        suggester = _suggesters.get(fingerprint)
+        if suggester is not None:
+            _suggesters.move_to_end(fingerprint)
+    if suggester is None:
+        suggester = RuleSuggester(vocabulary)
+        with _suggesters_lock:
+            _suggesters[fingerprint] = suggester
+            while len(_suggesters) > _MAX_CACHED_SUGGESTERS:
+                _suggesters.popitem(last=False)
+    return suggester.suggest(text)
@@ -0,0 +1,263 @@
+# Módulo de corrección ortográfica local (índice de borrados al estilo SymSpell)
+import re
+import threading
+from collections import Counter, OrderedDict
+from config import (SPELLCHECK_LEXICON_FILE, SPELLCHECK_MAX_DISTANCE, SPELLCHECK_PREFIX_LENGTH,
+                    SPELLCHECK_MIN_WORD_LENGTH, SPELLCHECK_LONG_WORD_LENGTH, TECNICAS, ANATOMICAL_CATEGORIES)
+from vocab_matcher import normalize_key
+
+# Palabras (letras, con guiones internos como en BI-RADS o intra-abdominal)
+_WORD = re.compile(r'[^\W\d_]+(?:-[^\W\d_]+)*')
+
+
+def _strip(word):
+    """Palabra en minúsculas sin tildes (la ñ se mantiene)"""
+    return normalize_key(word, strip_accents=True)
+
+
+def damerau_distance(a, b, max_distance):
+    """Distancia de edición con transposiciones de letras vecinas (OSA).
+    Deja de calcular en cuanto supera max_distance y devuelve max_distance + 1."""
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # El prefijo y el sufijo comunes no cambian la distancia (una errata suele tocar una sola zona)
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return min(len(a) + len(b), max_distance + 1)
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before_previous[j - 2] + 1)
+            current[j] = value
+        if min(current) > max_distance:
+            return max_distance + 1
+        before_previous, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+def inflections(word):
+    """Plurales y femeninos regulares de una palabra en minúsculas"""
+    if word.endswith('o'):
+        return [word[:-1] + 'a', word + 's', word[:-1] + 'as']
+    if word.endswith(('a', 'e', 'é')):
+        return [word + 's']
+    if word.endswith(('ón', 'ín', 'án')):
+        stem = word[:-2] + {'ó': 'o', 'í': 'i', 'á': 'a'}[word[-2]] + word[-1]
+        return [stem + 'es']
+    if word.endswith('z'):
+        return [word[:-1] + 'ces']
+    if word.endswith(('l', 'n', 'r', 'd')):
+        return [word + 'es']
+    return []
+
+
+def load_lexicon(path=SPELLCHECK_LEXICON_FILE):
+    """Palabras del léxico de radiología (sin plurales ni femeninos regulares, ver inflections)"""
+    words = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                word = line.strip()
+                if not word or word.startswith('#'):
+                    continue
+                words.append(word)
+    except OSError as e:
+        print(f"Léxico de radiología no disponible ({e}), solo se usarán los textos de la aplicación")
+    return words
+
+
+def reference_words(vocabulary=None):
+    """Palabras de los textos de la aplicación (técnicas, frases normales del
+    Juanizador) y de las correcciones del vocabulario del usuario. Las siglas
+    conservan las mayúsculas; el resto se guarda en minúsculas porque la
+    mayúscula suele ser solo de principio de frase."""
+    texts = list(TECNICAS.values())
+    texts += [category['normal'] for category in ANATOMICAL_CATEGORIES if category['normal']]
+    if vocabulary:
+        texts += list(vocabulary.values())
+    words = []
+    for text in texts:
+        for word in _WORD.findall(text):
+            words.append(word if word.isupper() and len(word) > 1 else word.lower())
+    return words
+
+
+class SpellChecker:
+    """Corrector ortográfico offline para informes de radiología.
+
+    Índice de borrados al estilo SymSpell: al construirlo se guardan todas
+    las variantes de cada palabra (de sus primeros `prefix_length`
+    caracteres) con hasta `max_distance` letras borradas. Buscar una palabra
+    es generar sus propias variantes y cruzarlas con el índice, así que el
+    coste no depende del tamaño del léxico; los candidatos se confirman con
+    la distancia de edición real. Índice y distancia ignoran las tildes: una
+    tilde que falta ("higado") no gasta edición, y entre candidatos
+    equivalentes decide la distancia con tildes y luego la frecuencia.
+
+    Es conservador porque el léxico no cubre todo el español: solo corrige
+    palabras desconocidas de al menos SPELLCHECK_MIN_WORD_LENGTH letras con
+    un candidato claro (a 1 edición, o a 2 en palabras de más de
+    `long_word_length` letras). En palabras conocidas solo corrige
+    la capitalización de siglas y nombres propios (tac -> TAC).
+    """
+    def __init__(self, words, max_distance=SPELLCHECK_MAX_DISTANCE, prefix_length=SPELLCHECK_PREFIX_LENGTH,
+                 long_word_length=SPELLCHECK_LONG_WORD_LENGTH):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.long_word_length = long_word_length
+        self._forms = {}  # palabra en minúsculas -> forma correcta (con mayúsculas si es sigla o nombre propio)
+        self._frequency = Counter()  # palabra en minúsculas -> apariciones en léxico y textos
+        self._deletes = {}  # variante sin tildes con borrados -> palabras en minúsculas
+        self._unaccented = {}  # palabra sin tildes -> primera palabra en minúsculas registrada
+        for word in words:
+            self.add_word(word)
+
+    def __len__(self):
+        return len(self._forms)
+
+    def is_known(self, word):
+        """True si la palabra está en el léxico (sin importar mayúsculas)"""
+        return word.lower() in self._forms
+
+    def add_word(self, word, accent_variants=True):
+        """Añade una palabra al léxico (la primera capitalización vista es la correcta).
+        Con accent_variants=False no se admite como correcta una palabra que ya
+        está registrada con otras tildes: cuenta como uso de la registrada."""
+        key = word.lower()
+        stripped = _strip(key)
+        if not accent_variants and key not in self._forms and stripped in self._unaccented:
+            key = self._unaccented[stripped]
+        self._frequency[key] += 1
+        if key in self._forms:
+            return
+        self._forms[key] = word
+        self._unaccented.setdefault(stripped, key)
+        for variant in self._variants(stripped[:self.prefix_length], self.max_distance):
+            self._deletes.setdefault(variant, []).append(key)
+
+    @staticmethod
+    def _variants(word, max_distance):
+        """La palabra y todas sus variantes con hasta max_distance letras borradas"""
+        variants = {word}
+        frontier = {word}
+        for _ in range(max_distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+            variants |= frontier
+        return variants
+
+    def _max_distance_for(self, key):
+        return self.max_distance if len(key) > self.long_word_length else min(1, self.max_distance)
+
+    def lookup(self, word):
+        """Candidatos del léxico para una palabra, del mejor al peor.
+        Returns: lista de (forma, distancia)
+        """
+        key = word.lower()
+        if key in self._forms:
+            return [(self._forms[key], 0)]
+        stripped = _strip(key)
+        max_distance = self._max_distance_for(key)
+        candidates = set()
+        for variant in self._variants(stripped[:self.prefix_length], max_distance):
+            candidates.update(self._deletes.get(variant, ()))
+        found = []
+        for candidate in candidates:
+            distance = damerau_distance(stripped, _strip(candidate), max_distance)
+            if distance <= max_distance:
+                found.append((candidate, distance))
+        if len(found) > 1:
+            found.sort(key=lambda item: self._rank(key, *item))
+        return [(self._forms[candidate], distance) for candidate, distance in found]
+
+    def _rank(self, key, candidate, distance):
+        """Orden de los candidatos: distancia sin tildes, distancia con tildes, frecuencia"""
+        return distance, damerau_distance(key, candidate, distance + 2), -self._frequency[candidate]
+
+    def suggest(self, word):
+        """Corrección de una palabra, o None si está bien o no hay un candidato claro"""
+        key = word.lower()
+        form = self._forms.get(key)
+        if form is not None:
+            # Conocida: solo siglas y nombres propios mal capitalizados
+            if form != key and word != form and not (word.isupper() and not form.isupper()):
+                return form
+            return None
+        if len(key) < SPELLCHECK_MIN_WORD_LENGTH:
+            return None
+        candidates = self.lookup(key)
+        if not candidates:
+            return None
+        if len(candidates) > 1:
+            best = self._rank(key, candidates[0][0].lower(), candidates[0][1])
+            if self._rank(key, candidates[1][0].lower(), candidates[1][1]) == best:
+                return None  # empate: mejor que lo decida el usuario o la IA
+        return self._match_case(word, candidates[0][0])
+
+    @staticmethod
+    def _match_case(word, form):
+        """Aplica a la corrección las mayúsculas de lo escrito (salvo siglas y nombres propios)"""
+        if form != form.lower():
+            return form
+        if word.isupper() and len(word) > 1:
+            return form.upper()
+        if word[0].isupper():
+            return form[0].upper() + form[1:]
+        return form
+
+    def correct_text(self, text):
+        """Corrige todas las palabras del texto sin tocar espacios ni puntuación.
+        Returns: (texto corregido, lista de (original, corrección))
+        """
+        changes = []
+
+        def replace(match):
+            word = match.group(0)
+            fixed = self.suggest(word)
+            if fixed is None or fixed == word:
+                return word
+            changes.append((word, fixed))
+            return fixed
+
+        return _WORD.sub(replace, text), changes
+
+
+_lexicon = None
+_checkers = OrderedDict()  # correcciones del vocabulario (frozenset) -> SpellChecker
+_checkers_lock = threading.Lock()
+_MAX_CACHED_CHECKERS = 2
+
+
+def get_spell_checker(vocabulary=None):
+    """Corrector con el léxico y las correcciones del vocabulario, construido una vez por versión"""
+    global _lexicon
+    fingerprint = frozenset((vocabulary or {}).values())
+    with _checkers_lock:
+        checker = _checkers.get(fingerprint)
+        if checker is not None:
+            _checkers.move_to_end(fingerprint)
+            return checker
+        if _lexicon is None:
+            _lexicon = load_lexicon()
+        lexicon = _lexicon
+    checker = SpellChecker(lexicon)
+    generated = [inflected for word in lexicon if word.islower() for inflected in inflections(word)]
+    for word in generated + reference_words(vocabulary):
+        checker.add_word(word, accent_variants=False)
+    with _checkers_lock:
+        _checkers[fingerprint] = checker
+        while len(_checkers) > _MAX_CACHED_CHECKERS:
+            _checkers.popitem(last=False)
+    return checker
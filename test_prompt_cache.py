@@ -0,0 +1,113 @@
+# Pruebas de la caché de prompts de Gemini (context caching) contra el servidor simulado
+#
+# Uso: python -m pytest test_prompt_cache.py   (o python -m unittest test_prompt_cache)
+#
+# Los prompts reales aún no llegan al mínimo de tokens del modelo, así que
+# estas pruebas usan uno largo para recorrer creación, reutilización y caducidad.
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fake_provider_server import start_test_server
+
+# El servidor se levanta antes de importar config/transcription: la URL se lee al importar
+_config = start_test_server()
+
+from config import PROMPT_CACHE_REFRESH_MARGIN  # noqa: E402
+from transcription import TranscriptionService  # noqa: E402
+
+MODEL = 'gemini-2.5-flash'
+
+
+def _large_prompt(name):
+    """Instrucción por encima del mínimo de tokens de caché (distinta en cada prueba)"""
+    return f"Instrucciones de la prueba {name}.\n" + "Transcribe literalmente el dictado radiológico. " * 120
+
+
+class GeminiPromptCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.service = TranscriptionService(cache=False)
+        cls.prompt_cache = cls.service.prompt_cache
+        cls.client = cls.service.gemini_clients[0]
+
+    def _count(self, key):
+        return _config.counters.get(key, 0)
+
+    def _get(self, prompt):
+        return self.prompt_cache.get(self.client, 0, MODEL, prompt, 'prueba')
+
+    def _set_expiry(self, prompt, expires_at):
+        cache_key = (0, MODEL, self.prompt_cache.prompt_key(prompt))
+        with self.prompt_cache._lock:
+            name, _ = self.prompt_cache._caches[cache_key]
+            self.prompt_cache._caches[cache_key] = (name, expires_at)
+
+    def test_small_prompt_is_sent_inline(self):
+        creates = self._count('gemini_cache_create')
+        self.assertIsNone(self._get("Transcribe el dictado."))
+        self.assertEqual(self._count('gemini_cache_create'), creates)
+
+    def test_large_prompt_is_created_once_and_reused(self):
+        prompt = _large_prompt('reutilizacion')
+        creates, generates = self._count('gemini_cache_create'), self._count('gemini_generate')
+        for findings in ("Hígado normal.", "Bazo normal."):
+            text, error = self.service.transcribe_text(findings, system_instruction=prompt, label='prueba')
+            self.assertIsNone(error)
+            self.assertEqual(text, findings)
+        self.assertEqual(self._count('gemini_cache_create'), creates + 1)
+        self.assertEqual(self._count('gemini_generate'), generates + 2)
+        self.assertEqual(self._get(prompt), self._get(prompt))
+
+    def test_concurrent_requests_create_a_single_cache(self):
+        prompt = _large_prompt('concurrencia')
+        creates = self._count('gemini_cache_create')
+        names = []
+        threads = [threading.Thread(target=lambda: names.append(self._get(prompt))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self._count('gemini_cache_create'), creates + 1)
+        self.assertEqual(len(set(names)), 1)
+        self.assertIsNotNone(names[0])
+
+    def test_extends_ttl_close_to_expiry(self):
+        prompt = _large_prompt('renovacion')
+        name = self._get(prompt)
+        self._set_expiry(prompt, time.time() + PROMPT_CACHE_REFRESH_MARGIN / 2)
+        creates, updates = self._count('gemini_cache_create'), self._count('gemini_cache_update')
+        self.assertEqual(self._get(prompt), name)
+        self.assertEqual(self._count('gemini_cache_update'), updates + 1)
+        self.assertEqual(self._count('gemini_cache_create'), creates)
+
+    def test_recreates_after_expiry(self):
+        prompt = _large_prompt('caducidad')
+        name = self._get(prompt)
+        self._set_expiry(prompt, time.time() - 1)
+        creates = self._count('gemini_cache_create')
+        self.assertNotEqual(self._get(prompt), name)
+        self.assertEqual(self._count('gemini_cache_create'), creates + 1)
+
+    def test_cache_lost_on_server_falls_back_inline(self):
+        prompt = _large_prompt('perdida')
+        name = self._get(prompt)
+        _config.cached_contents.discard(name)
+        misses = self._count('gemini_cache_miss')
+        text, error = self.service.transcribe_text("Riñones normales.", system_instruction=prompt, label='prueba')
+        self.assertIsNone(error)
+        self.assertEqual(text, "Riñones normales.")
+        self.assertEqual(self._count('gemini_cache_miss'), misses + 1)
+        self.assertNotEqual(self._get(prompt), name)
+
+    def test_creation_failure_is_remembered(self):
+        prompt = _large_prompt('fallo')
+        with mock.patch.object(self.client.caches, 'create', side_effect=RuntimeError('rechazada')) as create:
+            self.assertIsNone(self._get(prompt))
+            self.assertIsNone(self._get(prompt))
+        self.assertEqual(create.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+# Pruebas de la cola persistente de dictados contra el servidor simulado de proveedores
+#
+# Uso: python -m pytest test_transcription_queue.py   (o python -m unittest test_transcription_queue)
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import groq
+import httpx
+from google.genai import errors as genai_errors
+
+from fake_provider_server import start_test_server, make_test_wav
+
+# El servidor se levanta antes de importar config/transcription: la URL se lee al importar
+_config = start_test_server()
+
+from transcription import TranscriptionService  # noqa: E402
+from provider_clients import ProviderError  # noqa: E402
+from transcription_queue import TranscriptionQueue, is_retryable_error  # noqa: E402
+
+
+def _wait_for(condition, timeout=20):
+    end = time.time() + timeout
+    while time.time() < end:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@mock.patch('transcription_queue.TRANSCRIPTION_QUEUE_BACKOFF_BASE', 0.05)
+@mock.patch('transcription_queue.TRANSCRIPTION_QUEUE_BACKOFF_MAX', 0.2)
+class TranscriptionQueueTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.service = TranscriptionService(cache=False)
+
+    def setUp(self):
+        _config.error_5xx = 0.0
+        self.spool_dir = tempfile.mkdtemp(prefix='cola_dictados_')
+        self.audio_file = make_test_wav(1)
+        self.queues = []
+
+    def tearDown(self):
+        for queue in self.queues:
+            queue.stop()
+        os.remove(self.audio_file)
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def _queue(self, **kwargs):
+        queue = TranscriptionQueue(self.service, spool_dir=self.spool_dir, **kwargs)
+        self.queues.append(queue)
+        return queue
+
+    def _job(self, queue, job_id):
+        with queue._lock:
+            return queue._conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+
+    def test_enqueue_copies_audio_and_schedules_backoff(self):
+        queue = self._queue()
+        before = time.time()
+        job_id = queue.enqueue(self.audio_file, 'Groq', {'report_id': 'informe-1'})
+        job = self._job(queue, job_id)
+        self.assertEqual(job['status'], 'pending')
+        self.assertTrue(os.path.exists(job['audio_path']))
+        self.assertNotEqual(job['audio_path'], self.audio_file)
+        self.assertGreater(job['next_attempt_at'], before)
+        self.assertEqual(queue.pending_count(), 1)
+
+    def test_backoff_grows_and_is_capped(self):
+        queue = self._queue()
+        delays = [queue._backoff(attempts) for attempts in range(1, 8)]
+        self.assertLess(delays[0], delays[2])
+        self.assertTrue(all(delay <= 0.2 * 1.2 for delay in delays))
+
+    def test_retries_until_provider_recovers(self):
+        _config.error_5xx = 1.0
+        queue = self._queue(max_attempts=50)
+        delivered = []
+        queue.on_complete = lambda job, text: delivered.append((job['id'], text))
+        job_id = queue.enqueue(self.audio_file, 'Groq')
+        queue.start()
+        self.assertTrue(_wait_for(lambda: self._job(queue, job_id)['attempts'] >= 1))
+        _config.error_5xx = 0.0
+        self.assertTrue(_wait_for(lambda: delivered))
+        self.assertEqual(delivered[0][0], job_id)
+        self.assertTrue(delivered[0][1])
+        audio_path = self._job(queue, job_id)['audio_path']
+        queue.mark_delivered(job_id)
+        self.assertIsNone(self._job(queue, job_id))
+        self.assertFalse(os.path.exists(audio_path))
+
+    def test_recovers_jobs_after_restart(self):
+        queue = self._queue()
+        running_id = queue.enqueue(self.audio_file, 'Groq')
+        done_id = queue.enqueue(self.audio_file, 'Groq')
+        with queue._lock:
+            # Cierre a mitad: uno en curso y otro terminado pero sin entregar
+            queue._conn.execute("UPDATE jobs SET status='running' WHERE id=?", (running_id,))
+            queue._conn.execute("UPDATE jobs SET status='done', result='texto' WHERE id=?", (done_id,))
+            queue._conn.commit()
+        queue.stop()
+
+        restarted = self._queue()
+        self.assertEqual(self._job(restarted, running_id)['status'], 'pending')
+        delivered = {}
+        restarted.on_complete = lambda job, text: delivered.setdefault(job['id'], text)
+        restarted.start()
+        self.assertEqual(delivered.get(done_id), 'texto')
+        self.assertTrue(_wait_for(lambda: running_id in delivered))
+
+    def test_start_prunes_old_failed_jobs(self):
+        queue = self._queue()
+        old_id = queue.enqueue(self.audio_file, 'Groq')
+        recent_id = queue.enqueue(self.audio_file, 'Groq')
+        with queue._lock:
+            queue._conn.execute("UPDATE jobs SET status='failed', created_at=? WHERE id=?",
+                                (time.time() - 30 * 24 * 3600, old_id))
+            queue._conn.execute("UPDATE jobs SET status='failed' WHERE id=?", (recent_id,))
+            queue._conn.commit()
+        queue.start()
+        self.assertIsNone(self._job(queue, old_id))
+        self.assertEqual(self._job(queue, recent_id)['status'], 'failed')
+
+    def test_fails_for_good_and_removes_audio(self):
+        _config.error_5xx = 1.0
+        queue = self._queue(max_attempts=2)
+        failed = []
+        queue.on_failed = lambda job, error: failed.append((job['id'], error))
+        job_id = queue.enqueue(self.audio_file, 'Groq')
+        audio_path = self._job(queue, job_id)['audio_path']
+        queue.start()
+        self.assertTrue(_wait_for(lambda: failed))
+        self.assertEqual(failed[0][0], job_id)
+        self.assertTrue(is_retryable_error(failed[0][1]))
+        job = self._job(queue, job_id)
+        self.assertEqual((job['status'], job['attempts']), ('failed', 2))
+        self.assertFalse(os.path.exists(audio_path))
+
+    def test_non_retryable_error_fails_at_once(self):
+        queue = self._queue(max_attempts=10)
+        failed = []
+        queue.on_failed = lambda job, error: failed.append(error)
+        text_file = os.path.join(self.spool_dir, 'nota.txt')
+        with open(text_file, 'w', encoding='utf-8') as f:
+            f.write('no es audio')
+        job_id = queue.enqueue(text_file, 'Groq')
+        with mock.patch.object(self.service, 'transcribe_audio',
+                               return_value=(None, text_file, "Archivo no es audio: nota.txt")):
+            queue.start()
+            self.assertTrue(_wait_for(lambda: failed))
+        self.assertEqual(self._job(queue, job_id)['attempts'], 1)
+        self.assertFalse(is_retryable_error(failed[0]))
+
+    def test_retryable_error_classification(self):
+        request = httpx.Request('POST', 'https://api.groq.com/openai/v1/audio/transcriptions')
+
+        def status_error(code):
+            return groq.APIStatusError('error', response=httpx.Response(code, request=request), body=None)
+
+        self.assertTrue(is_retryable_error(ProviderError.from_exception(status_error(503))))
+        self.assertTrue(is_retryable_error(ProviderError.from_exception(status_error(429))))
+        self.assertFalse(is_retryable_error(ProviderError.from_exception(status_error(401))))
+        self.assertTrue(is_retryable_error(ProviderError.from_exception(httpx.ConnectError('refused'))))
+        self.assertTrue(is_retryable_error(ProviderError.from_exception(groq.APITimeoutError(request))))
+        self.assertTrue(is_retryable_error(ProviderError.from_exception(genai_errors.ServerError(502, {}))))
+        self.assertFalse(is_retryable_error(ProviderError.from_exception(genai_errors.ClientError(400, {}))))
+        # El texto del mensaje no cuenta: solo el tipo de excepción o el código HTTP
+        self.assertFalse(is_retryable_error(ProviderError.from_exception(ValueError("tardó 1500 ms"))))
+        self.assertFalse(is_retryable_error("connection refused: invalid API key"))
+        self.assertFalse(is_retryable_error("Error code: 503 - Service Unavailable"))
+        self.assertFalse(is_retryable_error(None))
+
+if __name__ == '__main__':
+    unittest.main()
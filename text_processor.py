@@ -1,27 +1,110 @@
 # Módulo de procesamiento de texto
+#
+# Comprobación del motor fusionado: python text_processor.py [--corpus corpus_referencia_texto.jsonl]
+import argparse
+import json
 import re
+import time
+import tracemalloc
+from functools import lru_cache
+from vocab_matcher import VocabularyMatcher, get_vocabulary_matcher
+from number_normalizer import normalize_measurements
+from config import TEXT_ENGINE, TEXT_GOLDEN_CORPUS, TEXT_NORMALIZE_MEASUREMENTS, PUNCTUATION_COMMANDS
+
+# Tramo de signos que la limpieza de puntuación funde en una sola marca
+# (con los espacios de delante, que se eliminan, y los de detrás)
+_PUNCTUATION_RUN = re.compile(r'\s*[.,:;!?\n][\s.,:;!?\n]*')
+# Letras tras las que se inserta un espacio después de un signo
+_LETTERS_AFTER_PUNCTUATION = re.compile(r'[a-zA-ZáéíóúüñÁÉÍÓÚÑ]')
+# Motor fusionado: mayúsculas erróneas tras separador y minúsculas tras fin de frase
+_FUSED_CAPS = re.compile(r'(?P<cap>[.!?\n]\s*[a-záéíóúüñ])|(?P<run>[\s,;]+)(?P<upper>[A-ZÁÉÍÓÚÜÑ])')
+
+
+def _digit_after_command(string, start, end):
+    """¿Al tramo de puntuación string[start:end] le sigue una cifra separada
+    por espacios, tras texto que no es una cifra ("hepáticas . 12 mm")?
+    Entonces la cifra lleva un espacio delante; entre cifras ("3,5",
+    "12 , 5") el signo se queda pegado."""
+    if end >= len(string) or not string[end].isdigit() or not string[end - 1].isspace():
+        return False
+    while start > 0 and string[start - 1].isspace():
+        start -= 1
+    return start == 0 or not string[start - 1].isdigit()
+
+
+def _unit_acronym(string, start, end):
+    """¿La mayúscula de string[start:end] empieza una unidad en siglas tras una cifra ("20 UH")?"""
+    return start > 0 and string[start - 1].isdigit() and end < len(string) and string[end].isupper()
+
+
+def _collapse_punctuation(punct):
+    """Signo que sustituye a una secuencia de puntuación (la de mayor prioridad)"""
+    if '.\n' in punct:
+        return '.\n'
+    elif '\n' in punct:
+        return '\n'
+    elif '!' in punct:
+        return '!'
+    elif '?' in punct:
+        return '?'
+    elif '.' in punct:
+        return '.'
+    elif ':' in punct:
+        return ':'
+    elif ';' in punct:
+        return ';'
+    elif ',' in punct:
+        return ','
+    return ' '
+
+
+@lru_cache(maxsize=8)
+def compile_punctuation_grammar(grammar):
+    """Compila la gramática de comandos dictados en una sola alternancia.
+    
+    `grammar` son los pares (comando, sustitución) ordenados. Las claves
+    más largas van primero en la alternancia para que "punto y aparte"
+    gane a "punto"; la sustitución se busca en una tabla por la clave en
+    minúsculas. Se cachea por contenido: solo se recompila si la gramática
+    cambia.
+    Returns: (regex, tabla)
+    """
+    table = {key.casefold(): value for key, value in grammar}
+    keys = sorted(table, key=len, reverse=True)
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(key) for key in keys) + r')\b', re.IGNORECASE)
+    return pattern, table
+
 
 class TextProcessor:
-    def __init__(self):
-        self.punctuation_map = {
-            'punto y aparte': '.\n',
-            'punto y seguido': '.',
-            'coma': ',',
-            'punto': '.',
-            'nuevalinea': '\n',
-            'nueva linea': '\n',
-            'dos puntos': ':',
-            'dospuntos': ':'
-        }
+    def __init__(self, engine=None):
+        # 'fused': motor de pocas pasadas; 'legacy': una pasada por regla
+        self.engine = engine or TEXT_ENGINE
+        self._marks = {}  # tramo de puntuación -> marca (memoria del motor fusionado)
+        # Comandos dictados; se puede modificar en caliente (la gramática se recompila sola)
+        self.punctuation_map = dict(PUNCTUATION_COMMANDS)
     
     def process_text(self, text, vocabulary=None):
         """Procesa el texto completo aplicando todas las reglas"""
         if not text:
             return ""
         
+        if self.engine == 'fused':
+            try:
+                result = self._process_text_fused(text, vocabulary)
+                if result is not None:
+                    return result
+            except Exception as e:
+                print(f"Error en el motor de texto fusionado, se usa el clásico: {e}")
+        return self._process_text_legacy(text, vocabulary)
+    
+    def _process_text_legacy(self, text, vocabulary=None):
+        """Cadena clásica: cada etapa recorre el texto completo con sus regex"""
         # 1. Limpiar artefactos
         text = self.cleanup_artifacts(text)
         
+        # 1b. Medidas dictadas a cifras (antes de que "coma" y "punto" pasen a signos)
+        text = self.normalize_measurements(text)
+        
         # 2. Aplicar reglas de puntuación
         text = self.apply_punctuation_rules(text)
         
@@ -43,6 +126,77 @@ class TextProcessor:
         
         return text.strip()
     
+    def _process_text_fused(self, text, vocabulary=None):
+        """Mismo resultado que la cadena clásica en unas pocas pasadas.
+        
+        1. Artefactos (recorte, comillas, espacios múltiples).
+        2. Medidas dictadas (transductor compilado) y comandos dictados con
+           la gramática compilada (una pasada cada uno).
+        3. Una sola regex encuentra cada tramo de signos y espacios y lo
+           sustituye por su marca, sin espacios delante y con uno detrás si
+           sigue una letra (toda la limpieza de puntuación duplicada).
+        4. Una sola regex decide las mayúsculas: minúscula tras separador sin
+           salto de línea y mayúscula tras fin de frase (fix_erroneous_caps +
+           capitalize_sentences).
+        5. Vocabulario (autómata) y paréntesis solo si hay paréntesis.
+        Returns: el texto procesado
+        """
+        text = self.apply_punctuation_rules(self.normalize_measurements(self.cleanup_artifacts(text)))
+        if not text:
+            return text
+        marks = self._marks
+        
+        def replace_run(match):
+            # Los tramos se repiten mucho (", ", ".\n "): su marca se memoriza
+            run = match.group()
+            mark = marks.get(run)
+            if mark is None:
+                mark = _collapse_punctuation(run)
+                if len(marks) < 1000:
+                    marks[run] = mark
+            end = match.end()
+            if (mark[-1] != '\n' and end < len(match.string)
+                    and (_LETTERS_AFTER_PUNCTUATION.match(match.string, end)
+                         or _digit_after_command(match.string, match.start(), end))):
+                return mark + ' '
+            return mark
+        
+        text = _PUNCTUATION_RUN.sub(replace_run, text)
+        if '  ' in text:
+            # Solo si un comando dejó espacios dobles
+            text = re.sub(r' {2,}', ' ', text)
+        text = text.strip()
+        if not text:
+            return text
+        
+        text = _FUSED_CAPS.sub(self._fused_caps, text)
+        text = text[0].upper() + text[1:]
+        
+        if vocabulary:
+            text = self.apply_vocabulary_corrections(text, vocabulary)
+        
+        if '(' in text or ')' in text:
+            text = self.normalize_parentheses_spacing(text)
+        
+        return text.strip()
+    
+    @staticmethod
+    def _fused_caps(match):
+        """Mayúscula/minúscula de una letra según lo que la precede"""
+        if match.group('cap'):
+            return match.group()[:-1] + match.group()[-1].upper()
+        run = match.group('run')
+        if '\n' in run or _unit_acronym(match.string, match.start(), match.end()):
+            return match.group()
+        # Tras el separador, ¿empieza frase? (se vuelve a capitalizar)
+        for char in reversed(run):
+            if not char.isspace():
+                return run + match.group('upper').lower()
+        start = match.start()
+        if start > 0 and match.string[start - 1] in '.!?':
+            return match.group()
+        return run + match.group('upper').lower()
+    
     def cleanup_artifacts(self, text):
         """Limpia artefactos del texto"""
         if not text:
@@ -55,55 +209,46 @@ class TextProcessor:
             text = text[1:-1].strip()
         
         # Eliminar espacios múltiples
-        text = re.sub(r' +', ' ', text)
+        text = re.sub(r' {2,}', ' ', text)
         
         return text
     
+    def normalize_measurements(self, text):
+        """Convierte las medidas dictadas a cifras y abreviaturas ("doce por ocho milímetros" -> "12 x 8 mm")"""
+        if not text or not TEXT_NORMALIZE_MEASUREMENTS:
+            return text
+        return normalize_measurements(text)
+    
     def apply_punctuation_rules(self, text):
-        """Aplica las reglas de puntuación"""
+        """Aplica las reglas de puntuación en una pasada con la gramática compilada"""
         if not text:
             return text
         
-        processed = text
-        
-        # Ordenar claves por longitud descendente para evitar reemplazos parciales
-        sorted_keys = sorted(self.punctuation_map.keys(), key=len, reverse=True)
+        pattern, table = compile_punctuation_grammar(tuple(sorted(self.punctuation_map.items())))
         
-        for key in sorted_keys:
-            # Crear regex que busca la palabra completa (case insensitive)
-            regex = re.compile(r'\b' + re.escape(key) + r'\b', re.IGNORECASE)
-            processed = regex.sub(self.punctuation_map[key], processed)
+        def replace_command(match):
+            value = table.get(match.group().casefold())
+            if value is None:
+                # IGNORECASE empareja algún carácter que casefold no iguala
+                value = next(v for k, v in table.items() if re.fullmatch(re.escape(k), match.group(), re.IGNORECASE))
+            return value
         
-        return processed
+        return pattern.sub(replace_command, text)
     
     def cleanup_double_punctuation(self, text):
         """Limpia puntuación duplicada"""
         if not text:
             return text
         
-        # Reemplazar múltiples puntuaciones seguidas
-        def replace_punctuation(match):
-            punct = match.group(1)
-            if '.\n' in punct:
-                return '.\n'
-            elif '\n' in punct:
-                return '\n'
-            elif '!' in punct:
-                return '!'
-            elif '?' in punct:
-                return '?'
-            elif '.' in punct:
-                return '.'
-            elif ':' in punct:
-                return ':'
-            elif ';' in punct:
-                return ';'
-            elif ',' in punct:
-                return ','
-            return ' '
-        
-        # Buscar secuencias de puntuación
-        text = re.sub(r'([.,:;!?\n][\s.,:;!?\n]*)', replace_punctuation, text)
+        # Buscar secuencias de puntuación y reemplazarlas por un único signo
+        def collapse(match):
+            mark = _collapse_punctuation(match.group(1))
+            # Cifra tras un comando dictado (no un decimal): se deja el espacio
+            if mark[-1] != '\n' and _digit_after_command(match.string, match.start(), match.end()):
+                return mark + ' '
+            return mark
+        
+        text = re.sub(r'([.,:;!?\n][\s.,:;!?\n]*)', collapse, text)
         
         # Eliminar espacios antes de puntuación
         text = re.sub(r'\s+([.,:;!?\n])', r'\1', text)
@@ -115,7 +260,7 @@ class TextProcessor:
         text = re.sub(r'\s*\n\s*', '\n', text)
         
         # Eliminar espacios múltiples
-        text = re.sub(r' +', ' ', text)
+        text = re.sub(r' {2,}', ' ', text)
         
         return text.strip()
     
@@ -139,6 +284,10 @@ class TextProcessor:
             # Si es un acrónimo (todo mayúsculas, >1 letra), mantener (ej: TAC, RM, HTA)
             if word.isupper() and len(word) > 1:
                 return match.group(0)
+            
+            # Unidad en siglas tras una cifra ("20 UH")
+            if _unit_acronym(match.string, match.start(), match.end()):
+                return match.group(0)
                 
             # Si viene después de dos puntos o paréntesis, solemos mantener la intención original
             if re.search(r'[:(]', prefix):
@@ -170,26 +319,47 @@ class TextProcessor:
         return text
     
     def apply_vocabulary_corrections(self, text, vocabulary):
-        """Aplica correcciones del vocabulario personalizado"""
+        """Aplica correcciones del vocabulario personalizado (una pasada con el
+        autómata compilado para esta versión del vocabulario). `vocabulary`
+        puede ser ya un VocabularyMatcher (procesado por lotes: se compila una
+        vez y no se identifica la versión en cada documento)"""
         if not text or not vocabulary:
             return text
         
-        processed = text
-        
-        # Ordenar por longitud descendente para evitar reemplazos parciales
-        sorted_keys = sorted(vocabulary.keys(), key=len, reverse=True)
-        
-        for error_key in sorted_keys:
-            correct_value = vocabulary[error_key]
-            try:
-                # Escapar caracteres especiales en la clave
-                escaped_key = re.escape(error_key)
-                regex = re.compile(r'\b' + escaped_key + r'\b', re.IGNORECASE)
-                processed = regex.sub(correct_value, processed)
-            except re.error as e:
-                print(f"Error en regex para '{error_key}': {e}")
-        
-        return processed
+        if isinstance(vocabulary, VocabularyMatcher):
+            return vocabulary.apply(text)
+        return get_vocabulary_matcher(vocabulary).apply(text)
+    
+    def join_segment(self, left, segment, right=''):
+        """Ajusta un dictado ya procesado para insertarlo entre dos textos.
+        
+        Solo se mira el final de `left` (lo que hay antes del punto de
+        inserción, '' al principio del documento) y el primer carácter de
+        `right`, así que basta con pasar una ventana de 2 y 1 caracteres.
+        - Mayúscula al principio del documento o tras fin de frase (aunque
+          haya un espacio entre medias); minúscula en mitad de frase.
+        - Espacio delante si lo anterior es una palabra y el dictado no
+          empieza por un signo; espacio detrás si sigue una palabra.
+        Returns: el texto a insertar
+        """
+        if not segment:
+            return segment
+        
+        prev_char = left[-1:]
+        if prev_char.isspace() and prev_char != '\n':
+            # Saltar un espacio para ver si antes terminaba una frase
+            sentence_start = len(left) < 2 or left[-2] in '.!?\n'
+        else:
+            sentence_start = not prev_char or prev_char in '.!?\n'
+        segment = (segment[0].upper() if sentence_start else segment[0].lower()) + segment[1:]
+        
+        if prev_char and not prev_char.isspace() and prev_char != '(' and segment[0] not in ',.:;!?':
+            segment = ' ' + segment
+        
+        next_char = right[:1]
+        if next_char and not next_char.isspace() and next_char not in ',.:;!?)':
+            segment = segment + ' '
+        return segment
     
     def normalize_parentheses_spacing(self, text):
         """Normaliza espacios alrededor de paréntesis"""
@@ -213,3 +383,114 @@ class TextProcessor:
         minutes = int(seconds // 60)
         secs = int(seconds % 60)
         return f"{minutes:02d}:{secs:02d}"
+
+
+class StreamingTextProcessor:
+    """Procesado incremental de una transcripción que llega por trozos.
+
+    El texto crudo se confirma por frases: cada vez que aparece un "punto y
+    aparte" o "punto y seguido" seguido de más texto, ese tramo se procesa
+    una sola vez y se guarda. Solo la frase en curso se reprocesa en cada
+    actualización, y la última palabra se retiene si puede estar a medias.
+    El resultado es provisional; el texto definitivo se obtiene con
+    `TextProcessor.process_text` sobre la transcripción completa.
+    """
+    SENTENCE_END = re.compile(r'\b(punto y aparte|punto y seguido|nueva linea|nuevalinea)\b(?=\s+\S)',
+                              re.IGNORECASE)
+
+    def __init__(self, text_processor, vocabulary=None):
+        self.text_processor = text_processor
+        self.vocabulary = vocabulary
+        self.reset()
+
+    def reset(self):
+        self._raw = ''
+        self._committed_pos = 0  # posición en el texto crudo ya procesada
+        self._committed = ''  # salida procesada de las frases confirmadas
+        self._separator = ''  # separador entre lo confirmado y la frase en curso
+
+    def update(self, raw_text):
+        """Recibe la transcripción cruda acumulada. Returns: texto provisional a mostrar"""
+        if not raw_text.startswith(self._raw):
+            # El proveedor reinició la respuesta (reintento con otro modelo o clave)
+            self.reset()
+        self._raw = raw_text
+
+        for match in self.SENTENCE_END.finditer(raw_text, self._committed_pos):
+            segment = self.text_processor.process_text(raw_text[self._committed_pos:match.end()],
+                                                       self.vocabulary)
+            if segment:
+                self._committed += self._separator + segment
+                self._separator = '\n' if match.group(1).lower() != 'punto y seguido' else ' '
+            self._committed_pos = match.end()
+
+        words = raw_text[self._committed_pos:].split()
+        if words and not raw_text[-1].isspace():
+            words.pop()
+        tail = self.text_processor.process_text(' '.join(self._hold_back_command(words)), self.vocabulary)
+        if not tail:
+            return self._committed
+        return self._committed + self._separator + tail if self._committed else tail
+
+    def _hold_back_command(self, words):
+        """Retiene las palabras finales que pueden ser el inicio de un comando
+        más largo ("punto" puede acabar siendo "punto y aparte")"""
+        commands = self.text_processor.punctuation_map.keys()
+        for n in (2, 1):
+            ending = ' '.join(words[-n:]).lower()
+            if len(words) >= n and any(c.startswith(ending + ' ') for c in commands):
+                return words[:-n]
+        return words
+
+
+def load_golden_corpus(path=TEXT_GOLDEN_CORPUS):
+    """Corpus de referencia: una línea JSON por caso (input, vocabulary opcional, expected)"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _measure(processor, corpus, document, repeat):
+    """Errores frente al corpus, mejor tiempo del corpus y pico de memoria con un documento grande"""
+    failures = [case for case in corpus
+                if processor.process_text(case['input'], case.get('vocabulary')) != case['expected']]
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for case in corpus:
+            processor.process_text(case['input'], case.get('vocabulary'))
+        best = min(best, time.perf_counter() - start)
+    start = time.perf_counter()
+    processor.process_text(document)
+    document_seconds = time.perf_counter() - start
+    tracemalloc.start()
+    processor.process_text(document)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return failures, best, document_seconds, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara los motores de texto con el corpus de referencia")
+    parser.add_argument('--corpus', default=TEXT_GOLDEN_CORPUS)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--document-kb', type=int, default=512, help="tamaño del documento para medir memoria")
+    args = parser.parse_args(argv)
+
+    corpus = load_golden_corpus(args.corpus)
+    inputs = ' '.join(case['input'] for case in corpus)
+    document = (inputs + ' ') * max(1, args.document_kb * 1024 // max(1, len(inputs)))
+    results = {}
+    for engine in ('legacy', 'fused'):
+        failures, corpus_seconds, document_seconds, peak = _measure(TextProcessor(engine), corpus, document,
+                                                                    args.repeat)
+        results[engine] = corpus_seconds
+        print(f"{engine:<7} {len(corpus) - len(failures)}/{len(corpus)} iguales al corpus, "
+              f"{corpus_seconds * 1000:.2f} ms por pasada, documento de {len(document) // 1024} KB en "
+              f"{document_seconds * 1000:.0f} ms (pico {peak / 1024:.0f} KB)")
+        for case in failures[:5]:
+            print(f"  DIFERENCIA: {case['input']!r}")
+    print(f"Aceleración del motor fusionado: {results['legacy'] / results['fused']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
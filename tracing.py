@@ -0,0 +1,180 @@
+# Módulo de trazas por etapas del dictado (JSONL rotativo + resumen p50/p95)
+#
+# Uso: python tracing.py [--file trazas_dictado.jsonl] [--last 500]
+import argparse
+import contextvars
+import glob
+import json
+import logging
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from config import TRACE_ENABLED, TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUP_COUNT
+
+# Traza activa: asyncio.to_thread copia el contexto, así que las etapas que
+# corren en los hilos del pool heredan la traza de la corrutina que las lanza
+_current_trace = contextvars.ContextVar('dictado_trace', default=None)
+
+_logger = None
+
+
+def _get_logger():
+    """Logger dedicado que escribe una línea JSON por etapa en un archivo rotativo"""
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger('dictado.trace')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES,
+                                          backupCount=TRACE_BACKUP_COUNT, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+class Trace:
+    """Un dictado, desde que se detiene la grabación hasta que se inserta el texto"""
+    def __init__(self, **tags):
+        self.id = uuid.uuid4().hex[:12]
+        self.tags = tags
+        self.started = time.perf_counter()
+        self._marks = set()
+
+    def activate(self):
+        """Hace que las etapas del contexto actual se asocien a esta traza"""
+        _current_trace.set(self)
+        return self
+
+    def finish(self, name='total', **tags):
+        """Registra la duración total de la traza como una etapa más"""
+        _write(self, name, (time.perf_counter() - self.started) * 1000, True, tags)
+
+    def mark(self, name, **tags):
+        """Como `finish`, pero solo la primera vez (p. ej. primer texto en pantalla)"""
+        if name not in self._marks:
+            self._marks.add(name)
+            self.finish(name, **tags)
+
+
+class Span:
+    """Etapa en curso; `tag` añade datos conocidos a mitad de la etapa"""
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.ok = True
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+
+def new_trace(**tags):
+    """Crea una traza nueva y la activa en el contexto actual"""
+    return Trace(**tags).activate()
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, trace=None, **tags):
+    """Mide una etapa: `with span('compress', bytes=n) as s: ...; s.tag(...)`
+
+    La etapa se asocia a `trace` o, si no se indica, a la traza activa.
+    """
+    trace = trace or _current_trace.get()
+    current = Span(name, dict(tags))
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.ok = False
+        raise
+    finally:
+        _write(trace, name, (time.perf_counter() - start) * 1000, current.ok, current.tags)
+
+
+def _write(trace, name, ms, ok, tags):
+    if not TRACE_ENABLED:
+        return
+    record = {'ts': round(time.time(), 3), 'trace': trace.id if trace else None, 'stage': name,
+              'ms': round(ms, 2), 'ok': ok}
+    if trace:
+        record.update(trace.tags)
+    record.update({k: v for k, v in tags.items() if v is not None})
+    try:
+        _get_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+    except Exception as e:
+        print(f"No se pudo escribir la traza: {e}")
+
+
+def percentile(values, pct):
+    """Percentil con interpolación lineal (values no vacío)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    low, high = int(math.floor(k)), int(math.ceil(k))
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def load_records(path=TRACE_FILE):
+    """Lee el archivo de trazas y sus copias rotadas (de la más antigua a la actual)"""
+    backups = [f for f in glob.glob(path + '.*') if f.rsplit('.', 1)[1].isdigit()]
+    files = sorted(backups, key=lambda f: -int(f.rsplit('.', 1)[1])) + [path]
+    records = []
+    for file_path in files:
+        try:
+            with open(file_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+    return records
+
+
+def summarize(records):
+    """Agrupa por etapa. Returns: [(etapa, n, p50, p95, errores)] ordenado por p95"""
+    by_stage = {}
+    for record in records:
+        by_stage.setdefault(record['stage'], []).append(record)
+    rows = []
+    for stage, items in by_stage.items():
+        durations = [r['ms'] for r in items]
+        rows.append((stage, len(items), percentile(durations, 50), percentile(durations, 95),
+                     sum(1 for r in items if not r.get('ok', True))))
+    return sorted(rows, key=lambda row: -row[3])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumen p50/p95 por etapa del dictado")
+    parser.add_argument('--file', default=TRACE_FILE)
+    parser.add_argument('--last', type=int, default=0, help="solo las últimas N trazas (0 = todas)")
+    parser.add_argument('--provider', help="filtrar por proveedor")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.file)
+    if args.last:
+        trace_ids = list(dict.fromkeys(r['trace'] for r in records if r.get('trace')))[-args.last:]
+        keep = set(trace_ids)
+        records = [r for r in records if r.get('trace') in keep]
+    if args.provider:
+        records = [r for r in records if r.get('provider') in (None, args.provider)]
+    if not records:
+        print("No hay trazas todavía")
+        return
+
+    print(f"{'Etapa':<24}{'n':>6}{'p50 ms':>11}{'p95 ms':>11}{'errores':>9}")
+    for stage, count, p50, p95, errors in summarize(records):
+        print(f"{stage:<24}{count:>6}{p50:>11.1f}{p95:>11.1f}{errors:>9}")
+
+
+if __name__ == '__main__':
+    main()
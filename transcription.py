@@ -1,11 +1,22 @@
-# Módulo de transcripción con múltiples proveedores (Groq + Gemini)
-import base64
+# Módulo de transcripción con múltiples proveedores (Groq + Gemini + Whisper local)
+import asyncio
 import os
-from config import GROQ_API_KEY, GEMINI_MODELS, GROQ_MODELS
+import tempfile
+import time
+from provider_clients import get_provider_registry, ProviderError
+from transcription_cache import TranscriptionCache
+from local_transcriber import get_local_transcriber, audio_duration
+from provider_router import ProviderRouter, estimate_duration
+from deadline import Deadline, OperationCancelled
+from llm_gateway import LLMGateway
+from tracing import span
+from config import (GROQ_API_KEY, GEMINI_MODELS, GROQ_MODELS, GEMINI_INLINE_MAX_BYTES,
+                    GEMINI_UPLOAD_THRESHOLD_BYTES, LOCAL_ROUTING_MAX_SECONDS, TEXT_REQUEST_DEADLINE)
 
 # Importar Gemini (usamos el nuevo SDK google-genai)
 try:
     from google import genai
+    from google.genai import types as genai_types
     GENAI_AVAILABLE = True
 except ImportError:
     GENAI_AVAILABLE = False
@@ -20,31 +31,138 @@ except ImportError:
     print("ADVERTENCIA: groq no está instalado. Instala con: pip install groq")
 
 
+# Versión de cada prompt de transcripción: incrementar al modificarlo para
+# que la caché de transcripciones no devuelva resultados del prompt anterior
+PROMPT_VERSIONS = {
+    'Gemini': 2,
+    'Groq': 1,
+    'Local': 1,
+}
+
+# Prompt de Groq con léxico médico y comandos claros
+GROQ_TRANSCRIPTION_PROMPT = (
+    "Léxico médico: bazo, hígado, páncreas, riñones, adenopatías, parénquima, homogéneo, bordes lisos, "
+    "esplenomesentérico, ateromatosis, aortoilíaca, hemiabdomen. "
+    "Comandos de puntuación: PUNTO Y APARTE (salto de línea), PUNTO Y SEGUIDO (.), COMA (,), DOS PUNTOS (:). "
+    "Instrucción: Transcribe exactamente lo que escuches. No intentes corregir la gramática ni añadir puntuación por tu cuenta. "
+    "Si escuchas 'punto y aparte', escribe 'punto y aparte'. No pongas mayúsculas al azar."
+)
+
+# Prompt de Gemini para transcripción estrictamente literal
+GEMINI_TRANSCRIPTION_PROMPT = """Eres un sistema de transcripción estrictamente literal. Tu única tarea es convertir el audio en las palabras exactas que se dicen, siguiendo las reglas y ejemplos a continuación.
+
+REGLAS CRÍTICAS:
+1.  NO interpretes el significado ni el formato. NO añadas signos de puntuación como puntos o comas.
+2.  Las pausas en el audio son solo eso, pausas, y NO deben representarse con saltos de línea ni párrafos. La transcripción debe ser un único bloque de texto continuo.
+3.   transcribe literalmente los comandos de puntuación. Si el usuario dice "punto y aparte", tu salida DEBE ser el texto "punto y aparte". Si dice "coma", debe ser "coma".
+4.  NO pongas mayúsculas al azar al inicio de palabras si no siguen a una puntuación explícita (puntos). Si hay pausas largas, mantén el texto en minúsculas.
+
+Ejemplos de lo que es CORRECTO:
+
+Audio de entrada: "Hola coma me llamo Juan (pausa larga) y estoy dictando una prueba punto y aparte"
+Salida CORRECTA: "Hola coma me llamo Juan y estoy dictando una prueba punto y aparte"
+
+Ejemplos de lo que es INCORRECTO:
+
+Audio de entrada: "Hola coma me llamo Juan (pausa larga) y estoy dictando una prueba punto y aparte"
+Salida INCORRECTA:
+"Hola coma me llamo Juan
+y estoy dictando una prueba punto y aparte"
+
+El objetivo es una transcripción 100% literal para que otro programa pueda procesarla después."""
+
+
+class AudioPayload:
+    """Audio de una petición preparado de forma perezosa según el proveedor.
+
+    Nada se lee de disco hasta que un proveedor lo necesita: Groq recibe un
+    manejador de archivo (httpx lo envía por trozos), Gemini recibe los bytes
+    crudos en un Part (sin base64 propio) y los audios grandes se suben una
+    sola vez por la Files API. `bytes_copied` cuenta los bytes que hemos
+    cargado en memoria.
+    `content_hash` identifica el audio de origen (el SHA-256 que ya calcula
+    la caché de transcripciones); si falta, se calcula del propio archivo.
+    """
+    def __init__(self, path, mime_type, duration=None, content_hash=None):
+        self.path = path
+        self.mime_type = mime_type
+        self.duration = duration  # segundos de audio (para los timeouts)
+        self.content_hash = content_hash
+        self.size = os.path.getsize(path)
+        self.bytes_copied = 0
+        # Proveedor y modelo que produjeron la transcripción
+        self.provider = None
+        self.model = None
+        self._data = None
+    
+    def read_bytes(self):
+        """Lee el archivo una sola vez y reutiliza los bytes en reintentos"""
+        if self._data is None:
+            with span('audio_read', bytes=self.size):
+                with open(self.path, 'rb') as f:
+                    self._data = f.read()
+            self.bytes_copied += len(self._data)
+        return self._data
+    
+    def open(self):
+        """Devuelve un manejador de archivo binario (sin copiar en memoria)"""
+        return open(self.path, 'rb')
+    
+    def fingerprint(self):
+        """Identifica el contenido (hash del audio y formato), no la ruta: cada
+        compresión escribe un archivo nuevo del mismo audio"""
+        if self.content_hash is None:
+            self.content_hash = TranscriptionCache.hash_file(self.path)
+        return (self.content_hash, self.mime_type)
+    
+    def use_files_api(self):
+        """Indica si el audio es lo bastante grande para subirlo por la Files API"""
+        return self.size > min(GEMINI_UPLOAD_THRESHOLD_BYTES, GEMINI_INLINE_MAX_BYTES)
+    
+    def gemini_part(self, client, key_index, file_cache, timeout=None):
+        """Construye el Part de audio para Gemini (inline o vía Files API)"""
+        if self.use_files_api():
+            uploaded = file_cache.get_or_upload(client, key_index, self, timeout)
+            return genai_types.Part.from_uri(file_uri=uploaded.uri, mime_type=self.mime_type)
+        return genai_types.Part.from_bytes(data=self.read_bytes(), mime_type=self.mime_type)
+
+
+def _guess_mime_type(audio_file_path):
+    """Determina el mime_type a partir de la extensión"""
+    if audio_file_path.endswith('.webm'):
+        return "audio/webm"
+    elif audio_file_path.endswith('.ogg'):
+        return "audio/ogg"
+    elif audio_file_path.endswith('.mp3'):
+        return "audio/mp3"
+    return "audio/wav"
+
+
 class TranscriptionService:
-    def __init__(self):
-        from config import GEMINI_API_KEYS, GROQ_API_KEY
-        self.gemini_clients = []
-        self.groq_client = None
-        self.current_key_index = 0
-        
-        # Configurar Gemini (múltiples claves para rotación)
-        if GENAI_AVAILABLE:
-            for i, key in enumerate(GEMINI_API_KEYS):
-                try:
-                    client = genai.Client(api_key=key)
-                    self.gemini_clients.append(client)
-                    print(f"Gemini (Key {i+1}) configurado correctamente")
-                except Exception as e:
-                    print(f"Error configurando Gemini (Key {i+1}): {e}")
-        
-        # Configurar Groq
-        if GROQ_AVAILABLE and GROQ_API_KEY:
+    def __init__(self, registry=None, cache=None, local=None):
+        # Los clientes, el pool de conexiones y la clave activa son compartidos
+        self.registry = registry or get_provider_registry()
+        self.local = local or get_local_transcriber()
+        self.router = ProviderRouter()
+        self.cache = cache
+        if self.cache is None:
             try:
-                import groq
-                self.groq_client = groq.Groq(api_key=GROQ_API_KEY)
-                print("Groq (Whisper) configurado correctamente")
+                self.cache = TranscriptionCache()
             except Exception as e:
-                print(f"Error configurando Groq: {e}")
+                print(f"Caché de transcripciones no disponible: {e}")
+        self.gemini_clients = self.registry.gemini_clients
+        self.groq_client = self.registry.groq_client
+        self.gemini_files = self.registry.gemini_files
+        self.prompt_cache = self.registry.prompt_cache
+        self.text_gateway = LLMGateway(self)
+    
+    @property
+    def current_key_index(self):
+        return self.registry.current_key_index
+    
+    @current_key_index.setter
+    def current_key_index(self, value):
+        self.registry.current_key_index = value
     
     def is_groq_available(self):
         return GROQ_AVAILABLE and self.groq_client is not None and GROQ_API_KEY
@@ -52,65 +170,194 @@ class TranscriptionService:
     def is_gemini_available(self):
         return GENAI_AVAILABLE and len(self.gemini_clients) > 0
     
+    def is_local_available(self):
+        return self.local.is_available()
+    
     def is_available(self):
-        return self.is_groq_available() or self.is_gemini_available()
+        return self.is_groq_available() or self.is_gemini_available() or self.is_local_available()
     
-    def transcribe_audio(self, audio_file_path, provider='Gemini', on_status=None):
-        """Transcribe audio usando el proveedor especificado (Gemini o Groq)
-        Returns: (text, compressed_file, error)
+    def provider_order(self, audio_file_path, provider='Gemini'):
+        """Orden de proveedores a intentar para este audio.
+        
+        La elección manual ('Gemini', 'Groq' o 'Local') se respeta: ese
+        proveedor va primero, el otro de la nube después y el Whisper local
+        queda como último recurso. Solo con 'Auto' se enruta: los clips
+        cortos (hasta LOCAL_ROUTING_MAX_SECONDS) van primero en local, sin
+        ida y vuelta por la red, y el resto lo ordena el enrutador según las
+        latencias observadas.
         """
+        if provider == 'Auto':
+            duration = audio_duration(audio_file_path)
+            if (LOCAL_ROUTING_MAX_SECONDS and duration is not None
+                    and duration <= LOCAL_ROUTING_MAX_SECONDS and self.is_local_available()):
+                self.router.last_route = f"Auto: Local (audio corto, {duration:.0f}s)"
+                return ['Local', 'Gemini', 'Groq']
+            available = [name for name in ['Gemini', 'Groq', 'Local'] if self._is_provider_available(name)]
+            return self.router.order(available or ['Gemini', 'Groq'], audio_file_path)[0]
+        if provider == 'Local':
+            return ['Local', 'Gemini', 'Groq']
+        order = ['Gemini', 'Groq'] if provider == 'Gemini' else ['Groq', 'Gemini']
+        return order + ['Local']
+    
+    def transcribe_audio(self, audio_file_path, provider='Gemini', on_status=None, on_partial=None,
+                         deadline=None):
+        """Transcribe audio usando el proveedor especificado (Auto, Gemini, Groq o Local)
         
-        # Comprimir audio si es muy grande
-        compressed_file = self._compress_audio(audio_file_path, on_status)
+        Si se indica `on_partial`, la transcripción se pide en streaming y el
+        callback recibe el texto crudo acumulado a medida que llega (si un
+        proveedor falla y se reintenta con otro, el texto vuelve a empezar).
+        `deadline` (Deadline) acota el tiempo total y permite cancelar; si no
+        se indica, se crea uno proporcional a la duración del audio.
+        Returns: (text, compressed_file, error)
+        """
+        # Determinar el orden según el proveedor seleccionado y la duración
+        order = self.provider_order(audio_file_path, provider)
+        duration = estimate_duration(audio_file_path)
+        deadline = deadline or Deadline.for_audio(duration)
+        if provider == 'Auto' and on_status:
+            on_status(self.router.last_route)
         
-        # Determinar mime_type
-        if compressed_file.endswith('.webm'):
-            mime_type = "audio/webm"
-        elif compressed_file.endswith('.ogg'):
-            mime_type = "audio/ogg"
-        elif compressed_file.endswith('.mp3'):
-            mime_type = "audio/mp3"
-        else:
-            mime_type = "audio/wav"
+        # Consultar la caché antes de comprimir o tocar la red
+        audio_hash = None
+        if self.cache:
+            try:
+                with span('cache_lookup') as lookup:
+                    audio_hash = self.cache.hash_file(audio_file_path)
+                    # Vale la transcripción de cualquier proveedor del orden (también de uno de reserva)
+                    hit = self.cache.lookup(audio_hash, [candidate for name in order
+                                                         for candidate in self._cache_candidates(name)])
+                    lookup.tag(hit=bool(hit))
+                if hit:
+                    print(f"Transcripción recuperada de caché ({hit[0]}, {hit[1]}): {self.cache.stats()}")
+                    if on_status:
+                        on_status("Transcripción recuperada de caché")
+                    return hit[2], audio_file_path, None
+            except Exception as e:
+                print(f"Error consultando caché de transcripciones: {e}")
         
-        # Leer archivo
-        with open(compressed_file, 'rb') as f:
-            audio_data = f.read()
-        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+        # El audio no se lee aquí: cada proveedor prepara su propio payload.
+        # Solo se comprime para la nube; Whisper local lee el WAV original
+        compressed_file = audio_file_path
+        compressed = False
+        payload = AudioPayload(audio_file_path, _guess_mime_type(audio_file_path), duration, audio_hash)
+        available = [name for name in order if self._is_provider_available(name)]
         
-        # Determinar el orden según el proveedor seleccionado
-        if provider == 'Gemini':
-            # Intentar Gemini primero
-            if self.is_gemini_available():
-                result, error = self._transcribe_gemini(audio_base64, mime_type, on_status)
-                if result:
-                    return result, compressed_file, None
-                print(f"Gemini falló: {error}, intentando Groq...")
-            
-            # Fallback a Groq
-            if self.is_groq_available():
-                result, error = self._transcribe_groq(compressed_file, on_status)
-                return result, compressed_file, error
-        else:
-            # Intentar Groq primero
-            if self.is_groq_available():
-                result, error = self._transcribe_groq(compressed_file, on_status)
+        try:
+            error = None
+            for i, name in enumerate(available):
+                if deadline.expired():
+                    return (None, self._discard_compressed(audio_file_path, compressed_file),
+                            self._deadline_error(deadline))
+                if name != 'Local' and not compressed:
+                    compressed = True
+                    compressed_file = self._compress_audio(audio_file_path, on_status)
+                    if compressed_file != audio_file_path:
+                        payload = AudioPayload(compressed_file, _guess_mime_type(compressed_file), duration,
+                                               audio_hash)
+                start = time.perf_counter()
+                with span('provider_attempt', provider=name, audio_s=round(duration, 1),
+                          bytes=payload.size) as attempt:
+                    result, error = self._transcribe_with(name, payload, on_status, on_partial, deadline)
+                    attempt.ok = bool(result)
+                    attempt.tag(model=payload.model,
+                                key_index=self.current_key_index if name == 'Gemini' else None)
+                if deadline.cancelled:
+                    # Una cancelación no dice nada de la latencia del proveedor
+                    return (None, self._discard_compressed(audio_file_path, compressed_file),
+                            self._deadline_error(deadline))
+                self.router.record(name, payload.model if result else None, duration,
+                                   time.perf_counter() - start, bool(result))
                 if result:
+                    self._store_in_cache(audio_hash, payload, result)
                     return result, compressed_file, None
-                print(f"Groq falló: {error}, intentando Gemini...")
-            
-            # Fallback a Gemini
-            if self.is_gemini_available():
-                result, error = self._transcribe_gemini(audio_base64, mime_type, on_status)
-                return result, compressed_file, error
+                if i + 1 < len(available):
+                    print(f"{name} falló: {error}, intentando {available[i + 1]}...")
+            if available:
+                return None, self._discard_compressed(audio_file_path, compressed_file), error
+        finally:
+            print(f"Bytes de audio copiados en memoria: {payload.bytes_copied} "
+                  f"(archivo {payload.size} bytes)")
+            print(f"Conexiones: {self.registry.stats.summary()}")
+            print(f"Enrutado: {self.router.summary()}")
         
         return None, compressed_file, "No hay servicio de transcripción disponible. Configura GROQ_API_KEY o GEMINI_API_KEY en .env"
     
-    def _transcribe_groq(self, audio_file_path, on_status=None):
-        """Transcribe usando Groq (Whisper)"""
+    @staticmethod
+    def _deadline_error(deadline):
+        """Error de plazo: agotarlo es reintentable (red lenta), cancelar no"""
+        return ProviderError(deadline.reason(), retryable=not deadline.cancelled)
+    
+    @staticmethod
+    def _discard_compressed(audio_file_path, compressed_file):
+        """Borra la copia comprimida de una transcripción fallida (cada llamada
+        escribe la suya) y devuelve el audio original"""
+        if compressed_file != audio_file_path:
+            try:
+                os.remove(compressed_file)
+            except OSError:
+                pass
+        return audio_file_path
+    
+    def _is_provider_available(self, name):
+        if name == 'Gemini':
+            return self.is_gemini_available()
+        if name == 'Local':
+            return self.is_local_available()
+        return self.is_groq_available()
+    
+    def _transcribe_with(self, name, payload, on_status=None, on_partial=None, deadline=None):
+        """Transcribe con el proveedor indicado. Returns: (text, error)"""
+        deadline = deadline or Deadline.for_audio(payload.duration)
+        if name == 'Gemini':
+            return self._transcribe_gemini(payload, on_status, on_partial, deadline)
+        if name == 'Local':
+            return self._transcribe_local(payload, on_status, on_partial, deadline)
+        return self._transcribe_groq(payload, on_status, on_partial, deadline)
+    
+    def _cache_candidates(self, provider):
+        """Combinaciones (proveedor, modelo, versión) válidas para el proveedor elegido"""
+        if provider == 'Gemini':
+            return [('Gemini', model, PROMPT_VERSIONS['Gemini']) for model in GEMINI_MODELS]
+        if provider == 'Local':
+            return [('Local', self.local.model_size, PROMPT_VERSIONS['Local'])]
+        return [('Groq', GROQ_MODELS[0], PROMPT_VERSIONS['Groq'])]
+    
+    def _store_in_cache(self, audio_hash, payload, text):
+        if not self.cache or not audio_hash or not payload.provider:
+            return
+        try:
+            self.cache.put(audio_hash, payload.provider, payload.model,
+                           PROMPT_VERSIONS[payload.provider], text)
+        except Exception as e:
+            print(f"Error guardando en caché de transcripciones: {e}")
+    
+    async def transcribe_audio_async(self, audio_file_path, provider='Gemini', on_status=None, on_partial=None,
+                                     deadline=None):
+        """Versión asíncrona de transcribe_audio para el loop compartido (AsyncRunner).
+        
+        Si la tarea se cancela, se cancela también el Deadline para que el
+        hilo de trabajo abandone en el siguiente punto de control.
+        Returns: (text, compressed_file, error)
+        """
+        deadline = deadline or Deadline.for_audio(estimate_duration(audio_file_path))
+        try:
+            return await asyncio.to_thread(self.transcribe_audio, audio_file_path, provider, on_status,
+                                           on_partial, deadline)
+        except asyncio.CancelledError:
+            deadline.cancel()
+            raise
+    
+    def _transcribe_groq(self, payload, on_status=None, on_partial=None, deadline=None):
+        """Transcribe usando Groq (Whisper).
+        
+        La API de transcripción de Groq no tiene streaming: con `on_partial`
+        el texto completo se entrega como un único trozo.
+        """
         if not self.is_groq_available():
             return None, "Groq no disponible"
         
+        audio_file_path = payload.path
+        
         # Verificar que es un archivo de audio
         audio_extensions = ['.wav', '.ogg', '.mp3', '.m4a', '.webm', '.flac']
         if not any(audio_file_path.lower().endswith(ext) for ext in audio_extensions):
@@ -120,108 +367,173 @@ class TranscriptionService:
             if on_status:
                 on_status("Transcribiendo con Groq (Whisper)...")
             
-            with open(audio_file_path, "rb") as file:
-                # Prompt mejorado con léxico médico y comandos claros
-                medical_prompt = (
-                    "Léxico médico: bazo, hígado, páncreas, riñones, adenopatías, parénquima, homogéneo, bordes lisos, "
-                    "esplenomesentérico, ateromatosis, aortoilíaca, hemiabdomen. "
-                    "Comandos de puntuación: PUNTO Y APARTE (salto de línea), PUNTO Y SEGUIDO (.), COMA (,), DOS PUNTOS (:). "
-                    "Instrucción: Transcribe exactamente lo que escuches. No intentes corregir la gramática ni añadir puntuación por tu cuenta. "
-                    "Si escuchas 'punto y aparte', escribe 'punto y aparte'. No pongas mayúsculas al azar."
-                )
-                
+            deadline = deadline or Deadline.for_audio(payload.duration)
+            with payload.open() as file, span('groq_request', model=GROQ_MODELS[0], bytes=payload.size):
                 transcription = self.groq_client.audio.transcriptions.create(
-                    file=(audio_file_path, file.read()),
+                    file=(os.path.basename(audio_file_path), file),
                     model=GROQ_MODELS[0],  # whisper-large-v3
                     language="es",
-                    prompt=medical_prompt
+                    prompt=GROQ_TRANSCRIPTION_PROMPT,
+                    timeout=deadline.attempt_timeout(payload.duration)
                 )
             
+            payload.provider, payload.model = 'Groq', GROQ_MODELS[0]
+            if on_partial and transcription.text:
+                on_partial(transcription.text)
             return transcription.text, None
             
+        except OperationCancelled:
+            return None, self._deadline_error(deadline)
         except Exception as e:
-            return None, str(e)
+            return None, ProviderError.from_exception(e)
+    
+    def _transcribe_local(self, payload, on_status=None, on_partial=None, deadline=None):
+        """Transcribe en este equipo con Whisper (faster-whisper en CPU)"""
+        if on_status:
+            on_status("Transcribiendo en local (Whisper)...")
+        with span('local_whisper', model=self.local.model_size) as local_span:
+            text, error = self.local.transcribe(payload.path, prompt=GROQ_TRANSCRIPTION_PROMPT,
+                                                on_partial=on_partial, deadline=deadline)
+            local_span.ok = bool(text)
+        if text:
+            payload.provider, payload.model = 'Local', self.local.model_size
+        return text, error
     
-    def _transcribe_gemini(self, audio_base64, mime_type, on_status=None):
+    def _transcribe_gemini(self, payload, on_status=None, on_partial=None, deadline=None):
         """Transcribe usando Gemini con rotación de claves en caso de error de cuota"""
         if not self.is_gemini_available():
             return None, "Gemini no disponible"
         
-        prompt = """Eres un sistema de transcripción estrictamente literal. Tu única tarea es convertir el audio en las palabras exactas que se dicen, siguiendo las reglas y ejemplos a continuación.
-
-REGLAS CRÍTICAS:
-1.  NO interpretes el significado ni el formato. NO añadas signos de puntuación como puntos o comas.
-2.  Las pausas en el audio son solo eso, pausas, y NO deben representarse con saltos de línea ni párrafos. La transcripción debe ser un único bloque de texto continuo.
-3.   transcribe literalmente los comandos de puntuación. Si el usuario dice "punto y aparte", tu salida DEBE ser el texto "punto y aparte". Si dice "coma", debe ser "coma".
-4.  NO pongas mayúsculas al azar al inicio de palabras si no siguen a una puntuación explícita (puntos). Si hay pausas largas, mantén el texto en minúsculas.
-
-Ejemplos de lo que es CORRECTO:
-
-Audio de entrada: "Hola coma me llamo Juan (pausa larga) y estoy dictando una prueba punto y aparte"
-Salida CORRECTA: "Hola coma me llamo Juan y estoy dictando una prueba punto y aparte"
-
-Ejemplos de lo que es INCORRECTO:
-
-Audio de entrada: "Hola coma me llamo Juan (pausa larga) y estoy dictando una prueba punto y aparte"
-Salida INCORRECTA:
-"Hola coma me llamo Juan
-y estoy dictando una prueba punto y aparte"
-
-El objetivo es una transcripción 100% literal para que otro programa pueda procesarla después."""
+        prompt = GEMINI_TRANSCRIPTION_PROMPT
+        deadline = deadline or Deadline.for_audio(payload.duration)
 
         # Intentar con todas las claves disponibles en círculo
         start_index = self.current_key_index
         num_keys = len(self.gemini_clients)
+        last_error = None  # se incluye en el error final (la cola decide si reintentar con él)
         
         for i in range(num_keys):
             idx = (start_index + i) % num_keys
             client = self.gemini_clients[idx]
             
             try:
+                deadline.check()
                 if on_status:
                     if i > 0:
                         on_status(f"Rotando a clave Gemini {idx+1} por cuota...")
                     else:
                         on_status("Transcribiendo con Gemini...")
                 
+                # Preparar el audio para esta clave (bytes crudos o Files API)
+                audio_part = payload.gemini_part(client, idx, self.gemini_files,
+                                                 deadline.attempt_timeout(payload.duration))
+                
                 # Intentar con la lista de modelos de esta clave
                 from config import GEMINI_MODELS
                 for model_name in GEMINI_MODELS:
                     try:
-                        response = client.models.generate_content(
-                            model=model_name,
-                            contents=[
-                                prompt,
-                                {
-                                    "inline_data": {
-                                        "mime_type": mime_type,
-                                        "data": audio_base64
-                                    }
-                                }
-                            ]
-                        )
+                        deadline.check()
+                        with span('gemini_request', model=model_name, key_index=idx,
+                                  streaming=bool(on_partial), files_api=payload.use_files_api()):
+                            text = self._generate_with_prompt(
+                                client, idx, model_name, prompt, [audio_part],
+                                deadline.attempt_timeout(payload.duration), 'transcripcion',
+                                on_partial, deadline)
                         
-                        if response and response.text:
+                        if text:
                             # Guardar el índice de la clave que funcionó para la próxima vez
                             self.current_key_index = idx
-                            return response.text, None
+                            payload.provider, payload.model = 'Gemini', model_name
+                            return text, None
                             
+                    except OperationCancelled:
+                        raise
                     except Exception as model_error:
+                        last_error = model_error
                         error_msg = str(model_error).lower()
                         # Si es error de cuota/rate limit, saltar a la siguiente clave
                         if "429" in error_msg or "quota" in error_msg or "rate limit" in error_msg:
                             print(f"Clave Gemini {idx+1} sin cuota para {model_name}. Probando siguiente clave...")
                             break # Salir de la lista de modelos para probar la siguiente clave
                         
+                        # Si el archivo subido caducó, volver a subirlo para el siguiente modelo
+                        if payload.use_files_api() and ("not found" in error_msg or "expired" in error_msg):
+                            print(f"Archivo subido no disponible en clave {idx+1}, se volverá a subir")
+                            self.gemini_files.invalidate(idx, payload)
+                            audio_part = payload.gemini_part(client, idx, self.gemini_files,
+                                                             deadline.attempt_timeout(payload.duration))
+                        
                         print(f"Error con modelo {model_name} en clave {idx+1}: {model_error}")
                         continue # Probar siguiente modelo con esta misma clave
                         
+            except OperationCancelled:
+                return None, self._deadline_error(deadline)
             except Exception as e:
+                last_error = e
                 print(f"Error crítico en clave Gemini {idx+1}: {e}")
                 continue
-                
+        
+        if last_error is not None:
+            return None, ProviderError.from_exception(
+                last_error, f"Todos los modelos y todas las claves de Gemini fallaron ({last_error})")
         return None, "Todos los modelos y todas las claves de Gemini fallaron"
     
+    def _gemini_request_config(self, timeout, cached_content=None, system_instruction=None, temperature=None):
+        """Config de generate_content con el timeout del intento (el SDK lo quiere en ms)"""
+        return genai_types.GenerateContentConfig(http_options=genai_types.HttpOptions(timeout=int(timeout * 1000)),
+                                                 cached_content=cached_content,
+                                                 system_instruction=system_instruction,
+                                                 temperature=temperature)
+    
+    def _generate_with_prompt(self, client, key_index, model_name, prompt, contents, timeout, label,
+                              on_partial=None, deadline=None, temperature=None):
+        """generate_content con un prompt estático como instrucción de sistema.
+        
+        El prompt se referencia por su caché de contexto si existe; si no, va
+        en línea (sigue siendo un prefijo estable que Gemini puede aprovechar
+        con su caché implícita). Si el servidor ya no reconoce la caché
+        (caducada o borrada), se olvida y se repite la petición en línea.
+        Returns: el texto de la respuesta
+        """
+        cached = self.prompt_cache.get(client, key_index, model_name, prompt, label)
+        if cached:
+            try:
+                config = self._gemini_request_config(timeout, cached_content=cached, temperature=temperature)
+                return self._generate_gemini(client, model_name, contents, config, on_partial, deadline)
+            except OperationCancelled:
+                raise
+            except Exception as e:
+                error_msg = str(e).lower()
+                if not ("cache" in error_msg or "not found" in error_msg or "expired" in error_msg
+                        or "403" in error_msg or "permission" in error_msg):
+                    raise
+                print(f"Caché de prompt {cached} no válida en clave {key_index+1}: {e}. Reintentando en línea")
+                self.prompt_cache.invalidate(key_index, model_name, prompt)
+                if deadline:
+                    deadline.check()
+        config = self._gemini_request_config(timeout, system_instruction=prompt, temperature=temperature)
+        return self._generate_gemini(client, model_name, contents, config, on_partial, deadline)
+    
+    def _generate_gemini(self, client, model_name, contents, config, on_partial=None, deadline=None):
+        """generate_content normal o en streaming según haya `on_partial`"""
+        if on_partial:
+            return self._stream_gemini(client, model_name, contents, on_partial, config, deadline)
+        response = client.models.generate_content(model=model_name, contents=contents, config=config)
+        return response.text if response else None
+    
+    def _stream_gemini(self, client, model_name, contents, on_partial, config=None, deadline=None):
+        """generate_content_stream entregando el texto acumulado en cada trozo.
+        Returns: el texto completo
+        """
+        accumulated = ''
+        for chunk in client.models.generate_content_stream(model=model_name, contents=contents, config=config):
+            if deadline:
+                deadline.check()
+            if chunk.text:
+                accumulated += chunk.text
+                on_partial(accumulated)
+        return accumulated
+    
     def _compress_audio(self, audio_file_path, on_status=None):
         """Comprime audio a OGG 32kbps (como la web original)"""
         # Si no es WAV, no comprimir
@@ -244,13 +556,20 @@ El objetivo es una transcripción 100% literal para que otro programa pueda proc
                 AudioSegment.converter = ffmpeg_path
             
             print(f"Comprimiendo {file_size/1024/1024:.2f}MB...")
-            audio = AudioSegment.from_wav(audio_file_path)
-            compressed_file = audio_file_path.replace('.wav', '.webm')
-            
-            # Exportar como WebM con bitrate bajo
-            audio.export(compressed_file, format="webm", codec="libopus", bitrate="32k")
-            
-            new_size = os.path.getsize(compressed_file)
+            with span('compress', bytes_in=file_size) as compress_span:
+                audio = AudioSegment.from_wav(audio_file_path)
+                # Archivo único por llamada: reintentos o peticiones concurrentes
+                # del mismo audio no se pisan al escribir
+                stem = os.path.splitext(os.path.basename(audio_file_path))[0]
+                fd, compressed_file = tempfile.mkstemp(suffix='.webm', prefix=f'{stem}_',
+                                                       dir=os.path.dirname(os.path.abspath(audio_file_path)))
+                os.close(fd)
+                
+                # Exportar como WebM con bitrate bajo
+                audio.export(compressed_file, format="webm", codec="libopus", bitrate="32k")
+                
+                new_size = os.path.getsize(compressed_file)
+                compress_span.tag(bytes_out=new_size)
             print(f"Comprimido a WebM: {file_size/1024/1024:.2f}MB -> {new_size/1024/1024:.2f}MB")
             
             return compressed_file if os.path.exists(compressed_file) else audio_file_path
@@ -262,37 +581,21 @@ El objetivo es una transcripción 100% literal para que otro programa pueda proc
                 print("ADVERTENCIA: ffmpeg no está instalado o no se encuentra en el PATH. Subiendo archivo sin comprimir.")
             return audio_file_path
     
-    def transcribe_text(self, text, on_status=None):
-        """Procesa texto ya transcrito (para el Juanizador) con rotación de claves"""
-        if not self.is_gemini_available():
-            return None, "Servicio Gemini no disponible"
-            
-        from config import GEMINI_MODELS
-        start_index = self.current_key_index
-        num_keys = len(self.gemini_clients)
-        
-        for i in range(num_keys):
-            idx = (start_index + i) % num_keys
-            client = self.gemini_clients[idx]
-            
-            try:
-                if on_status:
-                    on_status(f"Procesando con IA (Clave {idx+1})...")
-                
-                response = client.models.generate_content(
-                    model=GEMINI_MODELS[0],
-                    contents=text
-                )
-                
-                if response and response.text:
-                    self.current_key_index = idx
-                    return response.text, None
-                    
-            except Exception as e:
-                error_msg = str(e).lower()
-                if "429" in error_msg or "quota" in error_msg:
-                    print(f"Clave {idx+1} sin cuota para texto. Rotando...")
-                    continue
-                return None, f"Error en clave {idx+1}: {str(e)}"
+    def transcribe_text(self, text, on_status=None, deadline=None, system_instruction=None, label='texto'):
+        """Procesa texto ya transcrito (para el Juanizador) a través del LLMGateway.
         
-        return None, "Todas las claves de Gemini fallaron al procesar texto"
+        `system_instruction` es la parte estática del prompt: se registra en
+        la caché de contexto y solo `text` viaja en cada petición.
+        """
+        return self.text_gateway.generate(text, system_instruction, label, on_status=on_status, deadline=deadline)
+    
+    async def transcribe_text_async(self, text, on_status=None, deadline=None, system_instruction=None,
+                                    label='texto'):
+        """Versión asíncrona de transcribe_text para el loop compartido (AsyncRunner)"""
+        deadline = deadline or Deadline(TEXT_REQUEST_DEADLINE)
+        try:
+            return await asyncio.to_thread(self.transcribe_text, text, on_status, deadline,
+                                           system_instruction, label)
+        except asyncio.CancelledError:
+            deadline.cancel()
+            raise
@@ -0,0 +1,89 @@
+# Módulo de caché persistente de transcripciones (SQLite)
+import hashlib
+import sqlite3
+import threading
+import time
+from config import TRANSCRIPTION_CACHE_FILE, TRANSCRIPTION_CACHE_MAX_ENTRIES, TRANSCRIPTION_CACHE_TTL
+
+
+class TranscriptionCache:
+    """Transcripciones crudas indexadas por hash del audio, proveedor, modelo
+    y versión del prompt.
+
+    Permite que "Reenviar audio", volver a subir el mismo archivo o repetir
+    el pulido del texto no paguen de nuevo la llamada al proveedor ni su
+    cuota. El tamaño está acotado (se expulsan las entradas menos usadas) y
+    las entradas caducan tras TRANSCRIPTION_CACHE_TTL segundos.
+    """
+    def __init__(self, path=TRANSCRIPTION_CACHE_FILE, max_entries=TRANSCRIPTION_CACHE_MAX_ENTRIES,
+                 ttl=TRANSCRIPTION_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcriptions (
+                audio_hash TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (audio_hash, provider, model, prompt_version)
+            )""")
+        self._conn.commit()
+
+    @staticmethod
+    def hash_file(path, chunk_size=1024 * 1024):
+        """SHA-256 del contenido del audio (leído por bloques)"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def lookup(self, audio_hash, candidates):
+        """Busca la primera transcripción válida entre (proveedor, modelo, versión).
+        Returns: (provider, model, text) o None
+        """
+        now = time.time()
+        with self._lock:
+            for provider, model, prompt_version in candidates:
+                row = self._conn.execute(
+                    "SELECT text, created_at FROM transcriptions "
+                    "WHERE audio_hash=? AND provider=? AND model=? AND prompt_version=?",
+                    (audio_hash, provider, model, str(prompt_version))).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    self._conn.execute(
+                        "UPDATE transcriptions SET last_access=? "
+                        "WHERE audio_hash=? AND provider=? AND model=? AND prompt_version=?",
+                        (now, audio_hash, provider, model, str(prompt_version)))
+                    self._conn.commit()
+                    self.hits += 1
+                    return provider, model, row[0]
+            self.misses += 1
+        return None
+
+    def put(self, audio_hash, provider, model, prompt_version, text):
+        """Guarda una transcripción y aplica caducidad y límite de tamaño"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcriptions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (audio_hash, provider, model, str(prompt_version), text, now, now))
+            self._conn.execute("DELETE FROM transcriptions WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM transcriptions WHERE rowid IN ("
+                "SELECT rowid FROM transcriptions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self._conn.commit()
+
+    def stats(self):
+        """Contadores de aciertos/fallos y entradas almacenadas"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM transcriptions").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
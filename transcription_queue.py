@@ -0,0 +1,210 @@
+# Módulo de cola persistente de transcripciones (dictados sin conexión)
+import json
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+from config import (TRANSCRIPTION_SPOOL_DIR, TRANSCRIPTION_QUEUE_WORKERS, TRANSCRIPTION_QUEUE_MAX_ATTEMPTS,
+                    TRANSCRIPTION_QUEUE_BACKOFF_BASE, TRANSCRIPTION_QUEUE_BACKOFF_MAX,
+                    TRANSCRIPTION_QUEUE_FAILED_RETENTION)
+from provider_clients import ProviderError
+
+def is_retryable_error(error):
+    """¿El error de transcripción es de red o del proveedor (merece encolar el dictado)?
+
+    La clasificación la hace el proveedor a partir de la excepción (ver
+    ProviderError); un mensaje sin clasificar, como un archivo que no es
+    audio o la falta de claves, no se reintenta.
+    """
+    return bool(getattr(error, 'retryable', False))
+
+
+class TranscriptionQueue:
+    """Spool en disco de dictados pendientes con workers de drenado.
+
+    Cuando una transcripción falla por la red o el proveedor (ver
+    is_retryable_error; p. ej. se cae la conexión), el audio se
+    copia al spool junto con sus metadatos y un worker en segundo plano lo
+    reintenta con backoff exponencial. El estado vive en SQLite, así que los
+    trabajos sobreviven a un reinicio: al arrancar, los que quedaron a medias
+    vuelven a la cola y los terminados pero no entregados se entregan de nuevo.
+
+    Estados: pending -> running -> done, o failed si se agotan los intentos
+    o el error deja de ser reintentable (su audio se borra). Al entregarlo
+    al informe el trabajo se elimina; los fallidos se purgan al arrancar
+    cuando superan TRANSCRIPTION_QUEUE_FAILED_RETENTION.
+    """
+    def __init__(self, transcription_service, spool_dir=TRANSCRIPTION_SPOOL_DIR,
+                 workers=TRANSCRIPTION_QUEUE_WORKERS, max_attempts=TRANSCRIPTION_QUEUE_MAX_ATTEMPTS):
+        self.transcription = transcription_service
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.on_complete = None  # callback(job, text)
+        self.on_failed = None  # callback(job, error)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+        os.makedirs(spool_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(spool_dir, 'jobs.sqlite3'), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                audio_path TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL
+            )""")
+        # Recuperación tras reinicio: lo que estaba en curso vuelve a la cola
+        self._conn.execute("UPDATE jobs SET status='pending' WHERE status='running'")
+        self._conn.commit()
+
+    def enqueue(self, audio_file, provider, metadata=None):
+        """Copia el audio al spool y crea un trabajo pendiente. Returns: job_id
+
+        El dictado acaba de fallar, así que el primer reintento se programa
+        tras el backoff inicial y no de inmediato.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (audio_path, provider, metadata, status, next_attempt_at, created_at) "
+                "VALUES ('', ?, ?, 'pending', ?, ?)",
+                (provider, json.dumps(metadata or {}), now + self._backoff(1), now))
+            job_id = cursor.lastrowid
+            spooled = os.path.join(self.spool_dir, f"job_{job_id}{os.path.splitext(audio_file)[1]}")
+            shutil.copy2(audio_file, spooled)
+            self._conn.execute("UPDATE jobs SET audio_path=? WHERE id=?", (spooled, job_id))
+            self._conn.commit()
+        print(f"Dictado encolado para transcripción diferida (trabajo {job_id})")
+        self._wake.set()
+        return job_id
+
+    def start(self):
+        """Purga los trabajos cerrados, arranca los workers y reentrega los
+        terminados no entregados"""
+        self._prune()
+        for job in self._jobs_with_status('done'):
+            self._notify_complete(job, job['result'])
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'spool-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')").fetchone()[0]
+
+    def mark_delivered(self, job_id):
+        """El trabajo ya está en el informe: lo elimina junto con su audio del spool"""
+        with self._lock:
+            row = self._conn.execute("SELECT audio_path FROM jobs WHERE id=?", (job_id,)).fetchone()
+            self._conn.execute("DELETE FROM jobs WHERE id=?", (job_id,))
+            self._conn.commit()
+        if row:
+            self._remove_audio(row['audio_path'])
+
+    def _prune(self):
+        """Borra los fallidos antiguos (y entregados de versiones anteriores)"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status='delivered' OR (status='failed' AND created_at < ?)",
+                (time.time() - TRANSCRIPTION_QUEUE_FAILED_RETENTION,))
+            self._conn.commit()
+        if cursor.rowcount:
+            print(f"Cola de dictados: {cursor.rowcount} trabajos antiguos purgados")
+
+    def _remove_audio(self, path):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _jobs_with_status(self, status):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs WHERE status=? ORDER BY id", (status,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def _row_to_job(self, row):
+        job = dict(row)
+        job['metadata'] = json.loads(job['metadata'])
+        return job
+
+    def _claim_next(self):
+        """Toma el siguiente trabajo vencido. Returns: (job, segundos hasta el próximo)"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE status='pending' ORDER BY next_attempt_at, id LIMIT 1").fetchone()
+            if row is None:
+                return None, None
+            if row['next_attempt_at'] > now:
+                return None, row['next_attempt_at'] - now
+            self._conn.execute("UPDATE jobs SET status='running' WHERE id=?", (row['id'],))
+            self._conn.commit()
+        return self._row_to_job(row), None
+
+    def _worker(self):
+        while not self._stop.is_set():
+            job, wait = self._claim_next()
+            if job is None:
+                self._wake.wait(timeout=min(wait, 30) if wait else 30)
+                self._wake.clear()
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job):
+        print(f"Reintentando trabajo {job['id']} (intento {job['attempts'] + 1})...")
+        try:
+            text, compressed_file, error = self.transcription.transcribe_audio(job['audio_path'],
+                                                                             provider=job['provider'])
+            if compressed_file != job['audio_path']:
+                self._remove_audio(compressed_file)  # la copia comprimida de este intento
+        except Exception as e:
+            text, error = None, ProviderError.from_exception(e)
+
+        attempts = job['attempts'] + 1
+        failed = not text and (attempts >= self.max_attempts or not is_retryable_error(error))
+        with self._lock:
+            if text:
+                self._conn.execute("UPDATE jobs SET status='done', result=?, error=NULL WHERE id=?",
+                                   (text, job['id']))
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status=?, attempts=?, next_attempt_at=?, error=? WHERE id=?",
+                    ('failed' if failed else 'pending', attempts, time.time() + self._backoff(attempts),
+                     error, job['id']))
+            self._conn.commit()
+
+        if text:
+            self._notify_complete(job, text)
+        elif failed:
+            print(f"Trabajo {job['id']} descartado tras {attempts} intentos: {error}")
+            self._remove_audio(job['audio_path'])
+            if self.on_failed:
+                self.on_failed(job, error)
+
+    def _backoff(self, attempts):
+        """Backoff exponencial con jitter, acotado a TRANSCRIPTION_QUEUE_BACKOFF_MAX"""
+        delay = min(TRANSCRIPTION_QUEUE_BACKOFF_MAX, TRANSCRIPTION_QUEUE_BACKOFF_BASE * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _notify_complete(self, job, text):
+        if self.on_complete:
+            self.on_complete(job, text)
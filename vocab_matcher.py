@@ -0,0 +1,205 @@
+# Módulo de corrección de vocabulario en una sola pasada (autómata trie)
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from config import VOCABULARY_ACCENT_INSENSITIVE
+
+# Posiciones de frontera de palabra (\b), candidatas a inicio de regla
+_BOUNDARY = re.compile(r'\b')
+# Marcas diacríticas sueltas (texto en forma descompuesta, NFD)
+_COMBINING = re.compile(r'[\u0300-\u036f]')
+
+
+def _is_word_char(char):
+    """Misma definición de carácter de palabra que \\w en `re` con str"""
+    return char.isalnum() or char == '_'
+
+
+def _fold_char(char, strip_accents):
+    """Clave de comparación de un carácter: minúscula y, opcionalmente, sin
+    tilde ni diéresis. Siempre un solo carácter, para que las posiciones del
+    texto normalizado coincidan con las del original. La ñ no se pliega a n
+    ("año" y "ano" son palabras distintas)."""
+    lowered = char.lower()
+    if len(lowered) != 1:
+        return char
+    if strip_accents and lowered != 'ñ':
+        base = unicodedata.normalize('NFD', lowered)[0]
+        if base != lowered and base.isalpha():
+            return base
+    return lowered
+
+
+class _FoldTable(dict):
+    """Tabla para str.translate que calcula y memoriza cada carácter al verlo"""
+    def __init__(self, strip_accents):
+        super().__init__()
+        self.strip_accents = strip_accents
+
+    def __missing__(self, code):
+        folded = _fold_char(chr(code), self.strip_accents)
+        self[code] = folded
+        return folded
+
+
+_FOLD_TABLES = {True: _FoldTable(True), False: _FoldTable(False)}
+
+
+def normalize_text(text, strip_accents=VOCABULARY_ACCENT_INSENSITIVE):
+    """Texto normalizado para comparar y mapa de posiciones al original.
+
+    Con caracteres precompuestos (lo habitual) la normalización es carácter a
+    carácter (str.translate) y el mapa es None: misma posición. Si el texto
+    trae las tildes como marcas combinadas sueltas (NFD), se eliminan (o se
+    funden en la ñ) y el mapa da, para cada posición normalizada, su
+    posición en el original.
+    Returns: (normalizado, mapa o None)
+    """
+    table = _FOLD_TABLES[strip_accents]
+    if not strip_accents or not _COMBINING.search(text):
+        return text.translate(table), None
+    chars, offsets = [], []
+    for index, char in enumerate(text):
+        if unicodedata.combining(char):
+            if char == '\u0303' and chars and chars[-1] == 'n':
+                chars[-1] = 'ñ'
+            continue
+        chars.append(table[ord(char)])
+        offsets.append(index)
+    offsets.append(len(text))
+    return ''.join(chars), offsets
+
+
+def normalize_key(key, strip_accents=VOCABULARY_ACCENT_INSENSITIVE):
+    """Clave de una regla tal como se busca en el texto normalizado"""
+    return unicodedata.normalize('NFC', key).translate(_FOLD_TABLES[strip_accents])
+
+
+class VocabularyMatcher:
+    """Autómata con todas las reglas del vocabulario.
+
+    Sustituye al bucle de una regex `\\b…\\b` IGNORECASE por regla: las
+    claves se insertan en un trie una sola vez y el texto se recorre en una
+    pasada. En cada frontera de palabra se busca la clave más larga que
+    empiece ahí y termine también en frontera de palabra; si la hay se
+    reemplaza y se salta al final de la coincidencia. El coste ya no crece
+    con el número de reglas, solo con la longitud del texto.
+
+    Claves y texto se comparan normalizados (minúsculas y, con
+    VOCABULARY_ACCENT_INSENSITIVE, sin tildes), de modo que una regla
+    "higado" cubre "hígado", "HIGADO" o "Hígado" y las reglas que solo se
+    diferencian en tildes o mayúsculas se funden en una. Si dos reglas
+    chocan gana la que coincide exactamente con lo dictado. Una palabra que
+    ya es la corrección salvo la mayúscula inicial (p. ej. a principio de
+    frase) se deja como está.
+
+    A diferencia de aplicar las reglas una tras otra, el resultado de una
+    corrección no vuelve a corregirse con otra regla.
+    """
+    _END = object()  # marca de fin de clave en el trie: {clave original en minúsculas: corrección}
+
+    def __init__(self, vocabulary, strip_accents=VOCABULARY_ACCENT_INSENSITIVE):
+        self.size = len(vocabulary)
+        self.strip_accents = strip_accents
+        self._root = {}
+        self.merged = 0  # reglas que comparten clave normalizada con otra
+        for key, value in vocabulary.items():
+            if not key:
+                continue
+            node = self._root
+            for char in normalize_key(key, strip_accents):
+                node = node.setdefault(char, {})
+            rules = node.setdefault(self._END, {})
+            if rules:
+                self.merged += 1
+            rules[key.lower()] = value
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def _is_boundary(text, pos):
+        """\\b en `pos` (pos > 0): cambia el tipo de carácter o termina una palabra"""
+        if pos == len(text):
+            return _is_word_char(text[pos - 1])
+        return _is_word_char(text[pos - 1]) != _is_word_char(text[pos])
+
+    def apply(self, text):
+        """Aplica todas las reglas. Returns: texto corregido"""
+        if not text or not self._root:
+            return text
+        normalized, offsets = normalize_text(text, self.strip_accents)
+        length = len(normalized)
+        parts = []
+        last = 0
+        for boundary in _BOUNDARY.finditer(normalized):
+            i = boundary.start()
+            if i < last:
+                continue
+            node = self._root
+            match_end, rules = -1, None
+            j = i
+            while j < length:
+                node = node.get(normalized[j])
+                if node is None:
+                    break
+                j += 1
+                if self._END in node and self._is_boundary(normalized, j):
+                    match_end, rules = j, node[self._END]
+            if match_end > 0:
+                start, end = (i, match_end) if offsets is None else (offsets[i], offsets[match_end])
+                original = text[start:end]
+                parts.append(text[offsets[last] if offsets else last:start])
+                parts.append(self._choose(rules, original))
+                last = match_end
+        if not parts:
+            return text
+        parts.append(text[offsets[last] if offsets else last:])
+        return ''.join(parts)
+
+    @staticmethod
+    def _choose(rules, original):
+        """Corrección para el texto encontrado (el propio texto si ya es correcto)"""
+        replacement = rules.get(original.lower())
+        if replacement is None:
+            replacement = next(iter(rules.values()))
+        if original[1:] == replacement[1:] and original[:1].isupper() and original[:1].lower() == replacement[:1]:
+            return original  # mayúscula de principio de frase
+        return replacement
+
+
+def vocabulary_cache_key(vocabulary):
+    """Clave de caché de un vocabulario: su `version` si viene de
+    VocabularyManager (VocabularySnapshot), sin recorrer las reglas; si es un
+    diccionario suelto, su contenido"""
+    version = getattr(vocabulary, 'version', None)
+    if version is not None:
+        return ('version', version)
+    return frozenset(vocabulary.items())
+
+
+_matchers = OrderedDict()  # versión del vocabulario -> VocabularyMatcher
+_matchers_lock = threading.Lock()
+_MAX_CACHED_MATCHERS = 4
+
+
+def get_vocabulary_matcher(vocabulary):
+    """Autómata para este vocabulario, compilado una vez por versión.
+
+    VocabularyManager entrega copias del diccionario con su número de
+    versión (ver vocabulary_cache_key), así que no hace falta recorrer las
+    reglas para saber si el autómata sigue valiendo.
+    """
+    fingerprint = vocabulary_cache_key(vocabulary)
+    with _matchers_lock:
+        matcher = _matchers.get(fingerprint)
+        if matcher is not None:
+            _matchers.move_to_end(fingerprint)
+            return matcher
+    matcher = VocabularyMatcher(vocabulary)
+    with _matchers_lock:
+        _matchers[fingerprint] = matcher
+        while len(_matchers) > _MAX_CACHED_MATCHERS:
+            _matchers.popitem(last=False)
+    return matcher
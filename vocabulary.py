@@ -1,12 +1,32 @@
 # Módulo de gestión de vocabulario
+import itertools
 import json
 import os
 from config import VOCABULARY_FILE
+from vocab_matcher import normalize_key
+
+_versions = itertools.count(1)  # únicas en todo el proceso, aunque haya varios gestores
+
+
+class VocabularySnapshot(dict):
+    """Reglas del vocabulario en un momento dado, con el número de versión
+    que las identifica.
+
+    Los índices construidos a partir del vocabulario (autómata de
+    correcciones, sugeridor de reglas, corrector) se cachean por `version`,
+    sin recorrer todas las reglas en cada dictado. No se modifica: los
+    cambios pasan por VocabularyManager, que sube la versión.
+    """
+    def __init__(self, rules, version):
+        super().__init__(rules)
+        self.version = version
+
 
 class VocabularyManager:
     def __init__(self):
         self.vocabulary = {}
         self.file_path = VOCABULARY_FILE
+        self._snapshot = None
         self.load_vocabulary()
     
     def load_vocabulary(self):
@@ -15,11 +35,21 @@ class VocabularyManager:
             try:
                 with open(self.file_path, 'r', encoding='utf-8') as f:
                     self.vocabulary = json.load(f)
+                redundant = self.redundant_rules()
+                if redundant:
+                    print(f"Vocabulario: {len(redundant)} reglas ya cubiertas por otra sin tildes/mayúsculas: "
+                          f"{', '.join(redundant)}")
             except Exception as e:
                 print(f"Error cargando vocabulario: {e}")
                 self.vocabulary = {}
         else:
             self.vocabulary = {}
+        self._changed()
+    
+    def _changed(self):
+        """Nueva versión del vocabulario: invalida los índices construidos con la anterior"""
+        self.version = next(_versions)
+        self._snapshot = None
     
     def save_vocabulary(self):
         """Guarda el vocabulario en el archivo JSON"""
@@ -34,21 +64,60 @@ class VocabularyManager:
     def add_rule(self, incorrect, correct):
         """Añade una nueva regla de corrección"""
         if incorrect and correct:
-            # Guardar en minúsculas como en la versión web
-            self.vocabulary[incorrect.lower()] = correct
+            if not self._store_rule(incorrect, correct):
+                return True
             return self.save_vocabulary()
         return False
     
+    def add_rules(self, rules):
+        """Añade varias reglas [(incorrecto, correcto)] guardando una sola vez.
+        Returns: número de reglas nuevas"""
+        added = sum(1 for incorrect, correct in rules if incorrect and correct and self._store_rule(incorrect, correct))
+        if added:
+            self.save_vocabulary()
+        return added
+    
+    def _store_rule(self, incorrect, correct):
+        """Guarda la regla en memoria. Returns: False si ya la cubría otra equivalente"""
+        # Una regla equivalente (solo cambian tildes o mayúsculas) ya la cubre
+        equivalent = self._equivalent_rule(incorrect)
+        if equivalent and self.vocabulary[equivalent] == correct:
+            return False
+        # Guardar en minúsculas como en la versión web
+        self.vocabulary[incorrect.lower()] = correct
+        self._changed()
+        return True
+    
     def remove_rule(self, incorrect):
         """Elimina una regla de corrección"""
         if incorrect.lower() in self.vocabulary:
             del self.vocabulary[incorrect.lower()]
+            self._changed()
             return self.save_vocabulary()
         return False
     
+    def _equivalent_rule(self, incorrect):
+        """Regla existente con la misma clave normalizada (sin tildes ni mayúsculas)"""
+        key = normalize_key(incorrect)
+        return next((k for k in self.vocabulary if normalize_key(k) == key), None)
+    
+    def redundant_rules(self):
+        """Reglas que sobran porque otra con la misma clave normalizada da la misma corrección"""
+        seen = {}
+        redundant = []
+        for incorrect, correct in self.vocabulary.items():
+            key = (normalize_key(incorrect), correct)
+            if key in seen:
+                redundant.append(incorrect)
+            else:
+                seen[key] = incorrect
+        return redundant
+    
     def get_vocabulary(self):
-        """Devuelve el vocabulario actual"""
-        return self.vocabulary.copy()
+        """Devuelve el vocabulario actual (VocabularySnapshot, una copia por versión)"""
+        if self._snapshot is None:
+            self._snapshot = VocabularySnapshot(self.vocabulary, self.version)
+        return self._snapshot
     
     def export_vocabulary(self, filepath):
         """Exporta el vocabulario a un archivo"""
@@ -67,6 +136,7 @@ class VocabularyManager:
                 imported = json.load(f)
                 # Fusionar con el vocabulario existente
                 self.vocabulary.update(imported)
+                self._changed()
                 return self.save_vocabulary()
         except Exception as e:
             print(f"Error importando vocabulario: {e}")
@@ -75,4 +145,5 @@ class VocabularyManager:
     def clear_vocabulary(self):
         """Limpia todo el vocabulario"""
         self.vocabulary = {}
+        self._changed()
         return self.save_vocabulary()